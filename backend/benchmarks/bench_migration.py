@@ -0,0 +1,195 @@
+"""
+End-to-end throughput benchmark for main.migrate, fully offline.
+
+Generates a synthetic Azure repository from the samples in
+test_migration_agent.py, zips it and migrates it with a deterministic stub
+model in place of Gemini (or, with --http, HTTPBackend talking to
+stub_llm_server.py over a keep-alive pool). Reports files/sec, p50/p99 per-file latency, peak
+RSS and bytes written. Exits non-zero below --min-files-per-sec, so it can
+gate performance changes.
+
+    python benchmarks/bench_migration.py [--files 200] [--file-kb 4]
+        [--azure-ratio 0.7] [--latency 0.05] [--workers 4] [--http]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.rewriter as rewriter
+import main as entry
+from core.backends import HTTPBackend
+from core.cache import RewriteCache
+from stub_llm_server import StubLLMServer, convert
+from test_migration_agent import SAMPLE_AZURE_FUNCTION, SAMPLE_TYPESCRIPT, SAMPLE_CSHARP
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (extension, Azure template, plain template, line comment)
+TEMPLATES = [
+    (".py", SAMPLE_AZURE_FUNCTION, "import json\n\ndef helper(x):\n    return json.dumps(x)\n", "#"),
+    (".ts", SAMPLE_TYPESCRIPT, "export function helper(x: number) {\n    return x * 2;\n}\n", "//"),
+    (".cs", SAMPLE_CSHARP, "public static class Helper\n{\n    public static int Twice(int x) => x * 2;\n}\n", "//"),
+]
+
+def make_repo(dest, files, file_kb, azure_ratio, seed=0):
+    """
+    Write `files` source files of about `file_kb` KB each under `dest`,
+    spread over a few packages. `azure_ratio` of them use Azure services;
+    languages are mixed evenly.
+    """
+    rng = random.Random(seed)
+    for i in range(files):
+        ext, azure, plain, comment = TEMPLATES[i % len(TEMPLATES)]
+        body = azure if rng.random() < azure_ratio else plain
+        filler = []
+        size = len(body)
+        while size < file_kb * 1024:
+            line = f"{comment} filler {i}-{len(filler)}: {rng.getrandbits(64):016x}\n"
+            filler.append(line)
+            size += len(line)
+        path = os.path.join(dest, f"pkg_{i % 16:02d}", f"module_{i:05d}{ext}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(body + "".join(filler))
+
+
+def make_zip(files, file_kb, azure_ratio, seed=0):
+    root = tempfile.mkdtemp()
+    repo = os.path.join(root, "repo")
+    make_repo(repo, files, file_kb, azure_ratio, seed)
+    path = os.path.join(root, "repo.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for base, _, names in os.walk(repo):
+            for name in names:
+                full = os.path.join(base, name)
+                z.write(full, os.path.relpath(full, repo))
+    return root, path
+
+
+class StubBackend:
+    """
+    Deterministic in-process backend. Sleeps `latency` seconds per request
+    plus `per_kb` per KB of input, then returns the input with Azure
+    references swapped out, keeping batch delimiters intact.
+    """
+
+    def __init__(self, latency=0.05, per_kb=0.0):
+        self.latency = latency
+        self.per_kb = per_kb
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, content):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency + self.per_kb * len(content) / 1024)
+        return convert(content)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run(files, file_kb, azure_ratio, latency, per_kb, workers, seed=0, http=False):
+    root, source = make_zip(files, file_kb, azure_ratio, seed)
+    if http:
+        stub = StubLLMServer(latency=latency).start()
+        rewriter.backend = HTTPBackend(stub.url, "stub")
+    else:
+        stub = StubBackend(latency, per_kb)
+        rewriter.backend = stub
+    rewriter.rewrite_cache = entry.rewrite_cache = RewriteCache("", 0, enabled=False)
+    entry.OUTPUT_DIR = os.path.join(root, "output")
+
+    events = []
+    start = time.perf_counter()
+    result = entry.migrate(source, workers=workers, progress=events.append, incremental=False)
+    elapsed = time.perf_counter() - start
+
+    workspace = result["workspace"]
+    finished = [e for e in events if e["type"] == "file"]
+    rewritten = [e["duration"] for e in finished if e["stage"] in ("validated", "failed")]
+    written = 0
+    for e in finished:
+        if e["stage"] in ("validated", "failed"):
+            path = os.path.join(workspace, e["file"])
+            written += os.path.getsize(path + ".azure.bak")
+            if e["stage"] == "validated":
+                written += os.path.getsize(path)
+
+    if http:
+        rewriter.backend.close()
+        stub.stop()
+    shutil.rmtree(workspace, ignore_errors=True)
+    shutil.rmtree(root, ignore_errors=True)
+    return {
+        "files": len(finished),
+        "rewritten": len(rewritten),
+        "failed": sum(e["stage"] == "failed" for e in finished),
+        "requests": stub.requests,
+        "connections": stub.connections if http else None,
+        "seconds": elapsed,
+        "files_per_sec": len(finished) / elapsed,
+        "p50": percentile(rewritten, 0.50),
+        "p99": percentile(rewritten, 0.99),
+        "peak_rss_mb": peak_rss_mb(),
+        "bytes_written": written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--file-kb", type=float, default=4)
+    parser.add_argument("--azure-ratio", type=float, default=0.7)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per request")
+    parser.add_argument("--per-kb", type=float, default=0.0, help="stub seconds per KB of input")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--http", action="store_true", help="go through HTTPBackend and a stub server")
+    parser.add_argument("--min-files-per-sec", type=float, default=0.0)
+    args = parser.parse_args()
+
+    r = run(args.files, args.file_kb, args.azure_ratio, args.latency, args.per_kb,
+            args.workers, args.seed, args.http)
+    rss = f"{r['peak_rss_mb']:.1f} MB" if r["peak_rss_mb"] is not None else "n/a"
+    print(f"files: {r['files']}  rewritten: {r['rewritten']}  failed: {r['failed']}  "
+          f"model requests: {r['requests']}")
+    if r["connections"] is not None:
+        print(f"HTTP connections opened: {r['connections']}")
+    print(f"wall time     : {r['seconds']:8.2f} s")
+    print(f"throughput    : {r['files_per_sec']:8.1f} files/s")
+    print(f"latency p50   : {r['p50'] * 1000:8.1f} ms")
+    print(f"latency p99   : {r['p99'] * 1000:8.1f} ms")
+    print(f"peak RSS      : {rss}")
+    print(f"bytes written : {r['bytes_written'] / 1024:8.1f} KB")
+    if r["files_per_sec"] < args.min_files_per_sec:
+        print(f"below the {args.min_files_per_sec} files/s gate")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for the workspace scan (core.pipeline.discover).
+
+Generates a synthetic monorepo with bench_migration.make_repo and times
+the serial scan against the concurrent one (thread-pool walk, process-pool
+read + detect), checking both find the same files and services. Also
+reports how soon the first task reaches the rewrite stage.
+
+    python benchmarks/bench_scan.py [--files 20000] [--file-kb 4] [--workers 8]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_migration import make_repo
+from core.pipeline import discover
+
+
+def scan(workspace, workers):
+    start = time.perf_counter()
+    first = None
+    found = {}
+    for task in discover(workspace, workers=workers):
+        if first is None:
+            first = time.perf_counter() - start
+        found[task.name] = task.services
+    return time.perf_counter() - start, first, found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--file-kb", type=float, default=4)
+    parser.add_argument("--azure-ratio", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        make_repo(root, args.files, args.file_kb, args.azure_ratio)
+        # Warm the page cache so both runs read from memory
+        scan(root, 1)
+
+        serial_time, serial_first, serial = scan(root, 1)
+        concurrent_time, concurrent_first, concurrent = scan(root, args.workers)
+        assert serial == concurrent, "scans disagree"
+
+        print(f"files: {len(serial)}  size: {args.file_kb:g} KB each  workers: {args.workers}")
+        print(f"serial     : {serial_time:7.2f} s  {len(serial) / serial_time:9.0f} files/s"
+              f"  first task after {serial_first * 1000:6.1f} ms")
+        print(f"concurrent : {concurrent_time:7.2f} s  {len(serial) / concurrent_time:9.0f} files/s"
+              f"  first task after {concurrent_first * 1000:6.1f} ms")
+        print(f"speedup    : {serial_time / concurrent_time:7.2f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Startup benchmark for the server.
+
+Runs `python -X importtime -c "import server"` in fresh interpreters and
+reports the wall time until the app can answer its health check, plus the
+slowest imports. Exits non-zero when readiness takes longer than --max.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--top 15] [--max 1.0]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READY = (
+    "from fastapi.testclient import TestClient\n"
+    "import server\n"
+    "assert TestClient(server.app).get('/').status_code == 200\n"
+)
+
+
+def time_to_ready():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", READY], cwd=BACKEND, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_times():
+    """(cumulative microseconds, module) for every module `import server` loads."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                          cwd=BACKEND, check=True, capture_output=True, text=True)
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative), name.strip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max", type=float, default=1.0, help="readiness budget in seconds")
+    args = parser.parse_args()
+
+    times = import_times()
+    loaded = {name for _, name in times}
+    total = next(us for us, name in times if name == "server")
+    print(f"import server: {total / 1000:.1f} ms, {len(loaded)} modules")
+    for us, name in sorted(times, reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    print(f"google.generativeai loaded at import: {'google.generativeai' in loaded}")
+
+    ready = min(time_to_ready() for _ in range(args.repeat))
+    print(f"health check ready: {ready * 1000:.0f} ms (best of {args.repeat}, budget {args.max * 1000:.0f} ms)")
+    if ready > args.max:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
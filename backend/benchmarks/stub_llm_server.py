@@ -0,0 +1,149 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions server.
+
+Answers POST /chat/completions after a fixed delay with the user message
+(the code) with its Azure references swapped out, so the output passes
+core.validator and batch delimiters survive. Speaks HTTP/1.1 keep-alive,
+so it can exercise HTTPBackend's connection pool at high concurrency, and
+streams the answer line by line as server-sent events when asked to.
+
+    python benchmarks/stub_llm_server.py [--port 8089] [--latency 0.05]
+
+then run the backend with LLM_BACKEND=http LLM_HTTP_URL=http://127.0.0.1:8089
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# What the stub "converts" so its output passes core.validator
+REPLACEMENTS = [
+    ("azure.functions", "functions_framework"),
+    ("@azure/", "@google-cloud/"),
+    ("Microsoft.Azure", "Google.Cloud"),
+]
+
+
+def convert(content):
+    for old, new in REPLACEMENTS:
+        content = content.replace(old, new)
+    return content
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _stream(self, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in text.splitlines(keepends=True):
+            delta = {"choices": [{"index": 0, "delta": {"content": line}}]}
+            self._chunk(f"data: {json.dumps(delta)}\n\n".encode("utf-8"))
+            if self.server.stream_delay:
+                time.sleep(self.server.stream_delay)
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            throttled = server.throttle_every and server.requests % server.throttle_every == 0
+        if self.path.rstrip("/") != "/chat/completions":
+            return self._reply(404, {"error": "not found"})
+        if throttled:
+            return self._reply(429, {"error": "rate limited"})
+
+        time.sleep(server.latency)
+        content = next(
+            (m["content"] for m in request.get("messages", []) if m["role"] == "user"), ""
+        )
+        if request.get("stream"):
+            return self._stream(convert(content))
+        self._reply(200, {
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": convert(content)},
+                "finish_reason": "stop",
+            }],
+        })
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    The stub server. `throttle_every` makes every n-th request fail with a
+    429; `stream_delay` is slept between streamed lines. `requests` and
+    `connections` count what it has seen.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, throttle_every=0, stream_delay=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a background thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, args.latency, args.throttle_every)
+    print(f"Stub LLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,124 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
+# Values are read from the environment when this module is first imported.
+# Entry points (server.py, main.py run as a script) load .env before that.
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MODEL_NAME = "gemini-2.5-flash-lite"
 
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables.")
+# Number of files sent to the model concurrently during migration
+REWRITE_WORKERS = int(os.getenv("REWRITE_WORKERS", "4"))
+
+# Workspaces (checked-out sources being migrated) live under WORKSPACE_DIR,
+# a directory of their own so leftovers can be found and collected later.
+# Idle ones are deleted after WORKSPACE_TTL_HOURS, and the least recently
+# used go first once they take more than WORKSPACE_QUOTA_MB together.
+# Downloads delete their workspace unless WORKSPACE_DELETE_ON_DOWNLOAD=0.
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "az2gcp", "workspaces"
+)
+WORKSPACE_TTL_HOURS = float(os.getenv("WORKSPACE_TTL_HOURS", "24"))
+WORKSPACE_QUOTA_MB = int(os.getenv("WORKSPACE_QUOTA_MB", "10240"))
+WORKSPACE_DELETE_ON_DOWNLOAD = os.getenv("WORKSPACE_DELETE_ON_DOWNLOAD", "1") != "0"
+# How often the server collects workspaces, and prunes Git mirrors and
+# manifests unused for MIRROR_TTL_DAYS / MANIFEST_TTL_DAYS and run reports
+# older than REPORT_TTL_DAYS
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "600"))
+MIRROR_TTL_DAYS = float(os.getenv("MIRROR_TTL_DAYS", "14"))
+MANIFEST_TTL_DAYS = float(os.getenv("MANIFEST_TTL_DAYS", "30"))
+REPORT_TTL_DAYS = float(os.getenv("REPORT_TTL_DAYS", "30"))
+
+# Workspace scan: with more than one worker, directories are listed on a
+# thread pool and files are read and searched in a process pool, feeding
+# the rewrite stage as they are found. 0 or 1 scans on the calling thread.
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "0"))
+
+# Number of migrations the server runs in the background at once
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Server: synchronous /migrate/* requests run on their own pool of
+# SYNC_MIGRATION_WORKERS threads and file I/O on IO_WORKERS threads, so the
+# event loop only ever waits on sockets. Uploads are parsed as they arrive,
+# written to disk UPLOAD_CHUNK_KB at a time and cut off above UPLOAD_MAX_MB.
+SYNC_MIGRATION_WORKERS = int(os.getenv("SYNC_MIGRATION_WORKERS", "4"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "200"))
+UPLOAD_CHUNK_KB = int(os.getenv("UPLOAD_CHUNK_KB", "1024"))
+
+# Files estimated above this many tokens are split into several requests
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "8000"))
+
+# Which model serves rewrites: "gemini" (MODEL_NAME through the Gemini API)
+# or "http" (any OpenAI-compatible chat completions endpoint at LLM_HTTP_URL,
+# e.g. a local inference server or stub). HTTP requests share a keep-alive
+# pool of LLM_HTTP_POOL_SIZE connections.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_HTTP_URL = os.getenv("LLM_HTTP_URL", "")
+LLM_HTTP_MODEL = os.getenv("LLM_HTTP_MODEL", MODEL_NAME)
+LLM_HTTP_API_KEY = os.getenv("LLM_HTTP_API_KEY", "")
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "16"))
+
+# Pacing of model requests shared by every migration in the process:
+# requests and tokens per minute (0 means no limit), the most requests in
+# flight at once, and how often throttled or 5xx requests are retried
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+# With include_suggestions, ask for the converted code and the suggestions
+# in one structured request instead of two
+COMBINED_SUGGESTIONS = os.getenv("COMBINED_SUGGESTIONS", "1") != "0"
+
+# Stream model answers straight into a temporary file next to each output
+# (renamed into place once validated) instead of holding them in memory
+STREAM_REWRITES = os.getenv("STREAM_REWRITES", "0") == "1"
+
+# Keep the static part of the prompts in the provider's context cache (for
+# backends that support it) and send only the per-file part with each
+# request. Cached copies are renewed after PROMPT_CONTEXT_CACHE_TTL seconds.
+PROMPT_CONTEXT_CACHE = os.getenv("PROMPT_CONTEXT_CACHE", "0") == "1"
+PROMPT_CONTEXT_CACHE_TTL = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL", "3600"))
+
+# File intake: files above INTAKE_MAX_FILE_MB are skipped unread; files of
+# at least INTAKE_MMAP_KB are searched for Azure services through a memory
+# map and only decoded when something is found. A line longer than
+# MINIFIED_LINE_CHARS near the top of a JS/TS/JSON file marks it as minified.
+INTAKE_MAX_FILE_MB = float(os.getenv("INTAKE_MAX_FILE_MB", "5"))
+INTAKE_MMAP_KB = int(os.getenv("INTAKE_MMAP_KB", "256"))
+MINIFIED_LINE_CHARS = int(os.getenv("MINIFIED_LINE_CHARS", "1000"))
+
+# Small files are packed into shared requests of up to this many tokens
+# (0 disables batching). Files above half the budget are always sent alone.
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "6000"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10"))
+
+# On-disk cache of model responses, keyed on file content, prompt and model
+REWRITE_CACHE_ENABLED = os.getenv("REWRITE_CACHE_ENABLED", "1") != "0"
+REWRITE_CACHE_DIR = os.getenv(
+    "REWRITE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "az2gcp", "rewrites")
+)
+REWRITE_CACHE_MAX_MB = int(os.getenv("REWRITE_CACHE_MAX_MB", "256"))
+
+# Re-runs of the same source reuse outputs of unchanged files, tracked by
+# a per-source manifest under MANIFEST_DIR
+INCREMENTAL_MIGRATION = os.getenv("INCREMENTAL_MIGRATION", "1") != "0"
+MANIFEST_DIR = os.getenv(
+    "MANIFEST_DIR", os.path.join(os.path.expanduser("~"), ".cache", "az2gcp", "manifests")
+)
+
+# Uncompressed size limits for uploaded ZIP archives. Members above the
+# per-file limit are skipped; archives above the total limit are rejected.
+ZIP_MAX_FILE_MB = int(os.getenv("ZIP_MAX_FILE_MB", "5"))
+ZIP_MAX_TOTAL_MB = int(os.getenv("ZIP_MAX_TOTAL_MB", "500"))
+
+# How Git sources are fetched: "mirror" (cached bare mirror + worktree),
+# "shallow" (depth-1 clone) or "full"
+GIT_CLONE_MODE = os.getenv("GIT_CLONE_MODE", "mirror")
+# Local repositories (file:// URLs or paths) may only be migrated when this is
+# set, e.g. from the CLI. Leave it off on servers.
+ALLOW_LOCAL_GIT = os.getenv("ALLOW_LOCAL_GIT", "0") == "1"
+GIT_MIRROR_DIR = os.getenv(
+    "GIT_MIRROR_DIR", os.path.join(os.path.expanduser("~"), ".cache", "az2gcp", "mirrors")
+)
@@ -0,0 +1,31 @@
+"""
+Keep test runs away from the real caches, the tracked output directory
+and the network.
+"""
+
+import pytest
+
+import core.manifest
+import core.rewriter
+import core.singleflight
+import core.source_loader
+import core.workspaces
+import main
+from config.settings import REWRITE_CACHE_MAX_MB
+from core.cache import RewriteCache
+
+
+@pytest.fixture(autouse=True)
+def isolated_dirs(tmp_path, monkeypatch):
+    cache = RewriteCache(str(tmp_path / "rewrites"), REWRITE_CACHE_MAX_MB * 1024 * 1024)
+    monkeypatch.setattr(core.rewriter, "rewrite_cache", cache)
+    monkeypatch.setattr(main, "rewrite_cache", cache)
+    monkeypatch.setattr(core.manifest, "MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(core.source_loader, "GIT_MIRROR_DIR", str(tmp_path / "mirrors"))
+    monkeypatch.setattr(main, "OUTPUT_DIR", str(tmp_path / "output"))
+    # Migration keys would otherwise ask remotes for their HEAD commit
+    monkeypatch.setattr(core.singleflight, "remote_head", lambda url: None)
+    # The manager is shared by reference, so it is emptied rather than replaced
+    monkeypatch.setattr(core.workspaces.workspaces, "root", str(tmp_path / "workspaces"))
+    monkeypatch.setattr(core.workspaces.workspaces, "_entries", {})
+    return tmp_path
@@ -0,0 +1,82 @@
+import io
+import os
+import zipfile
+
+# Bytes read from a file, and handed to the client, at a time
+ZIP_CHUNK_SIZE = 64 * 1024
+BACKUP_SUFFIX = ".azure.bak"
+
+
+class _Sink(io.RawIOBase):
+    """
+    Write-only, non-seekable stream that keeps what ZipFile writes until it
+    is drained. ZipFile then uses data descriptors instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def _is_temporary(name):
+    return name.endswith(".azure.tmp")
+
+
+def zip_members(workspace, diff_only=False):
+    """
+    (path, archive name) of every file to ship from a migrated workspace,
+    in a stable order. Git metadata and leftover temporary files are left
+    out. With `diff_only`, only rewritten files and their .azure.bak
+    originals are included.
+    """
+    for base, dirs, files in os.walk(workspace):
+        dirs[:] = sorted(d for d in dirs if d != ".git")
+        names = set(files)
+        for name in sorted(files):
+            if name == ".git" or _is_temporary(name):
+                continue
+            if diff_only:
+                original = name[:-len(BACKUP_SUFFIX)] if name.endswith(BACKUP_SUFFIX) else None
+                if original is None and name + BACKUP_SUFFIX not in names:
+                    continue
+                if original is not None and original not in names:
+                    continue
+            path = os.path.join(base, name)
+            yield path, os.path.relpath(path, workspace).replace(os.sep, "/")
+
+
+def stream_zip(workspace, diff_only=False, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Yield a ZIP archive of a migrated workspace as it is built, reading
+    each file from disk `chunk_size` bytes at a time. Memory use doesn't
+    grow with the size of the workspace or of any file in it.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path, arcname in zip_members(workspace, diff_only):
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as src, archive.open(info, "w") as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
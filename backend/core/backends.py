@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+
+
+class BackendError(Exception):
+    """A model request that failed with an HTTP status (retried by the limiter on 429/5xx)."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class LLMBackend:
+    """
+    Something that turns a prompt and a piece of code into the model's text
+    answer. core.rewriter only talks to models through this interface.
+    """
+
+    name = "base"
+
+    def generate(self, prompt, content, context=None):
+        """
+        `context` is a handle from cache_context(); when given, `prompt` is
+        only the part of the prompt that follows the cached text.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, content, context=None):
+        """Yield the answer in pieces as the model produces them."""
+        yield self.generate(prompt, content, context=context)
+
+    def cache_context(self, text, ttl):
+        """
+        Store `text` provider-side for `ttl` seconds and return a handle for
+        generate(), or None if the backend has no explicit context cache.
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through google.generativeai, imported on first request."""
+
+    name = "gemini"
+
+    def __init__(self, model_name, api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+                    if not api_key:
+                        # Entry points that didn't load .env themselves
+                        from dotenv import load_dotenv
+
+                        load_dotenv()
+                        api_key = os.getenv("GEMINI_API_KEY")
+                    if not api_key:
+                        print("Warning: GEMINI_API_KEY not found in environment variables.")
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def _model_for(self, context):
+        if context is None:
+            return self.model()
+        import google.generativeai as genai
+
+        return genai.GenerativeModel.from_cached_content(cached_content=context)
+
+    def generate(self, prompt, content, context=None):
+        return self._model_for(context).generate_content([prompt, content]).text
+
+    def stream(self, prompt, content, context=None):
+        for chunk in self._model_for(context).generate_content([prompt, content], stream=True):
+            yield chunk.text
+
+    def cache_context(self, text, ttl):
+        """
+        The text as the system instruction of a CachedContent. Gemini only
+        caches prompts above a minimum size, so this fails (and the rewriter
+        falls back to full prompts) for short instructions.
+        """
+        import datetime
+
+        from google.generativeai import caching
+
+        self.model()
+        return caching.CachedContent.create(
+            model=self.model_name, system_instruction=text, ttl=datetime.timedelta(seconds=ttl)
+        )
+
+
+class HTTPBackend(LLMBackend):
+    """
+    Any OpenAI-compatible chat completions endpoint (vLLM, Ollama, a local
+    stub, ...). The prompt goes in the system message and the code in the
+    user message. Requests share one keep-alive connection pool. There is
+    no explicit context cache; servers with automatic prefix caching reuse
+    the static prompt prefix on their own.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url, model_name, api_key=None, timeout=120.0,
+                 connect_timeout=5.0, pool_size=16):
+        import httpx
+
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.model_name = model_name
+        self.client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def _body(self, prompt, content, **extra):
+        return {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": content},
+            ],
+            **extra,
+        }
+
+    def generate(self, prompt, content, context=None):
+        response = self.client.post("/chat/completions", json=self._body(prompt, content))
+        if response.status_code != 200:
+            raise BackendError(response.status_code, response.text[:200])
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(self, prompt, content, context=None):
+        body = self._body(prompt, content, stream=True)
+        with self.client.stream("POST", "/chat/completions", json=body) as response:
+            if response.status_code != 200:
+                response.read()
+                raise BackendError(response.status_code, response.text[:200])
+            # Server-sent events, one JSON delta per "data:" line
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                piece = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if piece:
+                    yield piece
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend(kind, **options):
+    """Build the backend named by LLM_BACKEND ("gemini" or "http")."""
+    if kind == "gemini":
+        return GeminiBackend(options["model_name"], options.get("api_key"))
+    if kind == "http":
+        if not options.get("base_url"):
+            raise ValueError("LLM_HTTP_URL must be set to use the http backend")
+        return HTTPBackend(
+            options["base_url"], options["model_name"], options.get("api_key"),
+            options.get("timeout", 120.0), options.get("connect_timeout", 5.0),
+            options.get("pool_size", 16),
+        )
+    raise ValueError(f"Unknown LLM backend: {kind}")
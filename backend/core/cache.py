@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class RewriteCache:
+    """
+    Persistent, content-addressed cache for model responses.
+
+    Entries are stored one file per key under `directory` and evicted in
+    least-recently-used order once their total size exceeds `max_bytes`.
+    Recency survives restarts through the files' modification times. Several
+    processes may share a directory: entries written by others are picked up
+    on lookup, though each process only evicts what it has indexed.
+    """
+
+    def __init__(self, directory, max_bytes, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def key(model_name, prompt, content):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        raw = f"{model_name}\0{prompt_hash}\0{content_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load(self):
+        """Index entries already on disk, oldest first."""
+        if self._loaded:
+            return
+        self._loaded = True
+        found = []
+        if os.path.isdir(self.directory):
+            for base, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    try:
+                        st = os.stat(os.path.join(base, name))
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load()
+            path = self._path(key)
+            if key not in self._entries:
+                # Another process sharing the directory may have written it
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    self.misses += 1
+                    return None
+                self._entries[key] = size
+                self._size += size
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read()
+                os.utime(path)
+            except OSError:
+                self._size -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        data = value.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._load()
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._load()
+            while self._entries:
+                key, _ = self._entries.popitem()
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
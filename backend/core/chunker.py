@@ -1,4 +1,32 @@
-def chunk_code(content, max_chars=10000):
+import ast
+import os
+import re
+
+from config.settings import CHUNK_MAX_TOKENS
+
+# Rough average for source code; errs on the side of smaller chunks
+CHARS_PER_TOKEN = 3.5
+
+BRACE_LANGUAGES = {".js", ".jsx", ".ts", ".tsx", ".cs", ".java"}
+
+# Import-like lines that are deduplicated when chunk outputs are joined
+_IMPORT_LINE = re.compile(
+    r"^(import\s|from\s+\S+\s+import\s|using\s+[\w.]+\s*;|(const|let|var)\s+.*=\s*require\()"
+)
+
+# Lines that belong to a brace-language file header (imports, usings, ...)
+_HEADER_LINE = re.compile(
+    r"^\s*($|//|/\*|\*|import\b|using\b|package\b|namespace\s+[\w.]+\s*;|"
+    r"(const|let|var)\s+.*=\s*require\(|['\"]use strict['\"])"
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate, good enough for budgeting requests."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def chunk_lines(content, max_chars=10000):
     """
     Splits content into chunks of approximately max_chars.
     Respects line boundaries.
@@ -7,16 +35,294 @@ def chunk_code(content, max_chars=10000):
     lines = content.splitlines(keepends=True)
     current_chunk = []
     current_length = 0
-    
+
     for line in lines:
-        if current_length + len(line) > max_chars:
+        if current_chunk and current_length + len(line) > max_chars:
             chunks.append("".join(current_chunk))
             current_chunk = []
             current_length = 0
         current_chunk.append(line)
         current_length += len(line)
-        
+
     if current_chunk:
         chunks.append("".join(current_chunk))
-        
+
     return chunks
+
+
+def split_definitions(filename, content):
+    """
+    Split a file into (preamble, units).
+
+    The preamble is the file header (imports and, for Python, everything
+    before the first top-level def/class). Each unit is one top-level
+    definition with its decorators and leading comments, so functions are
+    never cut in half. Returns (content, []) when the file can't be split.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".py":
+        return _split_python(content)
+    if ext in BRACE_LANGUAGES:
+        return _split_braces(content)
+    return content, []
+
+
+def _split_python(content):
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return content, []
+
+    lines = content.splitlines(keepends=True)
+    starts = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+            # Pull comments directly above the definition into the same unit
+            while first > 0 and lines[first - 1].lstrip().startswith("#"):
+                first -= 1
+            starts.append(first)
+
+    if not starts:
+        return content, []
+
+    preamble = "".join(lines[:starts[0]])
+    bounds = starts + [len(lines)]
+    units = ["".join(lines[a:b]) for a, b in zip(bounds, bounds[1:])]
+    return preamble, units
+
+
+def _split_braces(content):
+    lines = content.splitlines(keepends=True)
+
+    header_end = 0
+    while header_end < len(lines) and _HEADER_LINE.match(lines[header_end]):
+        header_end += 1
+    # Don't swallow the leading comment of the first definition
+    while header_end > 0 and lines[header_end - 1].lstrip().startswith(("//", "/*", "*")):
+        header_end -= 1
+
+    preamble = "".join(lines[:header_end])
+    units = _scan_blocks(lines[header_end:])
+
+    if len(units) <= 1 and not preamble:
+        return content, []
+    return preamble, units
+
+
+def _scan_blocks(lines):
+    """Group lines into units that each end where brace depth returns to zero."""
+    units = []
+    current = []
+    depth = 0
+    opened = False
+    state = None  # None, "block_comment" or the open quote character
+
+    for line in lines:
+        current.append(line)
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            nxt = line[i + 1] if i + 1 < len(line) else ""
+            if state == "block_comment":
+                if ch == "*" and nxt == "/":
+                    state = None
+                    i += 1
+            elif state in ("'", '"', "`"):
+                if ch == "\\":
+                    i += 1
+                elif ch == state:
+                    state = None
+            elif ch == "/" and nxt == "/":
+                break
+            elif ch == "/" and nxt == "*":
+                state = "block_comment"
+                i += 1
+            elif ch in ("'", '"', "`"):
+                state = ch
+            elif ch == "{":
+                depth += 1
+                opened = True
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            i += 1
+        # Plain quotes don't span lines; template literals do
+        if state in ("'", '"'):
+            state = None
+
+        if depth == 0 and opened:
+            units.append("".join(current))
+            current = []
+            opened = False
+
+    if current:
+        if units and not "".join(current).strip():
+            units[-1] += "".join(current)
+        else:
+            units.append("".join(current))
+    return units
+
+
+def split_members(filename, unit):
+    """
+    Split one definition into (header, members) so a class (or a C#/Java
+    namespace) that is too big for one request can be sent method by method.
+
+    The header is everything up to the first member: the class line,
+    docstring and fields for Python; the declaration up to its opening brace
+    for brace languages. Closing braces stay with the last member. Returns
+    None when the unit has no members to split on.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    lines = unit.splitlines(keepends=True)
+
+    if ext == ".py":
+        try:
+            tree = ast.parse(unit)
+        except (SyntaxError, ValueError):
+            return None
+        classes = [n for n in tree.body if isinstance(n, ast.ClassDef)]
+        if len(classes) != 1:
+            return None
+        starts = []
+        for node in classes[0].body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                first = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+                while first > 0 and lines[first - 1].lstrip().startswith("#"):
+                    first -= 1
+                starts.append(first)
+        if not starts:
+            return None
+        bounds = starts + [len(lines)]
+        members = ["".join(lines[a:b]) for a, b in zip(bounds, bounds[1:])]
+        return "".join(lines[:starts[0]]), members
+
+    if ext in BRACE_LANGUAGES:
+        open_line = next((i for i, l in enumerate(lines) if l.rstrip().endswith("{")), None)
+        close_line = next(
+            (i for i in range(len(lines) - 1, -1, -1) if lines[i].strip() in ("}", "};")), None
+        )
+        if open_line is None or close_line is None or close_line <= open_line + 1:
+            return None
+        members = _scan_blocks(lines[open_line + 1:close_line])
+        if not members:
+            return None
+        members[-1] += "".join(lines[close_line:])
+        return "".join(lines[:open_line + 1]), members
+
+    return None
+
+
+def _pieces(filename, unit, context, budget):
+    """
+    Break a unit into (context, text) pieces that fit the budget, descending
+    into classes/namespaces before falling back to splitting on lines.
+    `context` holds the headers of the enclosing definitions.
+    """
+    if estimate_tokens(context + unit) <= budget:
+        return [(context, unit)]
+
+    inner = split_members(filename, unit)
+    if inner is not None:
+        header, members = inner
+        nested = context + header
+        # Keep room for real code even when the headers are huge
+        if estimate_tokens(nested) > budget // 2:
+            nested = ""
+        pieces = []
+        for member in members:
+            pieces.extend(_pieces(filename, member, nested, budget))
+        return pieces
+
+    max_chars = int((budget - estimate_tokens(context)) * CHARS_PER_TOKEN)
+    return [(context, piece) for piece in chunk_lines(unit, max_chars)]
+
+
+def chunk_code(content, max_tokens=CHUNK_MAX_TOKENS, filename=""):
+    """
+    Split content into chunks of at most ~max_tokens estimated tokens.
+
+    Chunks are cut between top-level definitions where the language allows
+    it, and every chunk starts with the file's preamble so the model sees
+    the imports each piece depends on. A definition that is too big on its
+    own is split between its members (methods of a class, classes of a
+    namespace), with its header repeated in each chunk. Only code with no
+    members to split on falls back to line-based splitting.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+
+    preamble, units = split_definitions(filename, content)
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if not units:
+        return chunk_lines(content, max_chars)
+
+    # Keep room for real code even when the header is huge
+    if estimate_tokens(preamble) > max_tokens // 2:
+        units = [preamble] + units
+        preamble = ""
+    budget = max_tokens - estimate_tokens(preamble)
+
+    pieces = []
+    for unit in units:
+        pieces.extend(_pieces(filename, unit, "", budget))
+
+    chunks = []
+    current = ""
+    current_context = None
+    for context, text in pieces:
+        addition = text if context == current_context else context + text
+        if current and estimate_tokens(current + addition) > budget:
+            chunks.append(current)
+            current = ""
+            addition = context + text
+        current += addition
+        current_context = context
+    if current:
+        chunks.append(current)
+
+    return [preamble + c for c in chunks]
+
+
+def merge_chunk_outputs(parts):
+    """
+    Join the model's output for each chunk of a file. Every chunk carried the
+    same preamble, so import lines already emitted by an earlier part are
+    dropped from later ones.
+    """
+    return "".join(merge_chunk_stream([part] for part in parts))
+
+
+def merge_chunk_stream(parts):
+    """
+    merge_chunk_outputs() for streamed output: `parts` yields one iterable of
+    text pieces per chunk, and merged text is yielded a line at a time as
+    soon as each line is complete.
+    """
+    seen = set()
+    first = True
+
+    def keep(line):
+        if _IMPORT_LINE.match(line):
+            key = line.strip()
+            if key in seen:
+                return False
+            seen.add(key)
+        return True
+
+    for pieces in parts:
+        pending = ""
+        for piece in pieces:
+            lines = (pending + piece).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                line = line.rstrip("\r")
+                if keep(line):
+                    yield line if first else "\n" + line
+                    first = False
+        lines = [pending.rstrip("\r")] if pending else []
+        # Parts are separated by a blank line
+        for line in lines + [""]:
+            if keep(line):
+                yield line if first else "\n" + line
+                first = False
@@ -1,10 +1,142 @@
+import mmap
+import os
+import re
+
 from config.service_map import SERVICE_MAP
 
-def detect_azure_services(content):
-    detected = []
-    for service, meta in SERVICE_MAP.items():
-        for p in meta["patterns"]:
-            if p in content:
-                detected.append(service)
+# Below this many patterns one substring search per pattern is faster than
+# the single-pass regex, whose per-character cost doesn't pay off yet (see
+# benchmarks/bench_detector.py)
+SINGLE_PASS_MIN_PATTERNS = 100
+
+
+def _trie_regex(patterns):
+    """
+    Build a regex that matches any of `patterns`, factored into a trie so the
+    regex engine branches once per character instead of once per pattern.
+    Terminal nodes with children match greedily, so the longest pattern
+    starting at a position wins.
+    """
+    trie = {}
+    for p in patterns:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node):
+        terminal = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            # `body` is non-empty here, so wrapping it keeps `?` applied to the whole branch
+            return "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+
+class ServiceMatcher:
+    """
+    Matches every pattern of a service map in a single pass over the input.
+
+    The pattern set is compiled once; scanning a file costs one regex search
+    per match rather than one substring search per pattern. detect() only
+    uses it for maps of at least SINGLE_PASS_MIN_PATTERNS patterns (or when
+    `single_pass` says so) and otherwise searches for each pattern in turn.
+    """
+
+    def __init__(self, service_map, single_pass=None):
+        self.services = list(service_map)
+        self._owners = {}
+        for service, meta in service_map.items():
+            for p in meta["patterns"]:
+                if p and service not in self._owners.setdefault(p, []):
+                    self._owners[p].append(service)
+        if single_pass is None:
+            single_pass = len(self._owners) >= SINGLE_PASS_MIN_PATTERNS
+        self.single_pass = single_pass
+        # (service, patterns, patterns as UTF-8) for the per-pattern search
+        self._searches = [
+            (service, [p for p in meta["patterns"] if p], [p.encode("utf-8") for p in meta["patterns"] if p])
+            for service, meta in service_map.items()
+        ]
+
+        # For each pattern, every pattern that is a prefix of it (itself
+        # included), so a longest match also reports the shorter ones.
+        patterns = sorted(self._owners)
+        self._prefixes = {
+            p: [q for q in patterns if p.startswith(q)] for p in patterns
+        }
+        self._regex = re.compile(_trie_regex(patterns)) if patterns else None
+        # The same automaton over UTF-8 bytes, for memory-mapped files
+        self._bytes_regex = re.compile(_trie_regex(patterns).encode("utf-8")) if patterns else None
+
+    def finditer(self, content):
+        """
+        Yield (offset, pattern) for every occurrence, overlaps included.
+        `content` may also be bytes-like (an mmap), with offsets in bytes.
+        """
+        if self._regex is None:
+            return
+        is_text = isinstance(content, str)
+        search = (self._regex if is_text else self._bytes_regex).search
+        pos = 0
+        while True:
+            m = search(content, pos)
+            if m is None:
+                return
+            start = m.start()
+            found = m.group() if is_text else m.group().decode("utf-8")
+            for p in self._prefixes[found]:
+                yield start, p
+            pos = start + 1
+
+    def scan(self, content):
+        """Return {service: [(offset, pattern), ...]} for every matching service."""
+        matches = {}
+        for offset, p in self.finditer(content):
+            for service in self._owners[p]:
+                matches.setdefault(service, []).append((offset, p))
+        return {s: matches[s] for s in self.services if s in matches}
+
+    def detect(self, content):
+        """Return matching services in service map order, stopping early once all are found."""
+        if not self.single_pass:
+            is_text = isinstance(content, str)
+            return [
+                service for service, patterns, encoded in self._searches
+                if any(content.find(p) != -1 for p in (patterns if is_text else encoded))
+            ]
+        found = set()
+        for _, p in self.finditer(content):
+            found.update(self._owners[p])
+            if len(found) == len(self.services):
                 break
-    return detected
+        return [s for s in self.services if s in found]
+
+
+_matcher = ServiceMatcher(SERVICE_MAP)
+
+
+def detect_azure_services(content):
+    return _matcher.detect(content)
+
+
+def detect_azure_services_in_file(path):
+    """
+    detect_azure_services over a memory-mapped view of the file, so large
+    files are searched without being read into memory or decoded.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            return _matcher.detect(view)
+
+
+def scan_azure_services(content):
+    """Like detect_azure_services, but also returns the offset of every match."""
+    return _matcher.scan(content)
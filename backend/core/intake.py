@@ -0,0 +1,134 @@
+import codecs
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from config.settings import INTAKE_MAX_FILE_MB, INTAKE_MMAP_KB, MINIFIED_LINE_CHARS
+from core.detector import detect_azure_services, detect_azure_services_in_file
+from core.metrics import STAGE_SECONDS, BYTES_READ
+
+# How much of a file is looked at to classify it
+SNIFF_BYTES = 8192
+# Generated-code markers only count near the top of a file
+GENERATED_MARKER_BYTES = 1024
+
+GENERATED_MARKERS = re.compile(
+    rb"@generated|<auto-generated|auto-generated|autogenerated|DO NOT EDIT|Code generated by",
+    re.IGNORECASE,
+)
+# Lockfiles and build outputs that match TEXT_EXTENSIONS but are never hand-written
+GENERATED_NAMES = {
+    "package-lock.json", "npm-shrinkwrap.json", "composer.lock", "pnpm-lock.yaml",
+    "yarn.lock", "Pipfile.lock", "poetry.lock", "packages.lock.json",
+}
+GENERATED_SUFFIXES = (
+    ".min.js", ".bundle.js", ".min.json", ".designer.cs", ".g.cs", ".g.i.cs",
+    "_pb2.py", "_pb2_grpc.py", ".generated.ts",
+)
+MINIFIABLE_EXTENSIONS = {".js", ".jsx", ".ts", ".tsx", ".json"}
+
+SKIP_LARGE = "Skipped (larger than {mb:g} MB)"
+SKIP_BINARY = "Skipped (binary file)"
+SKIP_MINIFIED = "Skipped (minified file)"
+SKIP_GENERATED = "Skipped (generated file)"
+NO_AZURE = "No Azure dependency"
+
+
+@dataclass
+class Intake:
+    """
+    What discovery learnt about a file. `content` is only decoded for files
+    that may be sent to the model; `skip` is the final status of the others.
+    `services` is None when detection is still to be run on `content`.
+    """
+    size: int
+    content: str = None
+    services: list = None
+    skip: str = ""
+
+
+def _is_binary(head):
+    if b"\0" in head:
+        return True
+    try:
+        # Incremental, so a character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def classify(name, head):
+    """
+    Why a file shouldn't be rewritten, judging by its name and first bytes:
+    SKIP_BINARY, SKIP_MINIFIED, SKIP_GENERATED, or "" if it should be.
+    """
+    base = os.path.basename(name)
+    if _is_binary(head):
+        return SKIP_BINARY
+    if base in GENERATED_NAMES or base.lower().endswith(GENERATED_SUFFIXES):
+        return SKIP_GENERATED
+    if GENERATED_MARKERS.search(head, 0, GENERATED_MARKER_BYTES):
+        return SKIP_GENERATED
+    ext = os.path.splitext(base)[1].lower()
+    if ext in MINIFIABLE_EXTENSIONS:
+        if any(len(line) > MINIFIED_LINE_CHARS for line in head.split(b"\n")):
+            return SKIP_MINIFIED
+    return ""
+
+
+def take_in(path, name):
+    """
+    Classify and, if worth it, read a file.
+
+    Files above INTAKE_MAX_FILE_MB are not opened. Binary files are skipped.
+    Minified and generated files, and anything of INTAKE_MMAP_KB or more,
+    are searched for Azure services through a memory map; the latter are
+    only decoded if something is found. Minified and generated files keep
+    their detected services for the report but are never rewritten.
+    """
+    size = os.path.getsize(path)
+    if size > INTAKE_MAX_FILE_MB * 1024 * 1024:
+        return Intake(size, skip=SKIP_LARGE.format(mb=INTAKE_MAX_FILE_MB))
+
+    with STAGE_SECONDS.time(stage="read"), open(path, "rb") as f:
+        data = f.read(SNIFF_BYTES if size >= INTAKE_MMAP_KB * 1024 else -1)
+    BYTES_READ.inc(len(data))
+    skip = classify(name, data[:SNIFF_BYTES])
+    if skip == SKIP_BINARY:
+        return Intake(size, skip=skip)
+
+    if len(data) < size:
+        # Only the head was read
+        with STAGE_SECONDS.time(stage="detect"):
+            services = detect_azure_services_in_file(path)
+        if skip or not services:
+            return Intake(size, services=services, skip=skip or NO_AZURE)
+        with STAGE_SECONDS.time(stage="read"), open(path, "rb") as f:
+            data = f.read()
+        BYTES_READ.inc(len(data))
+        return Intake(size, data.decode("utf-8"), services)
+    if skip:
+        with STAGE_SECONDS.time(stage="detect"):
+            return Intake(size, services=detect_azure_services(data), skip=skip)
+    return Intake(size, data.decode("utf-8"))
+
+
+def take_in_many(files):
+    """
+    take_in() for a list of (path, name) pairs, with detection done as
+    well. Runs in scan worker processes, so it returns results instead of
+    recording metrics: a list of (Intake or None if unreadable, seconds).
+    """
+    results = []
+    for path, name in files:
+        started = time.perf_counter()
+        try:
+            intake = take_in(path, name)
+            if intake.content is not None and intake.services is None:
+                intake.services = detect_azure_services(intake.content)
+        except Exception:
+            intake = None
+        results.append((intake, time.perf_counter() - started))
+    return results
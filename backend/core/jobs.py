@@ -0,0 +1,172 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class MigrationJob:
+    """State of one background migration, updated from the worker thread."""
+
+    def __init__(self, source, include_suggestions=False):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.include_suggestions = include_suggestions
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.workspace = None
+        self.files_total = None
+        self.files = []
+        self.result = None
+        self.error = None
+        # Submissions answered by this job, counting the first
+        self.requests = 1
+        self.events = []
+        # Characters streamed so far for files still being rewritten. Chunk
+        # events only update this, so history doesn't grow with output size
+        self.streaming = {}
+        self._lock = threading.Lock()
+
+    def on_progress(self, event):
+        with self._lock:
+            if event["type"] == "chunk":
+                self.streaming[event["file"]] = event["chars"]
+                return
+            self.events.append(event)
+            if event["type"] == "workspace":
+                self.workspace = event["workspace"]
+            elif event["type"] == "file":
+                self.streaming.pop(event["file"], None)
+                self.files.append({"file": event["file"], "status": event["status"]})
+            elif event["type"] == "scan_complete":
+                self.files_total = event["total"]
+
+    def events_since(self, index):
+        """Return progress events recorded after the first `index` ones."""
+        with self._lock:
+            return self.events[index:]
+
+    def streamed(self):
+        """{file: characters streamed so far} for files still being rewritten."""
+        with self._lock:
+            return dict(self.streaming)
+
+    @property
+    def finished(self):
+        return self.status in (COMPLETED, FAILED)
+
+    def snapshot(self):
+        """JSON-serialisable view of the job, safe to call from any thread."""
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "source": self.source,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "workspace": self.workspace,
+                "progress": {
+                    "files_done": len(self.files),
+                    "files_total": self.files_total,
+                    "files": list(self.files),
+                    "streaming": dict(self.streaming),
+                },
+                "error": self.error,
+                "requests": self.requests,
+            }
+
+
+class JobManager:
+    """
+    Runs migrations on a bounded pool of background threads.
+
+    Finished jobs are kept in memory so clients can poll for their result;
+    only the most recent `history` finished jobs are retained.
+    """
+
+    def __init__(self, run, max_workers=2, history=1000):
+        self._run = run
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._history = history
+        # Unfinished jobs by dedup key (see submit)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, source, include_suggestions=False, cleanup=None, key=None):
+        """
+        Queue a migration and return its job immediately.
+        `cleanup` is called once the job has finished, successfully or not.
+
+        If a job submitted with the same `key` is still queued or running,
+        no new job is created: that job is returned instead, `cleanup` runs
+        straight away and the job's `requests` count goes up.
+        """
+        with self._lock:
+            job = self._active.get(key) if key is not None else None
+            if job is not None:
+                job.requests += 1
+            else:
+                job = MigrationJob(source, include_suggestions)
+                self._jobs[job.id] = job
+                if key is not None:
+                    self._active[key] = job
+                self._prune()
+                self._pool.submit(self._execute, job, cleanup, key)
+                return job
+        if cleanup is not None:
+            cleanup()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _execute(self, job, cleanup, key=None):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = self._run(
+                job.source,
+                include_suggestions=job.include_suggestions,
+                progress=job.on_progress,
+            )
+            # The "done" event is recorded before the status flips, so anyone
+            # who sees a finished job is guaranteed to find it in `events`
+            job.on_progress({"type": "done", "status": COMPLETED, **job.result})
+            self._finish(job, COMPLETED, key)
+        except Exception as e:
+            job.error = str(e)
+            job.on_progress({"type": "done", "status": FAILED, "error": job.error})
+            self._finish(job, FAILED, key)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def _finish(self, job, status, key):
+        # Duplicates of a finished job start a new one from here on
+        with self._lock:
+            if key is not None and self._active.get(key) is job:
+                del self._active[key]
+        job.finished_at = time.time()
+        job.status = status
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.finished]
+        for job in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[job.id]
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
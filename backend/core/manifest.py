@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from git import Repo
+
+from config.settings import MANIFEST_DIR
+from core.prompts import prompt_fingerprint
+from core.rewriter import MODEL_ID
+
+MANIFEST_VERSION = 1
+
+# One lock per manifest directory, so runs of the same source in this
+# process don't collect each other's objects while saving
+_dir_locks = {}
+_dir_locks_guard = threading.Lock()
+
+
+def _dir_lock(directory):
+    with _dir_locks_guard:
+        return _dir_locks.setdefault(directory, threading.Lock())
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """
+    Record of a previous migration of the same source, used to skip files
+    that haven't changed since.
+
+    For every file the manifest stores its content hash, detected services,
+    status and the hash of the output that was written. Outputs themselves
+    are kept content-addressed next to the manifest, so a later run can
+    restore them without calling the model.
+    """
+
+    def __init__(self, key, include_suggestions=False, directory=None):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(directory or MANIFEST_DIR, digest)
+        self.key = key
+        self.options = {
+            "model": MODEL_ID,
+            "include_suggestions": include_suggestions,
+            "prompts": prompt_fingerprint(),
+        }
+        self.previous = {}
+        self.previous_commit = None
+        self.entries = {}
+        self.commit = None
+        self._load()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest)
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        data = self._read()
+        # Outputs produced with another model or other options can't be reused
+        if data.get("version") != MANIFEST_VERSION or data.get("options") != self.options:
+            return
+        self.previous = data.get("files", {})
+        self.previous_commit = data.get("commit")
+
+    def reusable(self, name, digest=None):
+        """
+        Return the previous entry for `name` if its result can be reused.
+        `digest` is the file's current content hash; None means the caller
+        already knows the file is unchanged.
+        """
+        entry = self.previous.get(name)
+        if entry is None or (digest is not None and entry["hash"] != digest):
+            return None
+        if entry["status"].startswith("Converted"):
+            if not entry.get("output") or not os.path.exists(self._object_path(entry["output"])):
+                return None
+            return entry
+        if entry["status"] == "No Azure dependency":
+            return entry
+        # Failed files are always retried
+        return None
+
+    def output(self, entry):
+        with open(self._object_path(entry["output"]), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def unchanged_files(self, workspace, commit):
+        """
+        Names of previously migrated files untouched between the previous
+        commit and `commit`, taken from `git diff` so they don't need to be
+        read at all. Returns an empty set when that isn't possible (ZIP
+        sources, first run, or history not available in a shallow clone).
+        """
+        self.commit = commit
+        if not commit or not self.previous_commit or not self.previous:
+            return set()
+        if commit == self.previous_commit:
+            return set(self.previous)
+        try:
+            changed = Repo(workspace).git.diff(
+                "--name-only", "--no-renames", self.previous_commit, commit
+            ).splitlines()
+        except Exception as e:
+            print(f"Could not diff {self.previous_commit[:8]}..{commit[:8]}: {e}")
+            return set()
+        changed = {os.path.normpath(p) for p in changed}
+        return {name for name in self.previous if os.path.normpath(name) not in changed}
+
+    def record(self, name, digest, services, status, output=None, output_path=None):
+        """
+        Record a file's result. The output is passed as text, or for
+        streamed rewrites as `output_path`, which is copied without being
+        read into memory.
+        """
+        entry = {"hash": digest, "services": list(services), "status": status, "output": None}
+        if output is not None:
+            entry["output"] = hashlib.sha256(output.encode("utf-8")).hexdigest()
+            path = self._object_path(entry["output"])
+            if not os.path.exists(path):
+                _atomic_write(path, output)
+        elif output_path is not None:
+            entry["output"] = file_hash(output_path)
+            path = self._object_path(entry["output"])
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                os.close(fd)
+                shutil.copyfile(output_path, tmp)
+                os.replace(tmp, path)
+        self.entries[name] = entry
+
+    def carry_over(self, name, entry):
+        """Keep a previous entry (and its stored output) for a reused file."""
+        self.entries[name] = dict(entry)
+
+    def save(self):
+        """
+        Write the manifest for this run and drop outputs nothing refers to any
+        more. Outputs of the manifest being replaced, and of the one this run
+        started from, are kept for one more run: a concurrent run of the same
+        source may still be restoring them.
+        """
+        data = {
+            "version": MANIFEST_VERSION,
+            "source": self.key,
+            "commit": self.commit,
+            "options": self.options,
+            "files": self.entries,
+        }
+        with _dir_lock(self.directory):
+            replaced = self._read().get("files", {})
+            _atomic_write(self.path, json.dumps(data, indent=1, sort_keys=True))
+
+            referenced = set()
+            for files in (self.entries, self.previous, replaced):
+                referenced.update(e.get("output") for e in files.values())
+            objects = os.path.join(self.directory, "objects")
+            if os.path.isdir(objects):
+                for name in os.listdir(objects):
+                    if name not in referenced and not name.endswith(".tmp"):
+                        try:
+                            os.remove(os.path.join(objects, name))
+                        except OSError:
+                            pass
+
+
+def prune_manifests(max_age, directory=None, now=None):
+    """
+    Delete manifests (and their stored outputs) not saved for `max_age`
+    seconds. Returns the number removed.
+    """
+    directory = directory or MANIFEST_DIR
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        with _dir_lock(path):
+            manifest = os.path.join(path, "manifest.json")
+            try:
+                last_saved = os.path.getmtime(manifest if os.path.exists(manifest) else path)
+            except OSError:
+                continue
+            if now - last_saved > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def file_hash(path):
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def manifest_key(source):
+    """
+    Identify a source across runs: the repository URL, or the file name of
+    a ZIP archive, so a re-uploaded archive with some files changed still
+    reuses the results for the others (file hashes decide what is reused).
+    """
+    if source.endswith(".zip"):
+        return "zip:" + os.path.basename(source)
+    source = source.rstrip("/")
+    if source.endswith(".git"):
+        source = source[:-4]
+    # Scheme and host are case-insensitive; the path may not be
+    scheme, sep, rest = source.partition("://")
+    if sep:
+        host, slash, path = rest.partition("/")
+        source = f"{scheme.lower()}://{host.lower()}{slash}{path}"
+    return "git:" + source
@@ -0,0 +1,197 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cached lookup up to a slow multi-chunk model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        if not self.labels and self.kind != "histogram":
+            self._values[()] = 0
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up (files processed, bytes written, ...)."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as requests in flight."""
+
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of durations, in cumulative buckets like Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, help, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the enclosed block takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels):
+        """(count, sum) of the observations with these labels."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts), total
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The set of metrics exposed together, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(
+    "az2gcp_stage_seconds",
+    "Time spent per migration stage: load_source and walk per run, rewrite_batch "
+    "per batched request, read, detect, rewrite, validate and write_back per file.",
+    ["stage"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "az2gcp_llm_request_seconds", "Duration of model requests, including retries.", ["outcome"]
+)
+FILES = Counter("az2gcp_files_total", "Files finished, by final stage.", ["stage"])
+BYTES_READ = Counter("az2gcp_bytes_read_total", "Bytes of source files read.")
+BYTES_WRITTEN = Counter("az2gcp_bytes_written_total", "Bytes of migrated files written back.")
+LLM_TOKENS = Counter("az2gcp_llm_tokens_total", "Estimated model tokens.", ["direction"])
+PROMPT_TOKENS = Counter(
+    "az2gcp_prompt_tokens_total",
+    "Estimated input tokens by part: static prompt sent in full or served from the "
+    "provider's context cache (static_cached), per-call prompt text (dynamic) and code (content).",
+    ["part"],
+)
+FAILURES = Counter("az2gcp_failures_total", "Failures, by stage.", ["stage"])
+MIGRATIONS_IN_FLIGHT = Gauge("az2gcp_migrations_in_flight", "Migrations currently running.")
+REWRITES_IN_FLIGHT = Gauge(
+    "az2gcp_rewrites_in_flight", "Rewrite groups submitted to the worker pool and not yet written back."
+)
+LLM_IN_FLIGHT = Gauge("az2gcp_llm_requests_in_flight", "Model requests currently in flight.")
+WORKSPACES = Gauge("az2gcp_workspaces", "Workspaces on disk tracked by the workspace manager.")
+WORKSPACE_BYTES = Gauge("az2gcp_workspace_bytes", "Disk used by tracked workspaces, as last measured.")
+WORKSPACE_EVICTIONS = Counter(
+    "az2gcp_workspace_evictions_total", "Workspaces deleted, by reason (ttl, quota, download).", ["reason"]
+)
@@ -0,0 +1,510 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+
+from config.settings import (
+    REWRITE_WORKERS, SCAN_WORKERS, BATCH_MAX_TOKENS, BATCH_MAX_FILES, STREAM_REWRITES, COMBINED_SUGGESTIONS,
+)
+from core.chunker import estimate_tokens
+from core.detector import detect_azure_services
+from core.intake import take_in, take_in_many
+from core.manifest import content_hash
+from core.metrics import STAGE_SECONDS, FILES, BYTES_READ, BYTES_WRITTEN, FAILURES, REWRITES_IN_FLIGHT
+from core.rewriter import (
+    Usage, track_usage, rewrite_new, rewrite_stream, rewrite_batch, rewrite_with_suggestions,
+    generate_migration_suggestions,
+)
+from core.validator import validate, validate_file
+from utils.fs_utils import iter_files, iter_files_concurrent, is_text_file
+
+# How often streamed chunk events are forwarded while waiting on the workers
+STREAM_POLL_INTERVAL = 0.1
+# A streamed file reports progress at most once per interval, or per this many characters
+CHUNK_EVENT_CHARS = 64 * 1024
+# Files handed to a scan process at a time, to spread the cost of the round trip
+SCAN_BATCH_FILES = 32
+
+
+@dataclass
+class FileTask:
+    index: int
+    path: str
+    content: str
+    services: list = field(default_factory=list)
+    # Workspace-relative path, so prompts (and cache keys) don't depend on
+    # the temporary directory a run happens to be extracted into
+    name: str = ""
+    hash: str = ""
+    # Manifest entry of a previous run whose result can be reused as-is
+    reuse: dict = None
+    # Final status of a file intake decided not to rewrite
+    skip: str = ""
+    # Bytes on disk when read (None for unchanged files that weren't read)
+    size: int = None
+    # Filled in by rewrite_group and write_back for the run report
+    usage: Usage = None
+    timings: dict = field(default_factory=dict)
+
+
+@dataclass
+class StreamedOutput:
+    """A rewrite streamed into a temporary file next to the original."""
+    path: str
+    size: int
+
+
+def _to_task(index, path, name, intake, manifest):
+    """FileTask for a file read by core.intake, reusing a previous result if possible."""
+    if intake.content is None:
+        # Skipped without being decoded; see core.intake
+        return FileTask(index, path, None, intake.services or [], name, skip=intake.skip,
+                        size=intake.size)
+
+    content = intake.content
+    digest = content_hash(content)
+    entry = manifest.reusable(name, digest) if manifest is not None else None
+    if entry is not None:
+        return FileTask(index, path, content, entry["services"], name, digest, entry, size=intake.size)
+
+    services = intake.services
+    if services is None:
+        with STAGE_SECONDS.time(stage="detect"):
+            services = detect_azure_services(content)
+    return FileTask(index, path, content, services, name, digest, size=intake.size)
+
+
+def discover(workspace, manifest=None, unchanged=(), workers=None):
+    """
+    Stage 1: walk the workspace, read text files and detect Azure services.
+    Yields FileTask objects in a stable (walk) order. Oversized, binary,
+    minified and generated files come back with `skip` set (see
+    core.intake.take_in).
+
+    Files whose previous result can be reused (per `manifest`) skip
+    detection; files listed in `unchanged` are not even read.
+
+    With more than one scan worker (`workers`, defaults to SCAN_WORKERS)
+    the scan is concurrent; see _discover_concurrent.
+    """
+    workers = SCAN_WORKERS if workers is None else workers
+    if workers > 1:
+        yield from _discover_concurrent(workspace, manifest, unchanged, workers)
+        return
+
+    index = 0
+    paths = iter_files(workspace)
+    walk_time = 0.0
+    while True:
+        started = time.perf_counter()
+        path = next(paths, None)
+        walk_time += time.perf_counter() - started
+        if path is None:
+            break
+        if not is_text_file(path):
+            continue
+        name = os.path.relpath(path, workspace)
+
+        entry = manifest.reusable(name) if name in unchanged else None
+        if entry is not None:
+            yield FileTask(index, path, None, entry["services"], name, entry["hash"], entry)
+            index += 1
+            continue
+
+        try:
+            intake = take_in(path, name)
+        except Exception:
+            FAILURES.inc(stage="read")
+            continue
+        yield _to_task(index, path, name, intake, manifest)
+        index += 1
+
+    STAGE_SECONDS.observe(walk_time, stage="walk")
+
+
+def _scan_context():
+    # Scan processes are started from a clean server process rather than
+    # forked from this one, whose other threads may be holding locks
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _discover_concurrent(workspace, manifest, unchanged, workers):
+    """
+    discover() for large workspaces. Directories are listed on a thread
+    pool while files are read and searched, SCAN_BATCH_FILES at a time, in
+    a pool of `workers` processes. Tasks are yielded as soon as their batch
+    is done, so the rewrite stage starts before the walk ends, but their
+    order is not stable.
+    """
+    index = 0
+    started = time.perf_counter()
+    pending = {}
+    batch = []
+
+    def collect(done):
+        nonlocal index
+        tasks = []
+        for fut in done:
+            for (path, name), (intake, seconds) in zip(pending.pop(fut), fut.result()):
+                if intake is None:
+                    FAILURES.inc(stage="read")
+                    continue
+                STAGE_SECONDS.observe(seconds, stage="scan")
+                if intake.content is not None:
+                    BYTES_READ.inc(intake.size)
+                tasks.append(_to_task(index, path, name, intake, manifest))
+                index += 1
+        return tasks
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_scan_context()) as pool:
+        for path in iter_files_concurrent(workspace, workers):
+            if not is_text_file(path):
+                continue
+            name = os.path.relpath(path, workspace)
+
+            entry = manifest.reusable(name) if name in unchanged else None
+            if entry is not None:
+                yield FileTask(index, path, None, entry["services"], name, entry["hash"], entry)
+                index += 1
+                continue
+
+            batch.append((path, name))
+            if len(batch) >= SCAN_BATCH_FILES:
+                pending[pool.submit(take_in_many, batch)] = batch
+                batch = []
+            yield from collect([fut for fut in pending if fut.done()])
+            # Bound how many decoded files wait for the rewrite stage
+            if len(pending) >= workers * 2:
+                yield from collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+
+        if batch:
+            pending[pool.submit(take_in_many, batch)] = batch
+        while pending:
+            yield from collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+
+    # The walk overlaps the reads here, so this is the whole scan
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="walk")
+
+
+def rewrite(task, include_suggestions=False, rewritten=None):
+    """
+    Stage 2: send a file to the model. Runs inside the worker pool.
+    `rewritten` is passed when the code was already converted as part of a batch.
+    """
+    if rewritten is None:
+        # Code and suggestions from one structured request
+        if include_suggestions and COMBINED_SUGGESTIONS:
+            return rewrite_with_suggestions(task.name, task.content)
+        rewritten = rewrite_new(task.name, task.content)
+
+    # Add migration suggestions as comments if requested
+    if include_suggestions:
+        rewritten += generate_migration_suggestions(task.name, task.content)
+
+    return rewritten
+
+
+def rewrite_to_file(task, include_suggestions=False, chunks=None):
+    """
+    Stage 2, streaming: write the model's answer to a temporary file next to
+    the original as it arrives. Progress goes on the `chunks` queue as
+    "chunk" events, merged so there is at most one per STREAM_POLL_INTERVAL
+    or CHUNK_EVENT_CHARS, plus one for the whole answer. Returns a
+    StreamedOutput for write_back.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(task.path), prefix=".", suffix=".azure.tmp")
+    size = 0
+    reported = 0
+    reported_at = time.perf_counter()
+
+    def report():
+        nonlocal reported, reported_at
+        chunks.put({"type": "chunk", "file": task.name, "chars": size})
+        reported, reported_at = size, time.perf_counter()
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            pieces = rewrite_stream(task.name, task.content)
+            for piece in pieces:
+                f.write(piece)
+                f.flush()
+                size += len(piece)
+                if chunks is not None and (
+                    size - reported >= CHUNK_EVENT_CHARS
+                    or time.perf_counter() - reported_at >= STREAM_POLL_INTERVAL
+                ):
+                    report()
+            if chunks is not None and size > reported:
+                report()
+            if include_suggestions:
+                suggestions = generate_migration_suggestions(task.name, task.content)
+                f.write(suggestions)
+                size += len(suggestions)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return StreamedOutput(tmp, size)
+
+
+def rewrite_group(tasks, include_suggestions=False, chunks=None):
+    """
+    Rewrite a group of files, packing them into one request when there is
+    more than one. Returns one rewritten text (or the exception raised) per
+    task, so a bad file never fails the rest of its batch. With a `chunks`
+    queue, a file sent on its own is streamed to disk (see rewrite_to_file).
+    Each task's model usage is left in its `usage`.
+    """
+    usages = [Usage() for _ in tasks]
+    for task, usage in zip(tasks, usages):
+        task.usage = usage
+
+    if chunks is not None and len(tasks) == 1:
+        try:
+            with STAGE_SECONDS.time(stage="rewrite"), track_usage(usages[0]):
+                return [rewrite_to_file(tasks[0], include_suggestions, chunks)]
+        except Exception as e:
+            FAILURES.inc(stage="rewrite")
+            return [e]
+
+    texts = [None] * len(tasks)
+    if len(tasks) > 1:
+        try:
+            with STAGE_SECONDS.time(stage="rewrite_batch"):
+                texts = rewrite_batch([(t.name, t.content) for t in tasks], usages)
+        except Exception as e:
+            print(f"Batch rewrite failed: {e}")
+
+    results = []
+    for task, text in zip(tasks, texts):
+        try:
+            with STAGE_SECONDS.time(stage="rewrite"), track_usage(task.usage):
+                results.append(rewrite(task, include_suggestions, text))
+        except Exception as e:
+            FAILURES.inc(stage="rewrite")
+            results.append(e)
+    return results
+
+
+def write_back(task, rewritten, include_suggestions=False):
+    """
+    Stage 3: validate the rewritten code and write it over the original.
+    A StreamedOutput is validated on disk and renamed into place. The
+    validation result and time taken are left in the task's `timings`.
+    """
+    streamed = isinstance(rewritten, StreamedOutput)
+    started = time.perf_counter()
+    with STAGE_SECONDS.time(stage="validate"):
+        ok, reason = validate_file(rewritten.path) if streamed else validate(rewritten)
+    validated = time.perf_counter()
+    task.timings.update(validation="ok" if ok else reason, validate=validated - started)
+
+    try:
+        with STAGE_SECONDS.time(stage="write_back"):
+            if not ok:
+                if streamed:
+                    os.remove(rewritten.path)
+                FAILURES.inc(stage="validate")
+                return f"FAILED ({reason})"
+
+            # Only files actually rewritten get a backup, which is what
+            # diff-only downloads select on (see core.artifacts)
+            with open(task.path + ".azure.bak", "w", encoding="utf-8") as f:
+                f.write(task.content)
+            if streamed:
+                os.replace(rewritten.path, task.path)
+                BYTES_WRITTEN.inc(os.path.getsize(task.path))
+            else:
+                with open(task.path, "w", encoding="utf-8") as f:
+                    f.write(rewritten)
+                    BYTES_WRITTEN.inc(f.tell())
+    finally:
+        task.timings["write"] = time.perf_counter() - validated
+    return "Converted" + (" (with suggestions)" if include_suggestions else "")
+
+
+def file_stats(task):
+    """Size, model usage and write-back figures of a finished task, for reports."""
+    usage = task.usage or Usage()
+    return {
+        "size": task.size,
+        "chunks": usage.chunks,
+        "batch": usage.batch,
+        "requests": usage.requests,
+        "cache_hit": usage.cache_hit,
+        "prompt_tokens": usage.prompt_tokens,
+        "response_tokens": usage.response_tokens,
+        "llm_seconds": round(usage.llm_seconds, 3),
+        "validation": task.timings.get("validation"),
+        "validate_seconds": round(task.timings.get("validate", 0.0), 4),
+        "write_seconds": round(task.timings.get("write", 0.0), 4),
+    }
+
+
+def restore(task, manifest):
+    """Apply a previous run's result to an unchanged file without calling the model."""
+    entry = task.reuse
+    if entry["status"].startswith("Converted"):
+        shutil.copyfile(task.path, task.path + ".azure.bak")
+        with open(task.path, "w", encoding="utf-8") as f:
+            f.write(manifest.output(entry))
+    return entry["status"]
+
+
+def run_pipeline(workspace, include_suggestions=False, workers=None, progress=None,
+                 batch_tokens=None, manifest=None, unchanged=(), stream=None, scan_workers=None):
+    """
+    Run discovery, rewriting and write-back as overlapping stages.
+
+    Discovery and write-back run on the calling thread while up to `workers`
+    requests are in flight. Files below half of `batch_tokens` (defaults to
+    BATCH_MAX_TOKENS, 0 disables batching) are packed together into shared
+    requests while all workers are busy; an idle worker gets whatever is
+    pending straight away. Returns a list of (path, status) tuples in discovery order,
+    regardless of the order rewrites finish in.
+
+    With a `manifest` from a previous run, unchanged files get their earlier
+    output back instead of being rewritten (see discover), and every file's
+    result is recorded into it.
+
+    With `stream` (defaults to STREAM_REWRITES), files rewritten on their
+    own are streamed to a temporary file as the model answers, and "chunk"
+    events report how much of each has arrived.
+
+    `scan_workers` (defaults to SCAN_WORKERS) makes discovery concurrent;
+    results are then returned sorted by path, as discovery order varies.
+
+    If given, `progress` is called on the calling thread with an event dict
+    as each file is detected, rewritten and finished, and once the walk is
+    complete. Every event carries `elapsed`, seconds since the run started;
+    final "file" events also carry the file's own `duration` and the
+    figures from file_stats().
+    """
+    workers = max(1, workers or REWRITE_WORKERS)
+    batch_tokens = BATCH_MAX_TOKENS if batch_tokens is None else batch_tokens
+    stream = STREAM_REWRITES if stream is None else stream
+    scan_workers = SCAN_WORKERS if scan_workers is None else scan_workers
+    # Chunk events are produced on worker threads and forwarded from here
+    chunks = queue.SimpleQueue() if stream else None
+    results = {}
+    in_flight = {}
+    started = time.perf_counter()
+    detected_at = {}
+
+    def emit(**event):
+        if progress is not None:
+            event["elapsed"] = round(time.perf_counter() - started, 3)
+            progress(event)
+
+    def finish(task, stage, status, output=None):
+        if manifest is not None and stage == "reused":
+            manifest.carry_over(task.name, task.reuse)
+        elif manifest is not None:
+            converted = status.startswith("Converted")
+            if isinstance(output, StreamedOutput):
+                manifest.record(task.name, task.hash, task.services, status,
+                                output_path=task.path if converted else None)
+            else:
+                manifest.record(task.name, task.hash, task.services, status,
+                                output if converted else None)
+        if stage == "reused":
+            status += " (unchanged)"
+        results[task.index] = (task.path, status)
+        FILES.inc(stage=stage)
+        duration = time.perf_counter() - detected_at.pop(task.index)
+        emit(type="file", stage=stage, file=task.name, services=task.services,
+             status=status, duration=round(duration, 3), **file_stats(task))
+
+    def drain(block):
+        while True:
+            timeout = 0 if not block else (STREAM_POLL_INTERVAL if chunks is not None else None)
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            while chunks is not None and not chunks.empty():
+                emit(**chunks.get())
+            if done or not block:
+                break
+        for fut in done:
+            tasks = in_flight.pop(fut)
+            REWRITES_IN_FLIGHT.dec()
+            try:
+                outputs = fut.result()
+            except Exception as e:
+                outputs = [e] * len(tasks)
+            for task, rewritten in zip(tasks, outputs):
+                try:
+                    if isinstance(rewritten, Exception):
+                        raise rewritten
+                    emit(type="rewritten", file=task.name)
+                    status = write_back(task, rewritten, include_suggestions)
+                    stage = "validated" if not status.startswith("FAILED") else "failed"
+                except Exception as e:
+                    status = f"FAILED ({e})"
+                    stage = "failed"
+                finish(task, stage, status, rewritten)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rewrite") as pool:
+        batch = []
+        batch_size = 0
+
+        def submit(tasks):
+            in_flight[pool.submit(rewrite_group, tasks, include_suggestions, chunks)] = tasks
+            REWRITES_IN_FLIGHT.inc()
+
+        def flush():
+            nonlocal batch, batch_size
+            submit(batch)
+            batch, batch_size = [], 0
+
+        for task in discover(workspace, manifest, unchanged, scan_workers):
+            # A non-blocking drain on every file lets finished rewrites stream
+            # out while the walk is still running, even through long runs of
+            # skipped or reused files
+            if in_flight:
+                drain(block=False)
+            # Don't hold small files back while workers are sitting idle
+            if batch and len(in_flight) < workers:
+                flush()
+
+            detected_at[task.index] = time.perf_counter()
+            emit(type="detected", file=task.name, services=task.services)
+            if task.reuse is not None:
+                try:
+                    finish(task, "reused", restore(task, manifest))
+                except Exception as e:
+                    finish(task, "failed", f"FAILED ({e})")
+                continue
+            if task.skip or not task.services:
+                finish(task, "skipped", task.skip or "No Azure dependency")
+                continue
+
+            tokens = estimate_tokens(task.content)
+            if tokens > batch_tokens // 2:
+                submit([task])
+            else:
+                if batch and (batch_size + tokens > batch_tokens or len(batch) >= BATCH_MAX_FILES):
+                    flush()
+                batch.append(task)
+                batch_size += tokens
+                # Batches only build up while every worker is busy
+                if len(in_flight) < workers:
+                    flush()
+
+            # Bound the number of requests held in memory while the model is busy
+            if len(in_flight) >= workers * 2:
+                drain(block=True)
+
+        if batch:
+            flush()
+        emit(type="scan_complete", total=len(results) + sum(len(t) for t in in_flight.values()))
+
+        while in_flight:
+            drain(block=True)
+
+    if scan_workers > 1:
+        return sorted(results.values())
+    return [results[i] for i in sorted(results)]
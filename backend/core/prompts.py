@@ -1,10 +1,65 @@
-def build_rewrite_prompt(filename, services):
-    service_list = ", ".join(services)
-    return f"""
-The file '{filename}' contains Python code that uses the following cloud services:
-{service_list}
-
-You are a cloud migration compiler, not an explainer.
+import hashlib
+import json
+import string
+from dataclasses import dataclass
+
+from config.service_map import SERVICE_MAP
+from config.settings import CHUNK_MAX_TOKENS
+from core.chunker import estimate_tokens
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A rendered prompt: the `static` text shared by every call of its
+    template, followed by the `dynamic` text for this call. Keeping them
+    apart lets a backend cache the static prefix provider-side.
+    """
+    static: str
+    dynamic: str = ""
+    template: "PromptTemplate" = None
+
+    def __str__(self):
+        return self.static + self.dynamic
+
+
+class PromptTemplate:
+    """
+    A prompt compiled once at import: a fixed instruction block plus a
+    str.format() template for the per-call part. Bump `version` whenever
+    the wording changes; it is part of the fingerprint that invalidates
+    manifests and context caches.
+    """
+
+    def __init__(self, name, version, static, dynamic=""):
+        self.name = name
+        self.version = version
+        self.static = static
+        self.dynamic = dynamic
+        self.fields = {f for _, f, _, _ in string.Formatter().parse(dynamic) if f}
+        self.static_tokens = estimate_tokens(static)
+        raw = "\0".join([name, str(version), static, dynamic])
+        self.fingerprint = f"{name}-v{version}-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+    def render(self, note="", **values):
+        """Fill in the per-call fields; `note` is appended after them."""
+        missing = self.fields - set(values)
+        if missing:
+            raise ValueError(f"Prompt {self.name} needs {sorted(missing)}")
+        return Prompt(self.static, self.dynamic.format(**values) + note, self)
+
+
+def service_list(services):
+    """Detected services with their GCP equivalents, one per line."""
+    if not services:
+        return "none detected"
+    return "\n".join(
+        f"- {s} -> {SERVICE_MAP.get(s, {}).get('gcp_equivalent', 'a GCP equivalent')}"
+        for s in services
+    )
+
+
+REWRITE = PromptTemplate("rewrite", 2, static='''You are a cloud migration compiler, not an explainer.
 
 The input code is written for AWS Lambda or Azure Functions.
 Your job is to produce a **fully functional, directly deployable Google Cloud Function (HTTP-triggered, Gen-2 compatible)**.
@@ -68,5 +123,73 @@ FINAL OUTPUT RULES:
 17. Code MUST be deployable without modification.
 
 NOW CONVERT THE CODE BELOW INTO A WORKING GCP CLOUD FUNCTION:
-
-"""
\ No newline at end of file
+''', dynamic='''
+FILE: {filename}
+CLOUD SERVICES USED:
+{service_list}
+''')
+
+SUGGESTIONS = PromptTemplate("suggestions", 2, static='''
+    ACT AS: Senior Cloud Migration Architect.
+    SOURCE: Azure Functions/Services. TARGET: Google Cloud Functions/Services.
+    
+    TASK:
+    1. Analyze imports/libraries and suggest GCP equivalents (e.g., Azure.Storage -> google-cloud-storage).
+    2. Identify Trigger types (HTTP, Timer, Queue, Service Bus) and map to GCF equivalents.
+    3. Suggest changes for the function signature and deployment structure.
+    4. List any environment variables in this file that need to move to GCP Secret Manager.
+    5. Highlight any breaking changes or behavioral differences.
+    
+    FORMAT:
+    Return ONLY the suggestion text. Start with 'GCP MIGRATION ANALYSIS'.
+    Be concise and actionable. Do not repeat the original code.
+    ''', dynamic='''
+    FILE: {filename}
+''')
+
+# Appended to the rewrite prompt when a file is too large for one request
+CHUNK_NOTE = """
+The file is too large for one request. The code below is part {index} of {total}.
+Its leading imports are repeated in every part for context only.
+Convert ONLY the definitions in this part, including the imports they need.
+"""
+
+# Appended to the rewrite prompt when several small files share one request
+BATCH_NOTE = """
+This request contains {count} separate files. Each file starts with a line
+<<<FILE n: path>>> and ends with a line <<<END FILE n>>>.
+Convert EVERY file independently, following all rules above for each one.
+Return each converted file between the SAME two delimiter lines, with the same
+n, in the same order. Output nothing outside the delimiters.
+"""
+
+# Appended to the rewrite prompt to get the suggestions in the same request
+COMBINED_NOTE = """
+In the same answer, also act as a Senior Cloud Migration Architect and write
+migration suggestions for this file ({filename}):
+1. GCP equivalents for its imports/libraries.
+2. Trigger types (HTTP, Timer, Queue, Service Bus) and their GCF equivalents.
+3. Changes to the function signature and deployment structure.
+4. Environment variables that need to move to GCP Secret Manager.
+5. Breaking changes or behavioral differences.
+Start the suggestions with 'GCP MIGRATION ANALYSIS'. Be concise and actionable.
+
+Return EXACTLY these two sections and nothing outside them:
+<<<CODE>>>
+the converted code
+<<<END CODE>>>
+<<<SUGGESTIONS>>>
+the suggestion text
+<<<END SUGGESTIONS>>>
+"""
+
+
+def prompt_fingerprint():
+    """
+    Hash of everything besides the input that shapes the model's output:
+    the prompts, the service map they are matched against and how files are
+    chunked. Results stored under another fingerprint shouldn't be reused.
+    """
+    parts = [REWRITE.fingerprint, SUGGESTIONS.fingerprint, CHUNK_NOTE, BATCH_NOTE, COMBINED_NOTE,
+             json.dumps(SERVICE_MAP, sort_keys=True), str(CHUNK_MAX_TOKENS)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
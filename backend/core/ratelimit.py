@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def status_of(error):
+    """HTTP status carried by an SDK/HTTP exception, or None if it has none."""
+    for attr in ("code", "status_code", "status"):
+        value = getattr(error, attr, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int):
+            return value
+    return None
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled at `per_minute` units a minute, holding at
+    most one minute's worth. `per_minute` of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Block until `amount` units are available, then take them."""
+        if not self.rate:
+            return
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+class RateLimiter:
+    """
+    Shared pacing for model requests.
+
+    Every call takes one request from the requests-per-minute bucket and its
+    estimated tokens from the tokens-per-minute bucket, and waits for a free
+    slot under an adaptive concurrency limit. The limit grows by one slot
+    per window of successful calls (additive increase) and is halved when the
+    model throttles, fails or gets slower than `target_latency` seconds
+    (multiplicative decrease). Throttling and 5xx errors are retried with
+    jittered exponential backoff; anything else is raised straight away.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_concurrency=8, max_retries=4,
+                 backoff=1.0, max_backoff=60.0, target_latency=30.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.requests = TokenBucket(rpm, clock, sleep)
+        self.tokens = TokenBucket(tpm, clock, sleep)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.retries = 0
+        self.throttled = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._cond = threading.Condition()
+
+    def _enter(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _leave(self, latency=None, failed=False):
+        with self._cond:
+            self.in_flight -= 1
+            if failed or (latency is not None and latency > self.target_latency):
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def delay(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, fn, tokens=0):
+        """Run `fn()` under the limits, retrying transient failures."""
+        attempt = 0
+        while True:
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            self._enter()
+            started = self._clock()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = status_of(e) in RETRYABLE_STATUS
+                self._leave(failed=retryable)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                with self._cond:
+                    self.retries += 1
+                    self.throttled += status_of(e) == 429
+                self._sleep(self.delay(attempt))
+                attempt += 1
+                continue
+            self._leave(latency=self._clock() - started)
+            return result
+
+    def stream(self, open_stream, tokens=0):
+        """
+        Like call(), for a streamed answer: `open_stream()` returns an iterator
+        of pieces, which are passed through as they arrive. The slot is held
+        until the stream ends. Failures before the first piece are retried;
+        once pieces have gone out they can't be taken back, so later errors
+        are raised.
+        """
+        attempt = 0
+        while True:
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            self._enter()
+            started = self._clock()
+            started_output = False
+            left = False
+            try:
+                for piece in open_stream():
+                    started_output = True
+                    yield piece
+            except Exception as e:
+                retryable = status_of(e) in RETRYABLE_STATUS
+                self._leave(failed=retryable)
+                left = True
+                if started_output or not retryable or attempt >= self.max_retries:
+                    raise
+                with self._cond:
+                    self.retries += 1
+                    self.throttled += status_of(e) == 429
+                self._sleep(self.delay(attempt))
+                attempt += 1
+                continue
+            finally:
+                if not left:
+                    self._leave(latency=self._clock() - started)
+            return
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "retries": self.retries,
+                "throttled": self.throttled,
+            }
@@ -1,12 +1,48 @@
 import os
-import google.generativeai as genai
-from config.settings import MODEL_NAME, GEMINI_API_KEY
-from core.chunker import chunk_code
-from core.prompts import build_rewrite_prompt
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from config.settings import (
+    MODEL_NAME, GEMINI_API_KEY,
+    LLM_BACKEND, LLM_HTTP_URL, LLM_HTTP_MODEL, LLM_HTTP_API_KEY,
+    LLM_HTTP_TIMEOUT, LLM_HTTP_CONNECT_TIMEOUT, LLM_HTTP_POOL_SIZE,
+    GEMINI_RPM, GEMINI_TPM, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES,
+    REWRITE_CACHE_ENABLED, REWRITE_CACHE_DIR, REWRITE_CACHE_MAX_MB,
+    PROMPT_CONTEXT_CACHE, PROMPT_CONTEXT_CACHE_TTL,
+)
+from core.backends import create_backend
+from core.cache import RewriteCache
+from core.chunker import (
+    CHARS_PER_TOKEN, chunk_code, merge_chunk_outputs, merge_chunk_stream, estimate_tokens,
+)
+from core.detector import detect_azure_services
+from core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_IN_FLIGHT, PROMPT_TOKENS
+from core.ratelimit import RateLimiter
+from core.validator import validate
+from core.prompts import (
+    Prompt, REWRITE, SUGGESTIONS, CHUNK_NOTE, BATCH_NOTE, COMBINED_NOTE, service_list,
+)
 
 # print(GEMINI_API_KEY)
-model = genai.GenerativeModel(MODEL_NAME)
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Created by get_backend() on first use; tests may assign a stand-in
+backend = None
+_backend_lock = threading.Lock()
+# Identifies the model in cache keys and manifests
+MODEL_ID = MODEL_NAME if LLM_BACKEND == "gemini" else f"{LLM_BACKEND}:{LLM_HTTP_URL}:{LLM_HTTP_MODEL}"
+rewrite_cache = RewriteCache(
+    REWRITE_CACHE_DIR, REWRITE_CACHE_MAX_MB * 1024 * 1024, enabled=REWRITE_CACHE_ENABLED
+)
+limiter = RateLimiter(
+    GEMINI_RPM, GEMINI_TPM, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES
+)
+# Provider-side cached static prompt prefixes: (backend, template fingerprint)
+# -> (handle or None, expiry)
+_contexts = {}
+_contexts_lock = threading.Lock()
+# Usage collector of the rewrite running on the current thread; see track_usage()
+_usage = threading.local()
 # print(os.getenv("GEMINI_API_KEY"))
 # Mapping extensions to comment styles for migration suggestions
 COMMENT_MAP = {
@@ -24,93 +60,353 @@ COMMENT_MAP = {
     '.jsx': ('// ', '')
 }
 
+_COMBINED_SECTION = r"^<<<{0}>>>[ \t]*\n(.*?)\n?^<<<END {0}>>>"
+_COMBINED_CODE = re.compile(_COMBINED_SECTION.format("CODE"), re.DOTALL | re.MULTILINE)
+_COMBINED_SUGGESTIONS = re.compile(_COMBINED_SECTION.format("SUGGESTIONS"), re.DOTALL | re.MULTILINE)
+_FENCE = re.compile(r"^```\w*\n|\n```\s*$")
+
+_BATCH_BLOCK = re.compile(
+    r"^<<<FILE (\d+)[^\n]*>>>[ \t]*\n(.*?)\n?^<<<END FILE \1>>>", re.DOTALL | re.MULTILINE
+)
+
 def _get_comment_style(filename):
     """Get comment style for a given file type"""
     ext = os.path.splitext(filename)[1].lower()
     return COMMENT_MAP.get(ext, ('# ', ''))
 
-def rewrite_code(filename, content, services):
-    rewritten = ""
-    for chunk in chunk_code(content):
-        prompt = build_rewrite_prompt(filename, services)
-        response = model.generate_content([prompt, chunk])
-        rewritten += response.text + "\n"
-    return rewritten
+def get_backend():
+    """Return the configured LLM backend (see LLM_BACKEND), creating it on first use."""
+    global backend
+    if backend is None:
+        with _backend_lock:
+            if backend is None:
+                if LLM_BACKEND == "http":
+                    backend = create_backend(
+                        "http", base_url=LLM_HTTP_URL, model_name=LLM_HTTP_MODEL,
+                        api_key=LLM_HTTP_API_KEY, timeout=LLM_HTTP_TIMEOUT,
+                        connect_timeout=LLM_HTTP_CONNECT_TIMEOUT, pool_size=LLM_HTTP_POOL_SIZE,
+                    )
+                else:
+                    backend = create_backend(LLM_BACKEND, model_name=MODEL_NAME, api_key=GEMINI_API_KEY)
+    return backend
 
-def rewrite_new(filename, content):
-    prompt="""
-The file '{filename}' contains Python code that uses the following cloud services:
-{service_list}
+@dataclass
+class Usage:
+    """Model usage of one file's rewrite."""
+    # Pieces the file was sent in (1 unless chunked)
+    chunks: int = 0
+    requests: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    # Time spent waiting on the model, pacing and retries included
+    llm_seconds: float = 0.0
+    # Files that shared the request, when sent as part of a batch
+    batch: int = 0
 
-You are a cloud migration compiler, not an explainer.
+    @property
+    def cache_hit(self):
+        """True if every answer came from the rewrite cache."""
+        return self.cache_hits > 0 and self.requests == 0
 
-The input code is written for AWS Lambda or Azure Functions.
-Your job is to produce a **fully functional, directly deployable Google Cloud Function (HTTP-triggered, Gen-2 compatible)**.
+@contextmanager
+def track_usage(usage=None):
+    """
+    Collect the Usage of the rewrite calls made on this thread inside the
+    block, adding to `usage` if given. Streamed rewrites must be consumed
+    inside it too.
+    """
+    if usage is None:
+        usage = Usage()
+    previous = getattr(_usage, "current", None)
+    _usage.current = usage
+    try:
+        yield usage
+    finally:
+        _usage.current = previous
 
-ABSOLUTE REQUIREMENTS (NON-NEGOTIABLE):
+def _record(chunks=None, **amounts):
+    usage = getattr(_usage, "current", None)
+    if usage is None:
+        return
+    if chunks is not None:
+        # A fallback may send the same file again; count its pieces once
+        usage.chunks = max(usage.chunks, chunks)
+    for name, amount in amounts.items():
+        setattr(usage, name, getattr(usage, name) + amount)
 
-1. The output MUST be valid Python code that RUNS on Google Cloud Functions.
-2. The output MUST NOT require any manual fixes after generation.
-3. The output MUST be executable with `gcloud functions deploy`.
+def _context_for(prompt):
+    """
+    Handle of the provider-side cached copy of the prompt's static part, or
+    None to send the whole prompt. Handles are created on first use and
+    renewed after PROMPT_CONTEXT_CACHE_TTL; a backend that can't cache (or
+    fails to) is asked again only after the same delay.
+    """
+    if not PROMPT_CONTEXT_CACHE or not isinstance(prompt, Prompt) or prompt.template is None:
+        return None
+    b = get_backend()
+    cache_context = getattr(b, "cache_context", None)
+    if cache_context is None:
+        return None
+    key = (b, prompt.template.fingerprint)
+    now = time.monotonic()
+    with _contexts_lock:
+        entry = _contexts.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        try:
+            handle = cache_context(prompt.static, ttl=PROMPT_CONTEXT_CACHE_TTL)
+        except Exception as e:
+            print(f"Context caching failed, sending full prompts: {e}")
+            handle = None
+        # Renewed a little early so a handle never expires mid-request
+        _contexts[key] = (handle, now + PROMPT_CONTEXT_CACHE_TTL * 0.9)
+        return handle
 
-HANDLER RULES (CRITICAL):
+def _count_prompt_tokens(prompt, content, context):
+    """Record input tokens split into static/dynamic prompt and content; return the total."""
+    if isinstance(prompt, Prompt) and prompt.template is not None:
+        static = prompt.template.static_tokens
+        dynamic = estimate_tokens(prompt.dynamic) if prompt.dynamic else 0
+        PROMPT_TOKENS.inc(static, part="static_cached" if context is not None else "static")
+        PROMPT_TOKENS.inc(dynamic, part="dynamic")
+    else:
+        static, dynamic = 0, estimate_tokens(str(prompt))
+        PROMPT_TOKENS.inc(dynamic, part="dynamic")
+    tokens = estimate_tokens(content)
+    PROMPT_TOKENS.inc(tokens, part="content")
+    return static + dynamic + tokens
 
-4. You MUST define exactly ONE HTTP handler using this signature:
+def _call_args(prompt, context):
+    """Positional prompt and keyword arguments for backend.generate/stream."""
+    if context is not None:
+        return prompt.dynamic, {"context": context}
+    return str(prompt), {}
 
-   @functions_framework.http
-   def handler(request):
+def _request(prompt, content):
+    """Send one request to the model, paced and retried by the shared limiter."""
+    context = _context_for(prompt)
+    text_prompt, extra = _call_args(prompt, context)
+    tokens = _count_prompt_tokens(prompt, content, context)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with LLM_IN_FLIGHT.track():
+            text = limiter.call(
+                lambda: get_backend().generate(text_prompt, content, **extra), tokens=tokens
+            )
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(seconds, outcome=outcome)
+        _record(llm_seconds=seconds)
+    output_tokens = estimate_tokens(text)
+    LLM_TOKENS.inc(tokens, direction="input")
+    LLM_TOKENS.inc(output_tokens, direction="output")
+    _record(requests=1, prompt_tokens=tokens, response_tokens=output_tokens)
+    return text
 
-5. You MUST NOT use:
-   - lambda_handler
-   - event
-   - context
-   - statusCode
-   - body
-   - Azure bindings
-   - API Gateway assumptions
+def _cacheable(text):
+    """
+    Whether an answer may be replayed from the cache: one that fails
+    validation, or is only comments (the model's way of saying the code
+    can't be converted), should be asked for again next time.
+    """
+    if not validate(text)[0]:
+        return False
+    return any(
+        line.strip() and not line.lstrip().startswith(("#", "//", "/*", "*", "<!--"))
+        for line in text.splitlines()
+    )
 
-REQUEST PARSING RULES:
+def _generate(prompt, content):
+    """Call the model, serving repeated (model, prompt, content) triples from cache."""
+    key = rewrite_cache.key(MODEL_ID, str(prompt), content)
+    cached = rewrite_cache.get(key)
+    if cached is not None:
+        _record(cache_hits=1)
+        return cached
+    text = _request(prompt, content)
+    if _cacheable(text):
+        rewrite_cache.put(key, text)
+    return text
 
-6. You MUST parse input ONLY using:
-   - request.get_json(silent=True)
-   - request.args
-   - request.headers
+def _rewrite_prompt(filename, content, services=None, note=""):
+    if services is None:
+        services = detect_azure_services(content)
+    return REWRITE.render(note, filename=filename, service_list=service_list(services))
 
-7. You MUST NOT read request data from dictionaries like event["body"].
+def rewrite_code(filename, content, services):
+    rewritten = ""
+    prompt = _rewrite_prompt(filename, content, services)
+    for chunk in chunk_code(content, filename=filename):
+        rewritten += _generate(prompt, chunk) + "\n"
+    return rewritten
 
-RESPONSE RULES:
+def rewrite_new(filename, content, services=None):
+    chunks = chunk_code(content, filename=filename)
+    _record(chunks=len(chunks))
+    if len(chunks) == 1:
+        text = _generate(_rewrite_prompt(filename, content, services), content)
+    else:
+        parts = [
+            _generate(
+                _rewrite_prompt(filename, content, services, CHUNK_NOTE.format(index=i, total=len(chunks))),
+                chunk,
+            )
+            for i, chunk in enumerate(chunks, 1)
+        ]
+        text = merge_chunk_outputs(parts)
 
-8. You MUST return responses ONLY in GCP-valid formats:
-   - return (response_body, status_code)
-   - OR return (response_body, status_code, headers)
+    return text
 
-9. You MUST NOT return AWS-style dictionaries such as:
-   { "statusCode": 200, "body": "..." }
+# Streamed answers longer than this are passed through without being cached,
+# so memory stays flat however large the output is
+STREAM_CACHE_MAX_CHARS = 1024 * 1024
 
-SDK & DEPENDENCY RULES:
+def _stream_generate(prompt, content):
+    """Streaming _generate(): yield the answer in pieces, from the cache if possible."""
+    key = rewrite_cache.key(MODEL_ID, str(prompt), content)
+    cached = rewrite_cache.get(key)
+    if cached is not None:
+        _record(cache_hits=1)
+        yield cached
+        return
 
-10. You MUST replace all AWS/Azure SDKs with official Google Cloud SDKs.
-11. You MUST use only supported Google Cloud Python libraries.
-12. Assume Application Default Credentials.
-13. Do NOT include placeholder or pseudo-code.
+    context = _context_for(prompt)
+    text_prompt, extra = _call_args(prompt, context)
+    tokens = _count_prompt_tokens(prompt, content, context)
+    kept = []
+    size = 0
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with LLM_IN_FLIGHT.track():
+            for piece in limiter.stream(
+                lambda: get_backend().stream(text_prompt, content, **extra), tokens=tokens
+            ):
+                size += len(piece)
+                if size <= STREAM_CACHE_MAX_CHARS:
+                    kept.append(piece)
+                yield piece
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(seconds, outcome=outcome)
+        _record(llm_seconds=seconds)
+    output_tokens = int(size / CHARS_PER_TOKEN) + 1
+    LLM_TOKENS.inc(tokens, direction="input")
+    LLM_TOKENS.inc(output_tokens, direction="output")
+    _record(requests=1, prompt_tokens=tokens, response_tokens=output_tokens)
+    if size <= STREAM_CACHE_MAX_CHARS:
+        text = "".join(kept)
+        if _cacheable(text):
+            rewrite_cache.put(key, text)
 
-FAILURE CONDITIONS (IMPORTANT):
+def rewrite_stream(filename, content, services=None):
+    """
+    rewrite_new(), yielding the converted code in pieces as the model
+    produces it. Large files are still sent chunk by chunk; their parts are
+    merged on the fly.
+    """
+    chunks = chunk_code(content, filename=filename)
+    _record(chunks=len(chunks))
+    if len(chunks) == 1:
+        yield from _stream_generate(_rewrite_prompt(filename, content, services), content)
+        return
+    yield from merge_chunk_stream(
+        _stream_generate(
+            _rewrite_prompt(filename, content, services, CHUNK_NOTE.format(index=i, total=len(chunks))),
+            chunk,
+        )
+        for i, chunk in enumerate(chunks, 1)
+    )
 
-14. If you cannot produce a fully functional GCP Cloud Function,
-    return ONLY a Python comment explaining why conversion is not possible.
+def _pack_batch(files):
+    return "\n".join(
+        f"<<<FILE {i}: {name}>>>\n{content.rstrip()}\n<<<END FILE {i}>>>"
+        for i, (name, content) in enumerate(files, 1)
+    )
 
-FINAL OUTPUT RULES:
+def _split_batch(text, count):
+    """Return {index: code} for every well-formed block in a batch response."""
+    text = re.sub(r"^```\w*\n|\n```\s*$", "", text.strip())
+    blocks = {}
+    for m in _BATCH_BLOCK.finditer(text):
+        i = int(m.group(1))
+        if 1 <= i <= count and i not in blocks:
+            blocks[i] = m.group(2) + "\n"
+    return blocks
 
-15. Output ONLY Python code.
-16. No markdown, no explanations outside comments.
-17. Code MUST be deployable without modification.
+def rewrite_batch(files, usages=None):
+    """
+    Rewrite several small files with a single model request.
+
+    `files` is a list of (filename, content) pairs; the result is a list of
+    rewritten texts in the same order. Files already in the cache are not
+    sent. Entries are None for files missing from the model's response (or
+    for every uncached file if the request fails) and should be retried on
+    their own with rewrite_new.
 
-NOW CONVERT THE CODE BELOW INTO A WORKING GCP CLOUD FUNCTION:
-"""
-    resp=model.generate_content([prompt,content])
+    If given, `usages` (one Usage per file) is filled in for the files that
+    get an answer; those sent together share the request's tokens and time
+    equally.
+    """
+    services = [detect_azure_services(content) for _, content in files]
+    keys = [
+        rewrite_cache.key(MODEL_ID, str(_rewrite_prompt(name, content, found)), content)
+        for (name, content), found in zip(files, services)
+    ]
+    results = [rewrite_cache.get(key) for key in keys]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if usages is not None:
+        for usage, result in zip(usages, results):
+            if result is not None:
+                usage.chunks, usage.cache_hits = 1, 1
+    if len(pending) < 2:
+        return results
+
+    batch = [files[i] for i in pending]
+    try:
+        prompt = REWRITE.render(
+            BATCH_NOTE.format(count=len(batch)),
+            filename=", ".join(name for name, _ in batch),
+            service_list=service_list(list(dict.fromkeys(s for i in pending for s in services[i]))),
+        )
+        with track_usage() as shared:
+            text = _request(prompt, _pack_batch(batch))
+    except Exception as e:
+        print(f"Batch rewrite failed, falling back to single files: {e}")
+        return results
+
+    blocks = _split_batch(text, len(batch))
+    for n, i in enumerate(pending, 1):
+        if n in blocks:
+            results[i] = blocks[n]
+            if usages is not None:
+                usages[i].chunks = 1
+                usages[i].requests = 1
+                usages[i].batch = len(batch)
+                usages[i].prompt_tokens = shared.prompt_tokens // len(batch)
+                usages[i].response_tokens = shared.response_tokens // len(batch)
+                usages[i].llm_seconds = shared.llm_seconds / len(batch)
+            # Stored under the single-file key, so later runs hit the cache
+            # however the files end up being grouped
+            if _cacheable(blocks[n]):
+                rewrite_cache.put(keys[i], blocks[n])
+    return results
+
+def _suggestion_block(filename, suggestion):
+    """Format suggestion text as a comment block in the file's language."""
+    prefix, suffix = _get_comment_style(filename)
+    analysis_block = f"\n\n{prefix}{'='*50}\n"
+    analysis_block += f"{prefix}GCP MIGRATION SUGGESTIONS\n"
+    analysis_block += f"{prefix}{'='*50}\n"
+    for line in suggestion.splitlines():
+        analysis_block += f"{prefix}{line}{suffix}\n"
+    analysis_block += f"{prefix}{'='*50}\n"
+    return analysis_block
 
-    print(resp.text)
-    return resp.text
 def generate_migration_suggestions(filename, content):
     """
     Generate GCP migration suggestions as a comment block.
@@ -119,35 +415,42 @@ def generate_migration_suggestions(filename, content):
     """
     prefix, suffix = _get_comment_style(filename)
     
-    prompt = f"""
-    ACT AS: Senior Cloud Migration Architect.
-    SOURCE: Azure Functions/Services. TARGET: Google Cloud Functions/Services.
-    FILE: {filename}
-    
-    TASK:
-    1. Analyze imports/libraries and suggest GCP equivalents (e.g., Azure.Storage -> google-cloud-storage).
-    2. Identify Trigger types (HTTP, Timer, Queue, Service Bus) and map to GCF equivalents.
-    3. Suggest changes for the function signature and deployment structure.
-    4. List any environment variables in this file that need to move to GCP Secret Manager.
-    5. Highlight any breaking changes or behavioral differences.
-    
-    FORMAT:
-    Return ONLY the suggestion text. Start with 'GCP MIGRATION ANALYSIS'.
-    Be concise and actionable. Do not repeat the original code.
-    """
-    
     try:
-        response = model.generate_content([prompt, content])
-        suggestion = response.text
-        
-        # Formatting the comment block
-        analysis_block = f"\n\n{prefix}{'='*50}\n"
-        analysis_block += f"{prefix}GCP MIGRATION SUGGESTIONS\n"
-        analysis_block += f"{prefix}{'='*50}\n"
-        for line in suggestion.splitlines():
-            analysis_block += f"{prefix}{line}{suffix}\n"
-        analysis_block += f"{prefix}{'='*50}\n"
-        
-        return analysis_block
+        suggestion = _generate(SUGGESTIONS.render(filename=filename), content)
+        return _suggestion_block(filename, suggestion)
     except Exception as e:
         return f"\n\n{prefix}Error generating suggestions: {str(e)}\n"
+
+def _split_combined(text):
+    """Return (code, suggestions) from a combined answer; either is None if missing."""
+    text = text.strip()
+    # Some answers wrap everything in one markdown fence
+    if text.startswith("```") and "<<<CODE>>>" in text:
+        text = _FENCE.sub("", text)
+    code = _COMBINED_CODE.search(text)
+    suggestions = _COMBINED_SUGGESTIONS.search(text)
+    if code is not None:
+        code = _FENCE.sub("", code.group(1).strip("\n")) + "\n"
+    if suggestions is not None:
+        suggestions = suggestions.group(1).strip()
+    return code, suggestions or None
+
+def rewrite_with_suggestions(filename, content, services=None):
+    """
+    Converted code followed by the suggestion comment block, in one request
+    when possible. Falls back to separate requests for whatever part the
+    model's answer doesn't contain in the expected form, and for files too
+    large to be sent in one piece.
+    """
+    if len(chunk_code(content, filename=filename)) > 1:
+        return rewrite_new(filename, content, services) + generate_migration_suggestions(filename, content)
+    _record(chunks=1)
+
+    code, suggestions = _split_combined(
+        _generate(_rewrite_prompt(filename, content, services, COMBINED_NOTE.format(filename=filename)), content)
+    )
+    if code is None:
+        code = rewrite_new(filename, content, services)
+    if suggestions is None:
+        return code + generate_migration_suggestions(filename, content)
+    return code + _suggestion_block(filename, suggestions)
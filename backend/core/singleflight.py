@@ -0,0 +1,59 @@
+import threading
+
+from core.manifest import file_hash, manifest_key
+from core.prompts import prompt_fingerprint
+from core.rewriter import MODEL_ID
+from core.source_loader import remote_head
+
+
+def migration_key(source, include_suggestions=False):
+    """
+    What makes two migrations interchangeable: the source (a ZIP's content
+    hash, or the normalized repository URL plus the commit its HEAD points
+    at), the options, the model and the prompts.
+    """
+    if source.endswith(".zip"):
+        key = "zip:" + file_hash(source)
+    else:
+        key = manifest_key(source) + "@" + (remote_head(source) or "unresolved")
+    return "\0".join([key, f"suggestions={bool(include_suggestions)}", MODEL_ID, prompt_fingerprint()])
+
+
+class SingleFlight:
+    """
+    At most one call per key in flight. Callers asking for a key that is
+    already running get the running call's Future instead of starting
+    another; the key is forgotten as soon as that Future is done. From then
+    on the Future's `callers` attribute says how many run() calls shared it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, start):
+        """
+        Return (future, joined). `start()` must return a Future and is only
+        called when nothing is running under `key`.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight[1] += 1
+                return flight[0], True
+            future = start()
+            self._flights[key] = [future, 1]
+        # Registered before any waiter's callback, so `callers` is set first
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future, False
+
+    def _forget(self, key, future):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight[0] is future:
+                del self._flights[key]
+                future.callers = flight[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
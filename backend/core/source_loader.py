@@ -1,56 +1,267 @@
 import os
+import hashlib
 import shutil
+import threading
+import time
 import zipfile
-import tempfile
-from git import Repo, GitCommandError
+from git import Git, Repo, GitCommandError
 
-IGNORED_DIRS = {
-    "node_modules", ".git", "bin", "obj",
-    ".venv", "dist", "target"
-}
+from config.settings import (
+    ZIP_MAX_FILE_MB, ZIP_MAX_TOTAL_MB, GIT_CLONE_MODE, GIT_MIRROR_DIR, ALLOW_LOCAL_GIT,
+)
+from core.workspaces import workspaces
+from utils.fs_utils import IGNORED_DIRS, is_text_file
 
-def load_source(source: str) -> str:
+ZIP_CHUNK_SIZE = 64 * 1024
+
+REMOTE_GIT_PREFIXES = ("http://", "https://", "ssh://", "git@")
 
-    workspace = tempfile.mkdtemp(prefix="az2gcp_")
+# One lock per mirror, so concurrent runs for the same URL don't fetch into
+# (or add worktrees to) the same bare repository at the same time
+_mirror_locks = {}
+_mirror_locks_guard = threading.Lock()
+
+def load_source(source: str) -> str:
+    """
+    Check out `source` into a new workspace and return its path. The
+    workspace is tracked by core.workspaces and handed over in use; release
+    it once done with it.
+    """
+    workspace = workspaces.create()
 
     try:
         if source.endswith(".zip"):
             _extract_zip(source, workspace)
-        elif source.startswith("http") or source.endswith(".git"):
+        elif source.startswith(REMOTE_GIT_PREFIXES) or (ALLOW_LOCAL_GIT and _is_local_git(source)):
             _clone_repo(source, workspace)
+        elif _is_local_git(source):
+            raise ValueError("Local Git repositories are disabled (set ALLOW_LOCAL_GIT=1 for CLI use)")
         else:
             raise ValueError("Source must be a ZIP file path or Git repository URL (http/https or .git)")
 
         return workspace
     except Exception as e:
         # Cleanup workspace on error
-        if os.path.exists(workspace):
-            shutil.rmtree(workspace, ignore_errors=True)
+        workspaces.remove(workspace)
         raise
 
-def _extract_zip(zip_path, dest):
-    """Extract ZIP file to destination directory."""
+def remote_head(repo_url):
+    """Commit the repository's HEAD points at, asked without cloning; None if unknown."""
+    try:
+        output = Git().ls_remote(repo_url, "HEAD")
+    except Exception:
+        return None
+    return output.split()[0] if output else None
+
+def _is_local_git(source):
+    """file:// URLs and plain paths to a repository on this machine."""
+    return source.startswith("file://") or source.endswith(".git")
+
+def resolve_commit(workspace):
+    """Return the commit SHA checked out in a workspace, or None for non-Git sources."""
+    if not os.path.exists(os.path.join(workspace, ".git")):
+        return None
+    try:
+        return Repo(workspace).head.commit.hexsha
+    except Exception:
+        return None
+
+def _extract_zip(zip_path, dest,
+                 max_file_bytes=ZIP_MAX_FILE_MB * 1024 * 1024,
+                 max_total_bytes=ZIP_MAX_TOTAL_MB * 1024 * 1024):
+    """
+    Extract the members of a ZIP file that the migration will actually read.
+
+    Members inside IGNORED_DIRS, without a TEXT_EXTENSIONS suffix, or larger
+    than max_file_bytes are never written to disk. Data is streamed in
+    chunks, and extraction stops with a ValueError once more than
+    max_total_bytes have been written.
+    """
     try:
         if not os.path.exists(zip_path):
             raise FileNotFoundError(f"ZIP file not found: {zip_path}")
-        
+
+        root = os.path.realpath(dest)
+        total = 0
+        extracted = skipped = 0
+
         with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(dest)
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+
+                target = _member_target(root, info.filename)
+                if target is None or info.file_size > max_file_bytes:
+                    skipped += 1
+                    continue
+
+                # Check the declared size first so we don't start a member
+                # that would obviously exceed the budget
+                if total + info.file_size > max_total_bytes:
+                    raise ValueError(
+                        f"ZIP archive exceeds the {max_total_bytes // (1024 * 1024)} MB uncompressed size limit"
+                    )
+
+                written = _copy_member(z, info, target, max_file_bytes, max_total_bytes - total)
+                if written is None:
+                    skipped += 1
+                    continue
+                total += written
+                extracted += 1
+
+        print(f"Extracted {extracted} files ({total} bytes), skipped {skipped}")
     except zipfile.BadZipFile as e:
         raise ValueError(f"Invalid ZIP file: {str(e)}")
+    except ValueError:
+        raise
     except Exception as e:
         raise Exception(f"Failed to extract ZIP file: {str(e)}")
 
-def _clone_repo(repo_url, dest):
-    """Clone Git repository to destination directory."""
+def _member_target(root, name):
+    """Return the destination path for a member, or None if it should be skipped."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or any(p in IGNORED_DIRS for p in parts[:-1]):
+        return None
+    if not is_text_file(parts[-1]):
+        return None
+
+    target = os.path.realpath(os.path.join(root, *parts))
+    # Refuse members that would land outside the workspace ("zip slip")
+    if not target.startswith(root + os.sep):
+        return None
+    return target
+
+def _copy_member(z, info, target, max_file_bytes, remaining_bytes):
+    """
+    Stream one member to disk. Returns the number of bytes written, or None
+    if the member turned out to be larger than max_file_bytes. Sizes are
+    counted as data is read, so a forged header can't bypass the limits.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    written = 0
+    with z.open(info) as src, open(target, "wb") as out:
+        while True:
+            chunk = src.read(ZIP_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_file_bytes:
+                break
+            if written > remaining_bytes:
+                out.close()
+                os.remove(target)
+                raise ValueError("ZIP archive exceeds the uncompressed size limit")
+            out.write(chunk)
+
+    if written > max_file_bytes:
+        os.remove(target)
+        return None
+    return written
+
+def _clone_repo(repo_url, dest, mode=None, mirror_dir=None):
+    """
+    Check out a Git repository into the destination directory.
+
+    Modes (GIT_CLONE_MODE):
+        mirror  - keep a bare mirror per URL under GIT_MIRROR_DIR, fetch it
+                  incrementally and add a fresh worktree for each run
+        shallow - depth-1, blob-filtered clone of the default branch
+        full    - complete clone with history
+
+    Returns the SHA of the checked out commit.
+    """
+    mode = mode or GIT_CLONE_MODE
     try:
         # Ensure .git extension for GitHub URLs if not present
         if "github.com" in repo_url and not repo_url.endswith(".git"):
             repo_url = repo_url + ".git"
         
-        print(f"Cloning repository: {repo_url}")
-        Repo.clone_from(repo_url, dest)
+        print(f"Cloning repository: {repo_url} ({mode})")
+        if mode == "mirror":
+            return _checkout_from_mirror(repo_url, dest, mirror_dir or GIT_MIRROR_DIR)
+        if mode == "shallow":
+            repo = Repo.clone_from(
+                repo_url, dest, depth=1, single_branch=True, multi_options=["--filter=blob:none"]
+            )
+        elif mode == "full":
+            repo = Repo.clone_from(repo_url, dest)
+        else:
+            raise ValueError(f"Unknown GIT_CLONE_MODE: {mode}")
+        return repo.head.commit.hexsha
+    except ValueError:
+        raise
     except GitCommandError as e:
         raise Exception(f"Failed to clone repository: {str(e)}")
     except Exception as e:
         raise Exception(f"Repository cloning error: {str(e)}")
+
+# Branches only, fetched straight into the mirror's own refs/heads
+MIRROR_REFSPEC = "+refs/heads/*:refs/heads/*"
+
+def _mirror_path(repo_url, mirror_dir):
+    key = hashlib.sha256(repo_url.rstrip("/").encode("utf-8")).hexdigest()[:16]
+    return os.path.join(mirror_dir, key + ".git")
+
+def _mirror_lock(path):
+    with _mirror_locks_guard:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+def prune_mirrors(max_age, mirror_dir=None, now=None):
+    """
+    Delete mirrors no migration has checked out from for `max_age` seconds.
+    Returns the number removed.
+    """
+    mirror_dir = mirror_dir or GIT_MIRROR_DIR
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        names = os.listdir(mirror_dir)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(mirror_dir, name)
+        with _mirror_lock(path):
+            try:
+                last_used = os.path.getmtime(path)
+            except OSError:
+                continue
+            if now - last_used > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return removed
+
+def _checkout_from_mirror(repo_url, dest, mirror_dir):
+    """
+    Refresh (or create) the bare mirror for repo_url and add a detached
+    worktree at dest. Mirrors track branches only: a full --mirror would
+    also fetch every other ref, such as GitHub's refs/pull/*.
+    """
+    path = _mirror_path(repo_url, mirror_dir)
+    with _mirror_lock(path):
+        mirror = None
+        if os.path.isdir(path):
+            try:
+                mirror = Repo(path)
+                # Also narrows mirrors created before with --mirror
+                mirror.git.config("remote.origin.fetch", MIRROR_REFSPEC)
+                mirror.git.fetch("--prune", "origin")
+                # Forget worktrees of workspaces that have since been deleted
+                mirror.git.worktree("prune")
+            except Exception as e:
+                print(f"Mirror refresh failed, re-cloning: {e}")
+                shutil.rmtree(path, ignore_errors=True)
+                mirror = None
+
+        if mirror is None:
+            os.makedirs(mirror_dir, exist_ok=True)
+            mirror = Repo.clone_from(
+                repo_url, path, bare=True, multi_options=["--filter=blob:none"]
+            )
+            # Bare clones have no fetch refspec; later fetches update the branches
+            mirror.git.config("remote.origin.fetch", MIRROR_REFSPEC)
+
+        sha = mirror.git.rev_parse("HEAD")
+        mirror.git.worktree("add", "--detach", dest, sha)
+        # Marks the mirror as used for prune_mirrors
+        os.utime(path)
+        return sha
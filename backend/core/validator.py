@@ -5,3 +5,17 @@ def validate(code):
         if f in code:
             return False, f
     return True, None
+
+def validate_file(path, block_size=1024 * 1024):
+    """validate() for a file, reading it in blocks so memory stays flat."""
+    overlap = max(len(f) for f in FORBIDDEN) - 1
+    tail = ""
+    with open(path, "r", encoding="utf-8") as fh:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                return True, None
+            ok, reason = validate(tail + block)
+            if not ok:
+                return ok, reason
+            tail = (tail + block)[-overlap:]
@@ -0,0 +1,243 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config.settings import WORKSPACE_DIR, WORKSPACE_TTL_HOURS, WORKSPACE_QUOTA_MB
+from core.metrics import WORKSPACES, WORKSPACE_BYTES, WORKSPACE_EVICTIONS
+
+WORKSPACE_PREFIX = "az2gcp_"
+# Untracked workspaces written to more recently than this may belong to a
+# migration running in another process, and are left alone by adopt()
+ADOPT_MIN_IDLE = 3600
+
+
+def _scan(path):
+    """(bytes used, newest modification time) of the files under `path`, symlinks not followed."""
+    total = 0
+    newest = os.lstat(path).st_mtime
+    for base, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(base, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+def disk_usage(path):
+    """Bytes used by the files under `path` (symlinks not followed)."""
+    return _scan(path)[0]
+
+
+@dataclass
+class Workspace:
+    path: str
+    created_at: float
+    last_used: float
+    size: int = 0
+    # Migrations or downloads currently using it; busy workspaces are never deleted
+    users: int = 0
+    # Requests it was handed to (see share); deleted once all have downloaded it
+    clients: int = 1
+    shared: bool = False
+
+    @property
+    def id(self):
+        return os.path.basename(self.path)
+
+
+class WorkspaceManager:
+    """
+    Tracks the az2gcp_* workspaces under `root` and deletes them once idle
+    for `ttl` seconds, or, least recently used first, whenever together
+    they take more than `quota` bytes. Sizes are measured when a workspace
+    is released, so collecting never has to walk the disk.
+    """
+
+    def __init__(self, root=None, ttl=WORKSPACE_TTL_HOURS * 3600,
+                 quota=WORKSPACE_QUOTA_MB * 1024 * 1024, clock=time.time):
+        self.root = root
+        self.ttl = ttl
+        self.quota = quota
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        """
+        Make a new workspace and return its path. It starts out in use;
+        the caller releases it once it has been filled in.
+        """
+        self.collect()
+        root = self.root or tempfile.gettempdir()
+        os.makedirs(root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=root)
+        now = self._clock()
+        with self._lock:
+            self._entries[path] = Workspace(path, now, now, users=1)
+            self._update_gauges()
+        return path
+
+    def adopt(self, min_idle=ADOPT_MIN_IDLE):
+        """
+        Start tracking workspaces left under `root` by an earlier process,
+        as last used when anything in them was last modified. Only done with
+        a dedicated `root`, and only for workspaces untouched for `min_idle`
+        seconds, so other processes' live workspaces are never taken over.
+        Returns how many were found.
+        """
+        root = self.root
+        if root is None:
+            return 0
+        now = self._clock()
+        try:
+            names = [n for n in os.listdir(root) if n.startswith(WORKSPACE_PREFIX)]
+        except OSError:
+            return 0
+        found = 0
+        for name in names:
+            path = os.path.join(root, name)
+            with self._lock:
+                if path in self._entries:
+                    continue
+            try:
+                if not os.path.isdir(path) or os.path.islink(path):
+                    continue
+                size, mtime = _scan(path)
+            except OSError:
+                continue
+            if now - mtime < min_idle:
+                continue
+            workspace = Workspace(path, mtime, mtime, size)
+            with self._lock:
+                self._entries.setdefault(path, workspace)
+                self._update_gauges()
+            found += 1
+        return found
+
+    def get(self, workspace_id):
+        """Path of a tracked workspace by its id (directory name), or None."""
+        with self._lock:
+            for workspace in self._entries.values():
+                if workspace.id == workspace_id:
+                    return workspace.path
+        return None
+
+    def acquire(self, path):
+        """Mark a workspace as in use. Returns False if it isn't tracked (any more)."""
+        with self._lock:
+            workspace = self._entries.get(path)
+            if workspace is None:
+                return False
+            workspace.users += 1
+            workspace.last_used = self._clock()
+            return True
+
+    def release(self, path, measure=True):
+        """Mark a workspace as no longer used by the caller, recording its size."""
+        size = disk_usage(path) if measure and os.path.isdir(path) else None
+        with self._lock:
+            workspace = self._entries.get(path)
+            if workspace is None:
+                return
+            workspace.users = max(0, workspace.users - 1)
+            workspace.last_used = self._clock()
+            if size is not None:
+                workspace.size = size
+            self._update_gauges()
+
+    @contextmanager
+    def using(self, path):
+        """Keep a workspace from being collected while the block runs."""
+        if not self.acquire(path):
+            raise FileNotFoundError(f"Workspace not found: {path}")
+        try:
+            yield path
+        finally:
+            self.release(path, measure=False)
+
+    def share(self, path, clients):
+        """
+        Record that a workspace was handed to `clients` requests, such as
+        identical migrations that shared one run. Only the first call counts.
+        """
+        with self._lock:
+            workspace = self._entries.get(path)
+            if workspace is not None and not workspace.shared:
+                workspace.clients = clients
+                workspace.shared = True
+
+    def downloaded(self, path):
+        """
+        Count one client's download of a workspace and delete it after the
+        last client's. Returns whether it was deleted.
+        """
+        with self._lock:
+            workspace = self._entries.get(path)
+            if workspace is None:
+                return False
+            workspace.clients -= 1
+            if workspace.clients > 0:
+                return False
+        self.remove(path, reason="download")
+        return True
+
+    def remove(self, path, reason=None):
+        """Stop tracking a workspace and delete it from disk."""
+        with self._lock:
+            workspace = self._entries.pop(path, None)
+            self._update_gauges()
+        if workspace is not None and reason:
+            WORKSPACE_EVICTIONS.inc(reason=reason)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def collect(self):
+        """
+        Delete idle workspaces past their TTL, then the least recently used
+        idle ones until the rest fit in the quota. Returns the removed paths.
+        """
+        now = self._clock()
+        doomed = []
+        with self._lock:
+            idle = sorted(
+                (w for w in self._entries.values() if w.users == 0), key=lambda w: w.last_used
+            )
+            total = sum(w.size for w in self._entries.values())
+            for workspace in idle:
+                if now - workspace.last_used > self.ttl:
+                    reason = "ttl"
+                elif total > self.quota:
+                    reason = "quota"
+                else:
+                    continue
+                doomed.append((workspace.path, reason))
+                total -= workspace.size
+        for path, reason in doomed:
+            self.remove(path, reason)
+        return [path for path, _ in doomed]
+
+    def usage(self):
+        """Counts and sizes for reporting, as last measured."""
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "workspaces": len(entries),
+            "in_use": sum(1 for w in entries if w.users),
+            "bytes": sum(w.size for w in entries),
+            "quota_bytes": self.quota,
+            "ttl_seconds": self.ttl,
+            "oldest_last_used": min((w.last_used for w in entries), default=None),
+        }
+
+    def _update_gauges(self):
+        WORKSPACES.set(len(self._entries))
+        WORKSPACE_BYTES.set(sum(w.size for w in self._entries.values()))
+
+
+workspaces = WorkspaceManager(WORKSPACE_DIR)
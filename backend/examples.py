@@ -10,6 +10,12 @@ from pathlib import Path
 # Add backend to path
 sys.path.insert(0, os.path.dirname(__file__))
 
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    # Must run before anything imports config.settings
+    load_dotenv()
+
 from main import migrate
 
 
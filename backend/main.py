@@ -1,68 +1,104 @@
 import os
 import shutil
+import time
+import uuid
 
-from core.source_loader import load_source
-from core.detector import detect_azure_services
-from core.rewriter import rewrite_new, generate_migration_suggestions
-from core.validator import validate
-from utils.fs_utils import iter_files, is_text_file
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    # Must run before anything imports config.settings
+    load_dotenv()
+
+from config.settings import INCREMENTAL_MIGRATION
+from core.source_loader import load_source, resolve_commit
+from core.manifest import Manifest, manifest_key
+from core.metrics import STAGE_SECONDS, MIGRATIONS_IN_FLIGHT
+from core.pipeline import run_pipeline
+from core.prompts import prompt_fingerprint
+from core.rewriter import MODEL_ID, rewrite_cache
+from core.workspaces import workspaces
 from utils.report import MigrationReport
 
 OUTPUT_DIR = "output"
 
-def migrate(source, include_suggestions=False):
+
+def reports_dir():
+    """Directory of the per-run JSON Lines reports (pruned by the server; see prune_reports)."""
+    return os.path.join(OUTPUT_DIR, "reports")
+
+
+def report_path():
+    """Where a new run's JSON Lines report goes: one file per run under reports_dir()."""
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+    return os.path.join(reports_dir(), name)
+
+
+def migrate(source, include_suggestions=False, workers=None, progress=None, incremental=None):
     """
     Migrate Azure code to GCP.
     
     Args:
         source: Path to zip file or Git URL
         include_suggestions: If True, adds migration suggestion comments to files
+        workers: Number of files rewritten concurrently (defaults to REWRITE_WORKERS)
+        progress: Optional callback receiving per-file progress events
+        incremental: If True, reuse outputs of a previous run for unchanged files
+            (defaults to INCREMENTAL_MIGRATION)
 
     """
     print("source",source)
-    workspace = load_source(source)
-    report = MigrationReport()
+    with MIGRATIONS_IN_FLIGHT.track():
+        with STAGE_SECONDS.time(stage="load_source"):
+            workspace = load_source(source)
+        try:
+            return _migrate(source, workspace, include_suggestions, workers, progress, incremental)
+        finally:
+            # Records its size and lets it be collected once idle
+            workspaces.release(workspace)
 
-    for path in iter_files(workspace):
-        if not is_text_file(path):
-            continue
 
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read()
-                # print(content)
-        except Exception:
-            continue
-
-        services = detect_azure_services(content)
-        services.append(1)
-        print(services)
-        if not services:
-            report.add(path, "No Azure dependency")
-            continue
-        tc=0
-        linelist=content.split("\n")
-        for l in linelist:
-            tc+=len(l.split(" "))
-        print("caLLAI",tc)
-        rewritten = rewrite_new(path, content)
-        
-        # Add migration suggestions as comments if requested
-        if include_suggestions:
-            suggestions = generate_migration_suggestions(path, content)
-            rewritten += suggestions
-        
-        ok, reason = validate(rewritten)
-
-        with open(path + ".azure.bak", "w", encoding="utf-8") as f:
-            f.write(content)
-
-        if ok:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(rewritten)
-            report.add(path, "Converted" + (" (with suggestions)" if include_suggestions else ""))
-        else:
-            report.add(path, f"FAILED ({reason})")
+def _migrate(source, workspace, include_suggestions, workers, progress, incremental):
+    if progress is not None:
+        progress({"type": "workspace", "workspace": workspace})
+
+    incremental = INCREMENTAL_MIGRATION if incremental is None else incremental
+    key = manifest_key(source)
+    commit = resolve_commit(workspace)
+    report = MigrationReport(
+        report_path(), source=key, commit=commit, model=MODEL_ID, prompts=prompt_fingerprint(),
+        include_suggestions=include_suggestions, incremental=incremental,
+    )
+
+    def on_event(event):
+        # Files go into the JSON Lines report as they finish
+        if event["type"] == "file":
+            report.record(event)
+        if progress is not None:
+            progress(event)
+
+    cache_before = rewrite_cache.stats()
+    manifest = None
+    unchanged = set()
+    try:
+        if incremental:
+            manifest = Manifest(key, include_suggestions)
+            unchanged = manifest.unchanged_files(workspace, commit)
+
+        for path, status in run_pipeline(workspace, include_suggestions, workers, on_event,
+                                         manifest=manifest, unchanged=unchanged):
+            report.add(path, status)
+    except BaseException as e:
+        report.close(status="failed", error=str(e))
+        raise
+
+    if manifest is not None:
+        manifest.save()
+
+    cache_after = rewrite_cache.stats()
+    cache_stats = {k: cache_after[k] - cache_before[k] for k in ("hits", "misses", "evictions")}
+    print(f"Rewrite cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['evictions']} evictions")
+    summary = report.close(status="completed", cache=cache_stats)
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     print("test",OUTPUT_DIR)
@@ -75,7 +111,10 @@ def migrate(source, include_suggestions=False):
     
     return {
         "workspace": workspace,
-        "report": report_content
+        "report": report_content,
+        "report_file": report.path,
+        "summary": summary,
+        "cache": cache_stats,
     }
 
 if __name__ == "__main__":
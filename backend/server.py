@@ -1,15 +1,90 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import functools
+import json
 import os
 import shutil
 import tempfile
 import zipfile
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# Must run before anything imports config.settings
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from config.settings import (
+    JOB_WORKERS, SYNC_MIGRATION_WORKERS, IO_WORKERS, UPLOAD_MAX_MB, UPLOAD_CHUNK_KB,
+    WORKSPACE_DELETE_ON_DOWNLOAD, GC_INTERVAL_SECONDS, MIRROR_TTL_DAYS, MANIFEST_TTL_DAYS,
+    REPORT_TTL_DAYS,
+)
+from core.artifacts import stream_zip
+from core.jobs import JobManager, COMPLETED, FAILED
+from core.manifest import prune_manifests
+from core.metrics import REGISTRY
+from core.singleflight import SingleFlight, migration_key
+from core.source_loader import prune_mirrors
+from core.workspaces import workspaces
+from main import migrate, reports_dir
+from utils.report import prune_reports
+
+# Blocking work never runs on the event loop: migrations requested through
+# /migrate/* and file I/O each get their own pool
+migration_pool = ThreadPoolExecutor(SYNC_MIGRATION_WORKERS, thread_name_prefix="migrate")
+io_pool = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io")
+
+
+def collect_garbage():
+    """
+    Delete expired or over-quota workspaces, Git mirrors and manifests no
+    run has used lately, and old run reports. Workspaces other processes
+    left behind are adopted first, once idle long enough.
+    """
+    workspaces.adopt()
+    removed = workspaces.collect()
+    mirrors = prune_mirrors(MIRROR_TTL_DAYS * 86400)
+    manifests = prune_manifests(MANIFEST_TTL_DAYS * 86400)
+    reports = prune_reports(REPORT_TTL_DAYS * 86400, reports_dir())
+    return {"workspaces": len(removed), "mirrors": mirrors, "manifests": manifests, "reports": reports}
 
-from main import migrate
 
-app = FastAPI()
+async def _collect_periodically():
+    while True:
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+        try:
+            await _run_in(io_pool, collect_garbage)
+        except Exception as e:
+            print(f"Garbage collection failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Workspaces of a previous server process are collected like any other
+    await _run_in(io_pool, workspaces.adopt)
+    collector = asyncio.create_task(_collect_periodically())
+    yield
+    collector.cancel()
+    jobs.shutdown(wait=False)
+    migration_pool.shutdown(wait=False, cancel_futures=True)
+    io_pool.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+jobs = JobManager(migrate, max_workers=JOB_WORKERS)
+# Identical /migrate/* requests in flight share one run
+flights = SingleFlight()
+
+SSE_POLL_INTERVAL = 0.2
+SSE_KEEPALIVE = 15
+UPLOAD_MAX_BYTES = UPLOAD_MAX_MB * 1024 * 1024
+UPLOAD_CHUNK_BYTES = UPLOAD_CHUNK_KB * 1024
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,67 +98,363 @@ class MigrationRequest(BaseModel):
     source_url: str
     include_suggestions: bool = False
 
+def _run_in(pool, fn, *args, **kwargs):
+    """Run a blocking call on `pool` and return an awaitable for its result."""
+    return asyncio.get_running_loop().run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+class _UploadParser:
+    """
+    Push parser for a multipart/form-data body that keeps the bytes of its
+    "file" field and drops every other field.
+    """
+
+    def __init__(self, boundary):
+        self.filename = None
+        self._field = b""
+        self._value = b""
+        self._headers = {}
+        self._in_file = False
+        self._data = []
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._add("_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._add("_value", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _add(self, name, data):
+        setattr(self, name, getattr(self, name) + data)
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self._in_file = options.get(b"name") == b"file" and self.filename is None
+        if self._in_file:
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace") or "upload.zip"
+
+    def _part_data(self, data, start, end):
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _part_end(self):
+        self._in_file = False
+
+    def feed(self, chunk):
+        """Parse the next piece of the body; returns the file bytes it contained."""
+        self._parser.write(chunk)
+        data, self._data = b"".join(self._data), []
+        return data
+
+
+async def _save_upload(request, temp_dir):
+    """
+    Stream the ZIP sent as the "file" field of a multipart/form-data body
+    into `temp_dir`, writing UPLOAD_CHUNK_BYTES at a time on the I/O pool,
+    and return its path. Bodies over UPLOAD_MAX_BYTES are rejected with a
+    413 before anything is read when Content-Length says so, and otherwise
+    as soon as the limit is crossed.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Upload larger than {UPLOAD_MAX_MB} MB")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES:
+        raise too_large
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Upload must be multipart/form-data with a file field")
+
+    parser = _UploadParser(options[b"boundary"])
+    file_path = os.path.join(temp_dir, "upload.zip")
+    buffer = await _run_in(io_pool, open, file_path, "wb")
+    received = 0
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > UPLOAD_MAX_BYTES:
+                raise too_large
+            pending += parser.feed(chunk)
+            if len(pending) >= UPLOAD_CHUNK_BYTES:
+                await _run_in(io_pool, buffer.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await _run_in(io_pool, buffer.write, bytes(pending))
+    finally:
+        await _run_in(io_pool, buffer.close)
+
+    if parser.filename is None:
+        raise HTTPException(status_code=400, detail="No file field in the upload")
+    # The name is kept: ZIP sources are identified across runs by it
+    name = os.path.basename(parser.filename.replace("\\", "/"))
+    named = os.path.join(temp_dir, name if name not in ("", ".", "..") else "upload.zip")
+    if named != file_path:
+        await _run_in(io_pool, os.replace, file_path, named)
+    if not await _run_in(io_pool, zipfile.is_zipfile, named):
+        raise HTTPException(status_code=400, detail="Uploaded file must be a valid ZIP file")
+    return named
+
+def _with_download(result):
+    """Add the URL the migrated workspace can be downloaded from to a migrate() result."""
+    return {**result, "download": f"/workspaces/{os.path.basename(result['workspace'])}/download"}
+
+def _download(workspace, diff_only, keep):
+    """
+    stream_zip(), keeping the workspace alive meanwhile. Once fully sent it
+    counts as downloaded, and is deleted after every request it was handed
+    to has downloaded it (see WorkspaceManager.share).
+    """
+    with workspaces.using(workspace):
+        yield from stream_zip(workspace, diff_only)
+    if WORKSPACE_DELETE_ON_DOWNLOAD and not keep:
+        workspaces.downloaded(workspace)
+
+def _zip_response(workspace, diff_only, keep, name):
+    # A sync generator: Starlette reads it on its threadpool, off the event loop
+    return StreamingResponse(
+        _download(workspace, diff_only, keep),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}.zip"'},
+    )
+
+async def _migrate_once(source, include_suggestions):
+    """
+    migrate() on the migration pool. A request identical to one already
+    running (see migration_key) waits for that run and gets its result.
+    The workspace is then only deleted on download once every such request
+    has downloaded it.
+    """
+    key = await _run_in(io_pool, migration_key, source, include_suggestions)
+    future, _ = flights.run(
+        key, lambda: migration_pool.submit(migrate, source, include_suggestions=include_suggestions)
+    )
+    result = await asyncio.wrap_future(future)
+    workspaces.share(result["workspace"], getattr(future, "callers", 1))
+    return result
+
 @app.get("/")
-def health_check():
+async def health_check():
     # print("test")
     return {"status": "ok", "service": "Azure to GCP Migration Backend"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage timings, counters and in-flight gauges in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/pgs")
-def get_pgs(request: Request):
+async def get_pgs(request: Request):
     # print(dict(request.query_params))
     return {"message": "testSer is running"}
 
 @app.post("/migrate/url")
-def migrate_url(request: MigrationRequest):
+async def migrate_url(request: MigrationRequest):
     """
     Migrate from a Git repository URL.
     Accepts GitHub URLs (e.g., https://github.com/user/repo or https://github.com/user/repo.git)
     """
-    temp_dirs = []
     try:
         # Validate URL format
         if not request.source_url.startswith("http"):
             raise ValueError("Invalid URL format. Must be a valid Git repository URL.")
         
-        result = migrate(request.source_url, include_suggestions=request.include_suggestions)
-        return result
+        result = await _migrate_once(request.source_url, request.include_suggestions)
+        return _with_download(result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Migration failed: {str(e)}")
-    finally:
-        # Cleanup any temporary directories created during migration
-        for temp_dir in temp_dirs:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
 
 @app.post("/migrate/file")
-async def migrate_file(file: UploadFile = File(...), include_suggestions: bool = False):
+async def migrate_file(request: Request, include_suggestions: bool = False):
     """
-    Migrate from an uploaded ZIP file.
+    Migrate from a ZIP file uploaded as the "file" field of a multipart form.
     """
-    # Create a temp directory
-    temp_dir = tempfile.mkdtemp()
-    file_path = os.path.join(temp_dir, file.filename)
-    print("ogck",file_path)
+    temp_dir = await _run_in(io_pool, tempfile.mkdtemp)
     try:
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            # f=open(f"")
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Verify it's a zip file
-        # print(file_path)
-        if not zipfile.is_zipfile(file_path):
-            raise ValueError("Uploaded file must be a valid ZIP file")
-            
-        result = migrate(file_path, include_suggestions=include_suggestions)
-        return result
+        file_path = await _save_upload(request, temp_dir)
+        result = await _migrate_once(file_path, include_suggestions)
+        return _with_download(result)
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         # Cleanup temp directory
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        await _run_in(io_pool, shutil.rmtree, temp_dir, ignore_errors=True)
+
+
+@app.post("/jobs/url", status_code=202)
+async def submit_url_job(request: MigrationRequest):
+    """
+    Queue a migration of a Git repository URL and return its job id immediately.
+    Poll GET /jobs/{job_id} for progress and GET /jobs/{job_id}/report for the result.
+    If the same migration is already queued or running, its job is returned.
+    """
+    if not request.source_url.startswith("http"):
+        raise HTTPException(status_code=400, detail="Invalid URL format. Must be a valid Git repository URL.")
+
+    key = await _run_in(io_pool, migration_key, request.source_url, request.include_suggestions)
+    job = jobs.submit(request.source_url, include_suggestions=request.include_suggestions, key=key)
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/jobs/file", status_code=202)
+async def submit_file_job(request: Request, include_suggestions: bool = False):
+    """
+    Queue a migration of an uploaded ZIP file (sent as for /migrate/file) and
+    return its job id immediately. The upload is kept until the job has
+    finished with it.
+    """
+    temp_dir = await _run_in(io_pool, tempfile.mkdtemp)
+    try:
+        file_path = await _save_upload(request, temp_dir)
+    except Exception as e:
+        await _run_in(io_pool, shutil.rmtree, temp_dir, ignore_errors=True)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=str(e))
+
+    key = await _run_in(io_pool, migration_key, file_path, include_suggestions)
+    job = jobs.submit(
+        file_path,
+        include_suggestions=include_suggestions,
+        cleanup=lambda: shutil.rmtree(temp_dir, ignore_errors=True),
+        key=key,
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs")
+async def list_jobs():
+    return [
+        {"job_id": j["job_id"], "status": j["status"], "source": j["source"]}
+        for j in (job.snapshot() for job in jobs.list())
+    ]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return job status and per-file progress."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/report")
+async def get_job_report(job_id: str):
+    """Return the final migration result once the job has completed."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=f"Migration failed: {job.error}")
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+@app.get("/jobs/{job_id}/download")
+async def download_job_output(job_id: str, diff_only: bool = False, keep: bool = False):
+    """
+    Stream a completed job's migrated tree as a ZIP built on the fly. With
+    diff_only, only rewritten files and their .azure.bak originals are sent.
+    The workspace is deleted once the whole archive has been sent to every
+    submission attached to the job, unless `keep` is set (or
+    WORKSPACE_DELETE_ON_DOWNLOAD is off).
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if not job.workspace or workspaces.get(os.path.basename(job.workspace)) is None:
+        raise HTTPException(status_code=410, detail="Workspace no longer available")
+    workspaces.share(job.workspace, job.requests)
+    return _zip_response(job.workspace, diff_only, keep, f"migration-{job.id}")
+
+@app.get("/workspaces")
+async def workspace_usage():
+    """Number, disk use and limits of the workspaces kept on this server."""
+    return workspaces.usage()
+
+@app.get("/workspaces/{workspace_id}/download")
+async def download_workspace(workspace_id: str, diff_only: bool = False, keep: bool = False):
+    """Like GET /jobs/{job_id}/download, for the workspace of a /migrate/* request."""
+    workspace = workspaces.get(workspace_id)
+    if workspace is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    return _zip_response(workspace, diff_only, keep, workspace_id)
+
+async def _job_events(job, first_event=None):
+    """
+    Yield a job's progress as Server-Sent Events, replaying anything already
+    recorded, until its final "done" event. Streaming progress is sent as
+    "chunk" events with the latest count of each file that has moved on.
+    Comment lines are sent while idle so proxies don't close the connection.
+    """
+    if first_event is not None:
+        yield f"event: {first_event['type']}\ndata: {json.dumps(first_event)}\n\n"
+
+    index = 0
+    idle = 0.0
+    sent = {}
+    while True:
+        for name, chars in job.streamed().items():
+            if sent.get(name) != chars:
+                sent[name] = chars
+                chunk = {"type": "chunk", "file": name, "chars": chars}
+                yield f"event: chunk\ndata: {json.dumps(chunk)}\n\n"
+        events = job.events_since(index)
+        index += len(events)
+        for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if event["type"] == "done":
+                return
+        if events:
+            idle = 0.0
+            continue
+
+        await asyncio.sleep(SSE_POLL_INTERVAL)
+        idle += SSE_POLL_INTERVAL
+        if idle >= SSE_KEEPALIVE:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+
+def _sse_response(generator):
+    return StreamingResponse(
+        generator,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream per-file events (detected, rewritten, file, done) for a job as
+    Server-Sent Events. Late subscribers receive the events they missed first.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _sse_response(_job_events(job))
+
+@app.post("/migrate/stream")
+async def migrate_stream(request: MigrationRequest):
+    """
+    Migrate a Git repository URL and stream results as Server-Sent Events.
+    The first event carries the job id, so clients can reconnect through
+    GET /jobs/{job_id}/events or fetch the report later.
+    """
+    if not request.source_url.startswith("http"):
+        raise HTTPException(status_code=400, detail="Invalid URL format. Must be a valid Git repository URL.")
+
+    key = await _run_in(io_pool, migration_key, request.source_url, request.include_suggestions)
+    job = jobs.submit(request.source_url, include_suggestions=request.include_suggestions, key=key)
+    return _sse_response(_job_events(job, {"type": "job", "job_id": job.id}))
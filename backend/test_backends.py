@@ -0,0 +1,93 @@
+"""
+Tests for the LLM backends, using the local stand-in server from benchmarks/.
+"""
+
+import threading
+
+import pytest
+
+import core.pipeline as pipeline
+import core.rewriter as rewriter
+from benchmarks.stub_llm_server import StubLLMServer
+from core.backends import BackendError, HTTPBackend, create_backend
+from core.ratelimit import RateLimiter
+from test_pipeline import _make_workspace
+
+
+@pytest.fixture
+def stub():
+    server = StubLLMServer(latency=0.01).start()
+    yield server
+    server.stop()
+
+
+def test_http_backend_reuses_pooled_connections(stub):
+    backend = HTTPBackend(stub.url, "stub", pool_size=4)
+    results = []
+
+    def worker():
+        for _ in range(5):
+            results.append(backend.generate("prompt", "import azure.functions as func\n"))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    backend.close()
+
+    assert results == ["import functions_framework as func\n"] * 20
+    assert stub.requests == 20
+    assert stub.connections <= 4
+
+
+def test_http_errors_carry_their_status(stub):
+    stub.throttle_every = 1
+    backend = HTTPBackend(stub.url, "stub")
+    with pytest.raises(BackendError) as e:
+        backend.generate("prompt", "code")
+    assert e.value.status_code == 429
+    backend.close()
+
+
+def test_pipeline_runs_through_the_http_backend(stub, monkeypatch):
+    stub.throttle_every = 7
+    backend = HTTPBackend(stub.url, "stub", pool_size=8)
+    monkeypatch.setattr(rewriter, "backend", backend)
+    monkeypatch.setattr(rewriter, "limiter", RateLimiter(max_concurrency=8, backoff=0.01))
+    monkeypatch.setattr(pipeline, "rewrite_new", rewriter.rewrite_new)
+
+    results = pipeline.run_pipeline(_make_workspace(40), workers=8, batch_tokens=0)
+    backend.close()
+
+    assert all(s == "Converted" for p, s in results if p.endswith("__init__.py"))
+    assert stub.connections <= 8
+
+
+def test_create_backend_validates_its_settings():
+    assert create_backend("gemini", model_name="m").name == "gemini"
+    with pytest.raises(ValueError):
+        create_backend("http", model_name="m")
+    with pytest.raises(ValueError):
+        create_backend("carrier-pigeon", model_name="m")
+
+
+def test_http_backend_streams_pieces(stub):
+    backend = HTTPBackend(stub.url, "stub")
+    code = "import azure.functions as func\n\ndef main(req):\n    return 1\n"
+    pieces = list(backend.stream("prompt", code))
+    backend.close()
+    assert len(pieces) == 4
+    assert "".join(pieces) == code.replace("azure.functions", "functions_framework")
+
+
+def test_limiter_retries_streams_that_fail_before_the_first_piece(stub):
+    stub.throttle_every = 2
+    backend = HTTPBackend(stub.url, "stub")
+    limiter = RateLimiter(backoff=0.01)
+    stub.requests = 1  # the next request is throttled
+    text = "".join(limiter.stream(lambda: backend.stream("prompt", "x = 1\n")))
+    backend.close()
+    assert text == "x = 1\n"
+    assert limiter.stats()["retries"] == 1
+    assert limiter.stats()["in_flight"] == 0
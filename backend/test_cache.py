@@ -0,0 +1,116 @@
+"""
+Tests for the on-disk model response cache.
+"""
+
+import tempfile
+
+import core.rewriter as rewriter
+from core.cache import RewriteCache
+
+
+class FakeBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, content):
+        self.calls += 1
+        return f"converted = {len(content)}\n"
+
+
+def test_cache_hit_miss_and_persistence():
+    directory = tempfile.mkdtemp()
+    cache = RewriteCache(directory, max_bytes=1024)
+    key = RewriteCache.key("model-a", "prompt", "content")
+
+    assert cache.get(key) is None
+    cache.put(key, "converted")
+    assert cache.get(key) == "converted"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # A fresh instance sees entries written by a previous run
+    assert RewriteCache(directory, max_bytes=1024).get(key) == "converted"
+
+    # Any change of model, prompt or content produces a different key
+    assert key != RewriteCache.key("model-b", "prompt", "content")
+    assert key != RewriteCache.key("model-a", "prompt2", "content")
+    assert key != RewriteCache.key("model-a", "prompt", "content2")
+
+
+def test_cache_evicts_least_recently_used():
+    cache = RewriteCache(tempfile.mkdtemp(), max_bytes=250)
+    for name in ("a", "b"):
+        cache.put(name * 64, name * 100)
+    cache.get("a" * 64)              # "a" is now the most recently used
+    cache.put("c" * 64, "c" * 100)   # pushes the total over the limit
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == "a" * 100
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_rewriter_serves_repeated_files_from_cache(monkeypatch):
+    fake = FakeBackend()
+    monkeypatch.setattr(rewriter, "backend", fake)
+    monkeypatch.setattr(rewriter, "rewrite_cache", RewriteCache(tempfile.mkdtemp(), 1024 * 1024))
+
+    first = rewriter.rewrite_new("handler.py", "import azure.functions")
+    second = rewriter.rewrite_new("handler.py", "import azure.functions")
+    rewriter.rewrite_new("handler.py", "import azure.cosmos")
+
+    assert first == second
+    assert fake.calls == 2
+
+
+def test_cache_sees_entries_written_by_another_process():
+    directory = tempfile.mkdtemp()
+    reader = RewriteCache(directory, max_bytes=1024)
+    writer = RewriteCache(directory, max_bytes=1024)
+    key = RewriteCache.key("model-a", "prompt", "content")
+
+    assert reader.get(key) is None          # indexes the (empty) directory
+    writer.put(key, "converted")
+    assert reader.get(key) == "converted"
+    assert reader.stats()["entries"] == 1
+
+
+def test_answers_that_fail_validation_are_asked_for_again(monkeypatch):
+    import core.source_loader
+    import main
+    from test_migration_agent import SAMPLE_AZURE_FUNCTION
+    from test_source_loader import _local_repo
+
+    answers = ["import azure.functions as func\n", "import functions_framework\n"]
+
+    class ScriptedBackend:
+        calls = 0
+
+        def generate(self, prompt, content):
+            self.calls += 1
+            return answers[self.calls - 1]
+
+    backend = ScriptedBackend()
+    monkeypatch.setattr(rewriter, "backend", backend)
+    monkeypatch.setattr(core.source_loader, "ALLOW_LOCAL_GIT", True)
+    _, url = _local_repo({"main.py": SAMPLE_AZURE_FUNCTION})
+
+    assert "FAILED (azure.functions)" in main.migrate(url)["report"]
+    assert "main.py: Converted" in main.migrate(url)["report"]
+    assert backend.calls == 2
+    # The answer that passed is kept
+    main.migrate(url, incremental=False)
+    assert backend.calls == 2
+
+
+def test_comment_only_answers_are_not_cached(monkeypatch):
+    class GiveUpBackend(FakeBackend):
+        def generate(self, prompt, content):
+            self.calls += 1
+            return "# Conversion is not possible: unsupported trigger\n"
+
+    fake = GiveUpBackend()
+    monkeypatch.setattr(rewriter, "backend", fake)
+
+    rewriter.rewrite_new("handler.py", "import azure.functions")
+    rewriter.rewrite_new("handler.py", "import azure.functions")
+    assert fake.calls == 2
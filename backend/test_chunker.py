@@ -0,0 +1,172 @@
+"""
+Tests for the syntax-aware chunker.
+"""
+
+import ast
+
+from core.chunker import chunk_code, estimate_tokens, merge_chunk_outputs, split_definitions
+from test_migration_agent import SAMPLE_TYPESCRIPT
+
+PY_HEADER = "import azure.functions as func\nimport json\n\napp = func.FunctionApp()\n\n"
+
+PY_FUNCTION = '''
+# handler {i}
+@app.route(route="items/{i}")
+def handler_{i}(req: func.HttpRequest) -> func.HttpResponse:
+    body = req.get_json()
+    values = [body.get(str(n)) for n in range(100)]
+    return func.HttpResponse(json.dumps(values), status_code=200)
+'''
+
+
+def _python_module(n):
+    return PY_HEADER + "".join(PY_FUNCTION.format(i=i) for i in range(n))
+
+
+def test_python_chunks_split_between_definitions():
+    content = _python_module(30)
+    chunks = chunk_code(content, max_tokens=400, filename="function_app.py")
+    preamble, _ = split_definitions("function_app.py", content)
+
+    assert preamble.startswith(PY_HEADER)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith(preamble)
+        assert estimate_tokens(chunk) <= 400
+        ast.parse(chunk)  # every chunk is valid Python on its own
+    # Nothing is lost or duplicated apart from the shared header
+    body = "".join(c[len(preamble):] for c in chunks)
+    assert preamble + body == content
+
+
+def test_small_files_are_not_split():
+    content = _python_module(2)
+    assert chunk_code(content, max_tokens=8000, filename="function_app.py") == [content]
+
+
+def test_brace_languages_split_on_top_level_blocks():
+    content = SAMPLE_TYPESCRIPT + "\n".join(
+        f"export function helper{i}() {{\n    const s = \"}}\"; // {{\n    return {i};\n}}\n" for i in range(3)
+    )
+    preamble, units = split_definitions("http_trigger.ts", content)
+
+    assert "@azure/functions" in preamble
+    assert len(units) == 4
+    assert units[0].lstrip().startswith("export async function httpTrigger")
+    assert all(u.rstrip().endswith("}") for u in units)
+
+
+def test_oversized_definitions_fall_back_to_lines():
+    content = PY_HEADER + "def big():\n" + "    x = 1\n" * 2000
+    chunks = chunk_code(content, max_tokens=500, filename="big.py")
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 500 for c in chunks)
+
+
+def test_merge_chunk_outputs_drops_repeated_imports():
+    merged = merge_chunk_outputs([
+        "import functions_framework\nfrom google.cloud import storage\n\ndef a():\n    import os\n",
+        "import functions_framework\n\ndef b():\n    import os\n",
+    ])
+    assert merged.count("import functions_framework") == 1
+    assert merged.count("    import os") == 2
+
+
+def test_rewrite_new_sends_large_files_in_chunks(monkeypatch):
+    import core.rewriter as rewriter
+    from core.cache import RewriteCache
+
+    calls = []
+
+    class EchoBackend:
+        def generate(self, prompt, content):
+            calls.append((prompt, content))
+            return content
+
+    monkeypatch.setattr(rewriter, "backend", EchoBackend())
+    monkeypatch.setattr(rewriter, "rewrite_cache", RewriteCache("", 0, enabled=False))
+    monkeypatch.setattr(rewriter, "chunk_code",
+                        lambda content, filename="": chunk_code(content, 400, filename))
+
+    content = _python_module(30)
+    merged = rewriter.rewrite_new("function_app.py", content)
+
+    assert len(calls) > 1
+    assert "part 1 of" in calls[0][0]
+    assert merged.count("import azure.functions as func") == 1
+    assert merged.count("def handler_") == 30
+
+
+CS_HEADER = "using System;\nusing Azure.Storage.Blobs;\n\nnamespace Contoso.Functions\n{\n    public class Handlers\n    {\n"
+
+
+def _csharp_class(n):
+    methods = "".join(
+        f"        public void M{i}()\n        {{\n"
+        f"            var s = \"{{ not a brace }}\";\n"
+        + "            Console.WriteLine(s);\n" * 8
+        + "        }\n\n"
+        for i in range(n)
+    )
+    return CS_HEADER + "        private int count;\n\n" + methods + "    }\n}\n"
+
+
+def test_csharp_class_is_split_between_methods():
+    content = _csharp_class(60)
+    chunks = chunk_code(content, max_tokens=2000, filename="Handlers.cs")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk) <= 2000
+        # Every chunk repeats the usings, namespace and class declaration...
+        assert chunk.startswith("using System;")
+        assert "    public class Handlers\n    {\n" in chunk
+        # ...and never ends inside a method
+        assert chunk.rstrip().endswith("}")
+    assert sum(c.count("public void M") for c in chunks) == 60
+
+
+def test_java_class_is_split_between_methods():
+    methods = "".join(
+        f"    public int m{i}() {{\n" + "        int x = 1;\n" * 10 + "        return x;\n    }\n\n"
+        for i in range(40)
+    )
+    content = "package demo;\n\nimport java.util.List;\n\npublic class Big {\n" + methods + "}\n"
+    chunks = chunk_code(content, max_tokens=800, filename="Big.java")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("package demo;") and "public class Big {" in chunk
+        body = chunk.split("public class Big {\n", 1)[1]
+        assert body.lstrip().startswith("public int m")
+        assert chunk.rstrip().endswith("}")
+    assert sum(c.count("public int m") for c in chunks) == 40
+
+
+def test_large_python_class_is_split_between_methods():
+    methods = "".join(
+        f"    def handler_{i}(self, req):\n" + "        value = req.get_json()\n" * 10 + "        return value\n\n"
+        for i in range(40)
+    )
+    content = PY_HEADER + "class Handlers:\n    \"\"\"All handlers.\"\"\"\n\n" + methods
+    chunks = chunk_code(content, max_tokens=800, filename="handlers.py")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith(PY_HEADER)
+        assert "class Handlers:" in chunk
+        ast.parse(chunk)  # methods are never cut in half
+    assert sum(c.count("def handler_") for c in chunks) == 40
+
+
+def test_merge_chunk_stream_matches_merge_chunk_outputs():
+    from core.chunker import merge_chunk_outputs, merge_chunk_stream
+
+    parts = [
+        "import os\nimport json\n\ndef a():\n    return 1\n",
+        "import os\r\nfrom x import y\n\ndef b():\n    return 2",
+        "import json\n\ndef c():\n    pass\n",
+    ]
+    # Feed every part in awkward 3-character pieces
+    pieces = ([p[i:i + 3] for i in range(0, len(p), 3)] for p in parts)
+    assert "".join(merge_chunk_stream(pieces)) == merge_chunk_outputs(parts)
@@ -0,0 +1,53 @@
+"""
+Tests for the single-pass service detector.
+"""
+
+from config.service_map import SERVICE_MAP
+from core.detector import (
+    SINGLE_PASS_MIN_PATTERNS, ServiceMatcher, detect_azure_services, scan_azure_services,
+)
+from test_migration_agent import SAMPLE_AZURE_FUNCTION, SAMPLE_TYPESCRIPT
+
+
+def naive_detect(service_map, content):
+    return [s for s, meta in service_map.items() if any(p in content for p in meta["patterns"])]
+
+
+def test_detector_matches_substring_semantics():
+    for content in (SAMPLE_AZURE_FUNCTION, SAMPLE_TYPESCRIPT, "", "print('hello')"):
+        assert detect_azure_services(content) == naive_detect(SERVICE_MAP, content)
+
+
+def test_detector_reports_overlapping_and_prefix_matches():
+    service_map = {
+        "short": {"patterns": ["azure.sql"]},
+        "long": {"patterns": ["azure.sqlx", "sqlx.pool"]},
+    }
+    matcher = ServiceMatcher(service_map, single_pass=True)
+    content = "import azure.sqlx.pool"
+
+    assert matcher.detect(content) == ["short", "long"]
+    assert ServiceMatcher(service_map).detect(content) == ["short", "long"]
+    assert matcher.scan(content) == {
+        "short": [(7, "azure.sql")],
+        "long": [(7, "azure.sqlx"), (13, "sqlx.pool")],
+    }
+
+
+def test_scan_returns_offsets():
+    matches = scan_azure_services(SAMPLE_AZURE_FUNCTION)
+    assert set(matches) == {"azure_blob_storage", "azure_functions"}
+    for offset, pattern in matches["azure_functions"]:
+        assert SAMPLE_AZURE_FUNCTION[offset:offset + len(pattern)] == pattern
+
+
+def test_strategy_follows_the_number_of_patterns():
+    big_map = {f"s{i}": {"patterns": [f"pkg{i}.mod"]} for i in range(SINGLE_PASS_MIN_PATTERNS)}
+    assert not ServiceMatcher(SERVICE_MAP).single_pass
+    assert ServiceMatcher(big_map).single_pass
+    for content in (SAMPLE_AZURE_FUNCTION, SAMPLE_TYPESCRIPT, "", "pkg7.mod pkg42.mod"):
+        for service_map in (SERVICE_MAP, big_map):
+            expected = naive_detect(service_map, content)
+            assert ServiceMatcher(service_map, single_pass=False).detect(content) == expected
+            assert ServiceMatcher(service_map, single_pass=True).detect(content) == expected
+            assert ServiceMatcher(service_map).detect(content.encode("utf-8")) == expected
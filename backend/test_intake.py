@@ -0,0 +1,77 @@
+"""
+Tests for file intake: size limits, binary/minified/generated detection and
+memory-mapped service detection.
+"""
+
+import os
+import tempfile
+
+import core.intake as intake
+import core.pipeline as pipeline
+from core.detector import detect_azure_services, detect_azure_services_in_file
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+
+
+def _write(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+    return path
+
+
+def test_classify_flags_binary_minified_and_generated_files():
+    assert intake.classify("a.py", b"import os\x00\x01") == intake.SKIP_BINARY
+    assert intake.classify("a.py", b"\xff\xfe\xfa not utf-8") == intake.SKIP_BINARY
+    assert intake.classify("app.js", b"var a=1;" * 500) == intake.SKIP_MINIFIED
+    assert intake.classify("package-lock.json", b"{}") == intake.SKIP_GENERATED
+    assert intake.classify("vendor.min.js", b"x") == intake.SKIP_GENERATED
+    assert intake.classify("models.py", b"# @generated by protoc\nimport x\n") == intake.SKIP_GENERATED
+    assert intake.classify("main.py", SAMPLE_AZURE_FUNCTION.encode()) == ""
+    # A character cut off by the sample boundary isn't mistaken for binary
+    assert intake.classify("a.py", "# é".encode()[:-1]) == ""
+
+
+def test_mmap_detection_matches_text_detection():
+    directory = tempfile.mkdtemp()
+    path = _write(directory, "a.py", "# héllo\n" + SAMPLE_AZURE_FUNCTION)
+    assert detect_azure_services_in_file(path) == detect_azure_services(SAMPLE_AZURE_FUNCTION)
+    assert detect_azure_services_in_file(_write(directory, "empty.py", b"")) == []
+
+
+def test_large_files_are_only_decoded_when_they_use_azure(monkeypatch):
+    monkeypatch.setattr(intake, "INTAKE_MMAP_KB", 1)
+    directory = tempfile.mkdtemp()
+    plain = _write(directory, "plain.py", "x = 1\n" * 3000)
+    azure = _write(directory, "azure.py", SAMPLE_AZURE_FUNCTION + "x = 1\n" * 3000)
+
+    skipped = intake.take_in(plain, "plain.py")
+    assert skipped.content is None and skipped.skip == intake.NO_AZURE
+    taken = intake.take_in(azure, "azure.py")
+    assert taken.content.startswith(SAMPLE_AZURE_FUNCTION)
+    assert taken.services == detect_azure_services(SAMPLE_AZURE_FUNCTION)
+
+
+def test_pipeline_skips_files_intake_rejects(monkeypatch):
+    monkeypatch.setattr(intake, "INTAKE_MAX_FILE_MB", 0.01)
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "import functions_framework\n")
+    workspace = tempfile.mkdtemp()
+    _write(workspace, "main.py", SAMPLE_AZURE_FUNCTION)
+    _write(workspace, "huge.py", SAMPLE_AZURE_FUNCTION + "#" * 20000)
+    _write(workspace, "bundle.js", "const c=new BlobServiceClient(u);" * 100)
+    _write(workspace, "blob.json", b"\x00\x01\x02")
+
+    events = []
+    statuses = {
+        os.path.basename(p): s
+        for p, s in pipeline.run_pipeline(workspace, batch_tokens=0, progress=events.append)
+    }
+
+    assert statuses == {
+        "main.py": "Converted",
+        "huge.py": "Skipped (larger than 0.01 MB)",
+        "bundle.js": intake.SKIP_MINIFIED,
+        "blob.json": intake.SKIP_BINARY,
+    }
+    # Minified files are still reported with the services they use
+    bundle = next(e for e in events if e["type"] == "file" and e["file"] == "bundle.js")
+    assert bundle["services"] == ["azure_blob_storage"]
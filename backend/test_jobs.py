@@ -0,0 +1,110 @@
+"""
+Tests for background migration jobs and the submit-and-poll API.
+"""
+
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import server
+from core.jobs import JobManager, COMPLETED, FAILED
+
+
+def fake_migrate(source, include_suggestions=False, progress=None, release=None):
+    progress({"type": "workspace", "workspace": "/tmp/az2gcp_fake"})
+    for name in ("a.py", "b.py"):
+        if release is not None:
+            release.wait(5)
+        progress({"type": "file", "file": name, "services": [], "status": "Converted"})
+    progress({"type": "scan_complete", "total": 2})
+    if source == "boom":
+        raise RuntimeError("clone failed")
+    return {"workspace": "/tmp/az2gcp_fake", "report": "a.py: Converted\nb.py: Converted"}
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status not in (COMPLETED, FAILED) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_job_manager_tracks_progress_and_result():
+    release = threading.Event()
+    manager = JobManager(lambda *a, **kw: fake_migrate(*a, release=release, **kw), max_workers=1)
+    job = manager.submit("https://github.com/user/repo")
+
+    assert manager.get(job.id) is job
+    release.set()
+    _wait(job)
+    snapshot = job.snapshot()
+    assert snapshot["status"] == COMPLETED
+    assert snapshot["progress"]["files_done"] == 2
+    assert snapshot["progress"]["files_total"] == 2
+    assert job.result["report"].startswith("a.py")
+
+
+def test_job_manager_records_failures_and_runs_cleanup():
+    cleaned = []
+    manager = JobManager(fake_migrate, max_workers=1)
+    job = manager.submit("boom", cleanup=lambda: cleaned.append(True))
+    _wait(job)
+    assert job.status == FAILED
+    assert job.error == "clone failed"
+    assert cleaned == [True]
+
+
+def test_submit_and_poll_endpoints(monkeypatch):
+    monkeypatch.setattr(server, "jobs", JobManager(fake_migrate, max_workers=1))
+    client = TestClient(server.app)
+
+    resp = client.post("/jobs/url", json={"source_url": "https://github.com/user/repo"})
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+
+    _wait(server.jobs.get(job_id))
+    status = client.get(f"/jobs/{job_id}").json()
+    assert status["status"] == COMPLETED
+    assert [f["file"] for f in status["progress"]["files"]] == ["a.py", "b.py"]
+
+    report = client.get(f"/jobs/{job_id}/report")
+    assert report.status_code == 200
+    assert "Converted" in report.json()["report"]
+
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.post("/jobs/url", json={"source_url": "ftp://nope"}).status_code == 400
+
+
+def test_stream_endpoint_emits_server_sent_events(monkeypatch):
+    import json
+
+    monkeypatch.setattr(server, "jobs", JobManager(fake_migrate, max_workers=1))
+    client = TestClient(server.app)
+
+    with client.stream("POST", "/migrate/stream", json={"source_url": "https://github.com/user/repo"}) as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+
+    events = [
+        json.loads(block.split("data: ", 1)[1])
+        for block in body.strip().split("\n\n") if "data: " in block
+    ]
+    assert events[0]["type"] == "job"
+    assert [e["file"] for e in events if e["type"] == "file"] == ["a.py", "b.py"]
+    assert events[-1]["type"] == "done" and events[-1]["status"] == COMPLETED
+
+    # Subscribing after the fact replays the whole run
+    replay = client.get(f"/jobs/{events[0]['job_id']}/events").text
+    assert replay.count("event: file") == 2 and "event: done" in replay
+
+
+def test_chunk_events_only_keep_the_latest_count():
+    job = JobManager(fake_migrate).submit("https://github.com/user/repo")
+    _wait(job)
+    for chars in range(1, 20001):
+        job.on_progress({"type": "chunk", "file": "big.py", "chars": chars})
+
+    assert job.streamed() == {"big.py": 20000}
+    assert not [e for e in job.events if e["type"] == "chunk"]
+    job.on_progress({"type": "file", "file": "big.py", "services": [], "status": "Converted"})
+    assert job.streamed() == {}
@@ -0,0 +1,130 @@
+"""
+Tests for incremental re-migration driven by the file-hash manifest.
+"""
+
+import os
+import tempfile
+
+import core.manifest
+import core.pipeline as pipeline
+import core.source_loader
+import main
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+from test_source_loader import _local_repo, _commit
+
+
+def _setup(monkeypatch):
+    calls = []
+
+    def fake_rewrite(filename, content):
+        calls.append(filename)
+        return f"# converted {filename} v{len(calls)}\n"
+
+    monkeypatch.setattr(pipeline, "rewrite_new", fake_rewrite)
+    monkeypatch.setattr(pipeline, "BATCH_MAX_TOKENS", 0)
+    monkeypatch.setattr(core.source_loader, "ALLOW_LOCAL_GIT", True)
+    return calls
+
+
+def _read(workspace, name):
+    with open(os.path.join(workspace, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_rerun_only_rewrites_changed_files(monkeypatch):
+    calls = _setup(monkeypatch)
+    repo, url = _local_repo({
+        "a/__init__.py": SAMPLE_AZURE_FUNCTION,
+        "b/__init__.py": SAMPLE_AZURE_FUNCTION + "\n# b\n",
+        "util.py": "print('plain')\n",
+    })
+
+    first = main.migrate(url)
+    assert set(first["cache"]) == {"hits", "misses", "evictions"}
+    assert sorted(calls) == ["a/__init__.py", "b/__init__.py"]
+    previous_b = _read(first["workspace"], "b/__init__.py")
+
+    _commit(repo, {"a/__init__.py": SAMPLE_AZURE_FUNCTION + "\n# changed\n"})
+    calls.clear()
+    second = main.migrate(url)
+
+    assert calls == ["a/__init__.py"]
+    assert _read(second["workspace"], "b/__init__.py") == previous_b
+    assert _read(second["workspace"], "b/__init__.py.azure.bak") == SAMPLE_AZURE_FUNCTION + "\n# b\n"
+    assert "Converted (unchanged)" in second["report"]
+
+    # Nothing changed at all: no model calls
+    calls.clear()
+    main.migrate(url)
+    assert calls == []
+
+    # Non-incremental runs ignore the manifest
+    main.migrate(url, incremental=False)
+    assert sorted(calls) == ["a/__init__.py", "b/__init__.py"]
+
+
+def test_unchanged_files_come_from_git_diff(monkeypatch):
+    _setup(monkeypatch)
+    repo, url = _local_repo({"a.py": "import azure.functions\n", "b.py": "import azure.cosmos\n"})
+    main.migrate(url)
+
+    head = _commit(repo, {"a.py": "import azure.functions  # edited\n", "c.py": "x = 1\n"})
+    workspace = tempfile.mkdtemp()
+    core.source_loader._clone_repo(url, workspace, mode="full")
+
+    manifest = core.manifest.Manifest(core.manifest.manifest_key(url))
+    assert manifest.unchanged_files(workspace, head) == {"b.py"}
+
+
+def test_failed_files_are_retried(monkeypatch):
+    calls = _setup(monkeypatch)
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda f, c: calls.append(f) or "import azure.functions\n")
+    _, url = _local_repo({"a.py": SAMPLE_AZURE_FUNCTION})
+
+    assert "FAILED" in main.migrate(url)["report"]
+    main.migrate(url)
+    assert calls == ["a.py", "a.py"]
+
+
+def test_prompt_changes_invalidate_the_manifest(monkeypatch):
+    calls = _setup(monkeypatch)
+    _, url = _local_repo({"a.py": SAMPLE_AZURE_FUNCTION})
+    main.migrate(url)
+    monkeypatch.setattr(core.manifest, "prompt_fingerprint", lambda: "edited")
+    main.migrate(url)
+    assert calls == ["a.py", "a.py"]
+
+
+def test_changed_zip_uploads_reuse_unchanged_files(monkeypatch):
+    from test_source_loader import _zip
+
+    calls = _setup(monkeypatch)
+    first = _zip({"a.py": SAMPLE_AZURE_FUNCTION, "b.py": SAMPLE_AZURE_FUNCTION + "\n# b\n"})
+    main.migrate(first)
+    assert sorted(calls) == ["a.py", "b.py"]
+
+    # The same project uploaded again with one file changed
+    second = _zip({"a.py": SAMPLE_AZURE_FUNCTION + "\n# changed\n", "b.py": SAMPLE_AZURE_FUNCTION + "\n# b\n"})
+    assert core.manifest.manifest_key(second) == core.manifest.manifest_key(first)
+    calls.clear()
+    result = main.migrate(second)
+    assert calls == ["a.py"]
+    assert "b.py: Converted (unchanged)" in result["report"]
+
+    assert core.manifest.manifest_key("/tmp/x/other.zip") != core.manifest.manifest_key(first)
+
+
+def test_save_keeps_outputs_a_concurrent_run_may_restore(monkeypatch):
+    _setup(monkeypatch)
+    first = core.manifest.Manifest("git:example")
+    first.record("a.py", "h1", [], "Converted", "# v1\n")
+    first.save()
+
+    # Two runs start from the first manifest; one finishes before the other restores
+    slow = core.manifest.Manifest("git:example")
+    fast = core.manifest.Manifest("git:example")
+    fast.record("a.py", "h2", [], "Converted", "# v2\n")
+    fast.save()
+
+    entry = slow.reusable("a.py", "h1")
+    assert entry is not None and slow.output(entry) == "# v1\n"
@@ -0,0 +1,55 @@
+"""
+Tests for the per-stage metrics and the /metrics endpoint.
+"""
+
+import core.pipeline as pipeline
+from core.metrics import Counter, Histogram, Registry, STAGE_SECONDS, FILES, BYTES_WRITTEN
+from test_pipeline import _make_workspace
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = Histogram("t_seconds", "Test.", ["stage"], buckets=(0.1, 1), registry=registry)
+    hist.observe(0.05, stage="a")
+    hist.observe(0.5, stage="a")
+    hist.observe(5, stage="a")
+    Counter("t_total", "Test.", registry=registry).inc(3)
+
+    text = registry.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="a"} 3' in text
+    assert 't_seconds_sum{stage="a"} 5.55' in text
+    assert "# TYPE t_total counter\nt_total 3" in text
+
+
+def test_pipeline_records_stage_timings_and_counters(monkeypatch):
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "# ok\n")
+    detected = STAGE_SECONDS.value(stage="detect")[0]
+    written = STAGE_SECONDS.value(stage="write_back")[0]
+    walks = STAGE_SECONDS.value(stage="walk")[0]
+    validated = FILES.value(stage="validated")
+    skipped = FILES.value(stage="skipped")
+    bytes_written = BYTES_WRITTEN.value()
+
+    pipeline.run_pipeline(_make_workspace(3), workers=2, batch_tokens=0)
+
+    assert STAGE_SECONDS.value(stage="detect")[0] == detected + 4
+    assert STAGE_SECONDS.value(stage="write_back")[0] == written + 3
+    assert STAGE_SECONDS.value(stage="walk")[0] == walks + 1
+    assert FILES.value(stage="validated") == validated + 3
+    assert FILES.value(stage="skipped") == skipped + 1
+    assert BYTES_WRITTEN.value() == bytes_written + 3 * len("# ok\n")
+
+
+def test_metrics_endpoint():
+    from fastapi.testclient import TestClient
+    import server
+
+    response = TestClient(server.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("az2gcp_stage_seconds", "az2gcp_files_total", "az2gcp_llm_requests_in_flight",
+                 "az2gcp_bytes_read_total", "az2gcp_migrations_in_flight"):
+        assert f"# TYPE {name}" in response.text
@@ -189,6 +189,11 @@ def test_comment_styles():
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    # The tests import config.settings lazily, so this still comes first
+    load_dotenv()
+
     test_comment_styles()
     test_zip_creation()
     test_migration_flow()
@@ -0,0 +1,283 @@
+"""
+Tests for the concurrent rewrite pipeline.
+The model is replaced with a local stub so no API key is needed.
+"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import core.pipeline as pipeline
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+
+
+def _make_workspace(n_files):
+    workspace = tempfile.mkdtemp()
+    for i in range(n_files):
+        path = os.path.join(workspace, f"func_{i:03d}", "__init__.py")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_AZURE_FUNCTION)
+    with open(os.path.join(workspace, "README.py"), "w", encoding="utf-8") as f:
+        f.write("print('no cloud here')\n")
+    return workspace
+
+
+def test_pipeline_order_is_deterministic(monkeypatch):
+    """Reports come back in discovery order even when rewrites finish out of order."""
+    def fake_rewrite(filename, content):
+        time.sleep(random.uniform(0, 0.02))
+        return "import functions_framework\n"
+
+    monkeypatch.setattr(pipeline, "rewrite_new", fake_rewrite)
+    first = _make_workspace(20)
+    serial = pipeline.run_pipeline(first, workers=1, batch_tokens=0)
+    second = _make_workspace(20)
+    parallel = pipeline.run_pipeline(second, workers=8, batch_tokens=0)
+
+    assert len(parallel) == 21
+    assert [(os.path.relpath(p, first), s) for p, s in serial] == \
+        [(os.path.relpath(p, second), s) for p, s in parallel]
+    assert all(s == "Converted" for p, s in parallel if p.endswith("__init__.py"))
+    assert "No Azure dependency" in [s for _, s in parallel]
+
+
+def test_pipeline_bounds_concurrency(monkeypatch):
+    """No more than `workers` rewrites run at the same time."""
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def fake_rewrite(filename, content):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.01)
+        with lock:
+            active["now"] -= 1
+        return "import functions_framework\n"
+
+    monkeypatch.setattr(pipeline, "rewrite_new", fake_rewrite)
+    pipeline.run_pipeline(_make_workspace(16), workers=3, batch_tokens=0)
+    assert 1 < active["peak"] <= 3
+
+
+def test_pipeline_marks_model_errors_as_failed(monkeypatch):
+    def fake_rewrite(filename, content):
+        raise RuntimeError("quota exceeded")
+
+    monkeypatch.setattr(pipeline, "rewrite_new", fake_rewrite)
+    results = pipeline.run_pipeline(_make_workspace(2), workers=2, batch_tokens=0)
+    failed = [s for p, s in results if p.endswith("__init__.py")]
+    assert failed == ["FAILED (quota exceeded)"] * 2
+
+
+def test_pipeline_reports_progress_events(monkeypatch):
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "# ok\n")
+    events = []
+    pipeline.run_pipeline(_make_workspace(3), workers=2, progress=events.append, batch_tokens=0)
+
+    files = [e for e in events if e["type"] == "file"]
+    assert len(files) == 4
+    assert sorted(e["stage"] for e in files) == ["skipped", "validated", "validated", "validated"]
+    assert len([e for e in events if e["type"] == "detected"]) == 4
+    assert len([e for e in events if e["type"] == "rewritten"]) == 3
+    assert all(e["elapsed"] >= 0 for e in events)
+    assert [e["total"] for e in events if e["type"] == "scan_complete"] == [4]
+
+
+def test_pipeline_packs_small_files_into_batches(monkeypatch):
+    import core.rewriter as rewriter
+    from core.cache import RewriteCache
+
+    requests = []
+
+    class BatchEchoBackend:
+        """Echoes every delimited file back, dropping the one named func_002."""
+        def generate(self, prompt, content):
+            requests.append((prompt, content))
+            time.sleep(0.05)  # keep the worker busy so a batch can build up
+            if "<<<FILE" not in content:
+                return "# single\n"
+            blocks = content.split("<<<END FILE")
+            out = "\n".join(
+                f"<<<FILE {i}>>>\n# batched\n<<<END FILE {i}>>>"
+                for i in range(1, len(blocks)) if "func_002" not in blocks[i - 1]
+            )
+            return "```\n" + out + "\n```"
+
+    monkeypatch.setattr(rewriter, "backend", BatchEchoBackend())
+    monkeypatch.setattr(rewriter, "rewrite_cache", RewriteCache("", 0, enabled=False))
+    monkeypatch.setattr(pipeline, "rewrite_new", rewriter.rewrite_new)
+    monkeypatch.setattr(pipeline, "BATCH_MAX_FILES", 4)
+
+    workspace = _make_workspace(8)
+    results = pipeline.run_pipeline(workspace, workers=1, batch_tokens=10000)
+
+    # The first file goes alone to the idle worker, the other 7 are batched
+    # (4 + 3) while it is busy, plus a single retry if func_002 was batched
+    assert 3 <= len(requests) <= 4
+    assert sum("<<<FILE" in content for _, content in requests) == 2
+    assert all(s == "Converted" for p, s in results if p.endswith("__init__.py"))
+    with open(os.path.join(workspace, "func_002", "__init__.py"), encoding="utf-8") as f:
+        assert f.read() == "# single\n"
+
+
+def test_pipeline_streams_results_before_the_walk_finishes(monkeypatch):
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "# ok\n")
+    workspace = tempfile.mkdtemp()
+    with open(os.path.join(workspace, "function_app.py"), "w", encoding="utf-8") as f:
+        f.write(SAMPLE_AZURE_FUNCTION)
+    os.makedirs(os.path.join(workspace, "lib"))
+    for i in range(300):
+        with open(os.path.join(workspace, "lib", f"util_{i}.py"), "w", encoding="utf-8") as f:
+            f.write("x = 1\n")
+
+    def slow_walk_progress(event):
+        events.append(event)
+        if event["type"] == "detected":
+            time.sleep(0.001)
+
+    events = []
+    pipeline.run_pipeline(workspace, workers=2, progress=slow_walk_progress, batch_tokens=0)
+
+    types = [(e["type"], e.get("file")) for e in events]
+    converted = types.index(("file", "function_app.py"))
+    assert converted < types.index(("scan_complete", None))
+    assert converted < len(events) // 2
+
+
+def test_pipeline_sends_small_files_straight_to_idle_workers(monkeypatch):
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "# ok\n")
+    events = []
+
+    def slow_walk_progress(event):
+        events.append(event)
+        if event["type"] == "detected":
+            time.sleep(0.01)
+
+    pipeline.run_pipeline(_make_workspace(3), workers=4, progress=slow_walk_progress,
+                          batch_tokens=100000)
+    types = [(e["type"], e.get("stage")) for e in events]
+    assert types.index(("file", "validated")) < types.index(("scan_complete", None))
+
+
+class _StreamingBackend:
+    """Streams the answer line by line."""
+    def __init__(self, answer):
+        self.answer = answer
+
+    def generate(self, prompt, content):
+        return self.answer
+
+    def stream(self, prompt, content):
+        yield from self.answer.splitlines(keepends=True)
+
+
+def test_pipeline_streams_rewrites_to_disk(monkeypatch):
+    import core.rewriter as rewriter
+
+    answer = "import functions_framework\n\n@functions_framework.http\ndef handler(request):\n    return 'ok', 200\n"
+    monkeypatch.setattr(rewriter, "backend", _StreamingBackend(answer))
+    events = []
+    workspace = _make_workspace(3)
+    results = pipeline.run_pipeline(workspace, workers=2, progress=events.append,
+                                    batch_tokens=0, stream=True)
+
+    assert all(s == "Converted" for p, s in results if p.endswith("__init__.py"))
+    with open(os.path.join(workspace, "func_001", "__init__.py"), encoding="utf-8") as f:
+        assert f.read() == answer
+    types = [(e["type"], e.get("file")) for e in events]
+    name = os.path.join("func_000", "__init__.py")
+    assert types.index(("chunk", name)) < types.index(("file", name))
+    assert max(e["chars"] for e in events if e["type"] == "chunk" and e["file"] == name) == len(answer)
+    assert not [f for _, _, files in os.walk(workspace) for f in files if f.endswith(".tmp")]
+
+
+def test_streamed_chunk_events_are_merged(monkeypatch):
+    import core.rewriter as rewriter
+
+    answer = "x = 1\n" * 20000
+    monkeypatch.setattr(rewriter, "backend", _StreamingBackend(answer))
+    events = []
+    pipeline.run_pipeline(_make_workspace(1), workers=1, progress=events.append,
+                          batch_tokens=0, stream=True)
+
+    chunks = [e["chars"] for e in events if e["type"] == "chunk"]
+    assert len(chunks) < 20
+    assert chunks[-1] == len(answer)
+
+
+def test_streamed_rewrites_are_validated_before_replacing_the_original(monkeypatch):
+    import core.rewriter as rewriter
+
+    monkeypatch.setattr(rewriter, "backend", _StreamingBackend("import azure.functions\n"))
+    workspace = _make_workspace(1)
+    results = pipeline.run_pipeline(workspace, workers=1, batch_tokens=0, stream=True)
+
+    assert [s for p, s in results if p.endswith("__init__.py")] == ["FAILED (azure.functions)"]
+    with open(os.path.join(workspace, "func_000", "__init__.py"), encoding="utf-8") as f:
+        assert f.read() == SAMPLE_AZURE_FUNCTION
+    assert not [f for _, _, files in os.walk(workspace) for f in files if f.endswith(".tmp")]
+    # Untouched, so no backup, and left out of diff-only downloads
+    assert not os.path.exists(os.path.join(workspace, "func_000", "__init__.py.azure.bak"))
+
+
+class _CombinedBackend:
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def generate(self, prompt, content):
+        self.prompts.append(prompt)
+        if "<<<CODE>>>" in prompt:
+            return self.answer
+        if "Senior Cloud Migration Architect" in prompt:
+            return "GCP MIGRATION ANALYSIS\nUse Cloud Storage."
+        return "import functions_framework\n"
+
+
+def test_suggestions_come_from_one_structured_request(monkeypatch):
+    import core.rewriter as rewriter
+
+    backend = _CombinedBackend(
+        "```\n<<<CODE>>>\nimport functions_framework\n<<<END CODE>>>\n"
+        "<<<SUGGESTIONS>>>\nGCP MIGRATION ANALYSIS\nUse Pub/Sub.\n<<<END SUGGESTIONS>>>\n```"
+    )
+    monkeypatch.setattr(rewriter, "backend", backend)
+    workspace = _make_workspace(1)
+    results = pipeline.run_pipeline(workspace, include_suggestions=True, workers=1, batch_tokens=0)
+
+    assert [s for p, s in results if p.endswith("__init__.py")] == ["Converted (with suggestions)"]
+    assert len(backend.prompts) == 1
+    with open(os.path.join(workspace, "func_000", "__init__.py"), encoding="utf-8") as f:
+        text = f.read()
+    assert text.startswith("import functions_framework\n\n\n# ====")
+    assert "# Use Pub/Sub.\n" in text
+
+
+def test_unparseable_combined_answers_fall_back_to_two_requests(monkeypatch):
+    import core.rewriter as rewriter
+
+    backend = _CombinedBackend("import functions_framework  # no sections\n")
+    monkeypatch.setattr(rewriter, "backend", backend)
+    text = rewriter.rewrite_with_suggestions("handler.py", SAMPLE_AZURE_FUNCTION)
+
+    assert len(backend.prompts) == 3
+    assert text.startswith("import functions_framework\n")
+    assert "# Use Cloud Storage.\n" in text
+
+
+def test_concurrent_scan_finds_the_same_files(monkeypatch):
+    monkeypatch.setattr(pipeline, "SCAN_BATCH_FILES", 4)
+    monkeypatch.setattr(pipeline, "rewrite_new", lambda filename, content: "import functions_framework\n")
+    first = _make_workspace(20)
+    serial = pipeline.run_pipeline(first, workers=2, batch_tokens=0)
+    second = _make_workspace(20)
+    concurrent = pipeline.run_pipeline(second, workers=2, batch_tokens=0, scan_workers=3)
+
+    assert sorted((os.path.relpath(p, first), s) for p, s in serial) == \
+        [(os.path.relpath(p, second), s) for p, s in concurrent]
+    assert {t.name: t.services for t in pipeline.discover(first, workers=3)} == \
+        {t.name: t.services for t in pipeline.discover(first, workers=1)}
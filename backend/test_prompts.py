@@ -0,0 +1,97 @@
+"""
+Tests for the compiled prompt templates and provider-side context caching.
+"""
+
+import pytest
+
+import core.rewriter as rewriter
+from core.metrics import PROMPT_TOKENS
+from core.prompts import REWRITE, SUGGESTIONS, PromptTemplate, service_list
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+
+
+class ContextCachingBackend:
+    """Stand-in for a provider with an explicit context cache."""
+    def __init__(self):
+        self.cached = []
+        self.calls = []
+
+    def cache_context(self, text, ttl):
+        self.cached.append(text)
+        return f"ctx-{len(self.cached)}"
+
+    def generate(self, prompt, content, context=None):
+        self.calls.append((prompt, context))
+        return "import functions_framework\n"
+
+
+class PlainBackend:
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, content):
+        self.prompts.append(prompt)
+        return "import functions_framework\n"
+
+
+def test_rewrite_prompt_fills_in_file_and_services():
+    prompt = REWRITE.render(filename="func/__init__.py", service_list=service_list(["azure_functions"]))
+    text = str(prompt)
+    assert "{filename}" not in text and "{service_list}" not in text
+    assert "FILE: func/__init__.py" in text
+    assert "- azure_functions -> Google Cloud Functions" in text
+    # The shared instructions come first so they form a stable prefix
+    assert text.startswith(REWRITE.static)
+    assert "func/__init__.py" not in prompt.static
+
+
+def test_missing_fields_are_rejected():
+    with pytest.raises(ValueError):
+        SUGGESTIONS.render()
+
+
+def test_fingerprint_follows_version_and_text():
+    a = PromptTemplate("t", 1, "static", "{x}")
+    assert a.fingerprint == PromptTemplate("t", 1, "static", "{x}").fingerprint
+    assert a.fingerprint != PromptTemplate("t", 2, "static", "{x}").fingerprint
+    assert a.fingerprint != PromptTemplate("t", 1, "static!", "{x}").fingerprint
+
+
+def test_static_and_dynamic_tokens_are_counted_separately(monkeypatch):
+    monkeypatch.setattr(rewriter, "backend", PlainBackend())
+    static = PROMPT_TOKENS.value(part="static")
+    dynamic = PROMPT_TOKENS.value(part="dynamic")
+
+    rewriter.rewrite_new("a.py", SAMPLE_AZURE_FUNCTION)
+
+    assert PROMPT_TOKENS.value(part="static") - static == REWRITE.static_tokens
+    assert 0 < PROMPT_TOKENS.value(part="dynamic") - dynamic < REWRITE.static_tokens
+    assert "FILE: a.py" in rewriter.backend.prompts[0]
+
+
+def test_static_prefix_is_served_from_the_context_cache(monkeypatch):
+    backend = ContextCachingBackend()
+    monkeypatch.setattr(rewriter, "backend", backend)
+    monkeypatch.setattr(rewriter, "PROMPT_CONTEXT_CACHE", True)
+    monkeypatch.setattr(rewriter, "_contexts", {})
+    cached = PROMPT_TOKENS.value(part="static_cached")
+
+    rewriter.rewrite_new("a.py", SAMPLE_AZURE_FUNCTION)
+    rewriter.rewrite_new("b.py", SAMPLE_AZURE_FUNCTION)
+
+    assert backend.cached == [REWRITE.static]
+    assert [context for _, context in backend.calls] == ["ctx-1", "ctx-1"]
+    assert all(REWRITE.static not in prompt for prompt, _ in backend.calls)
+    assert "FILE: b.py" in backend.calls[1][0]
+    assert PROMPT_TOKENS.value(part="static_cached") - cached == 2 * REWRITE.static_tokens
+
+
+def test_backends_without_a_context_cache_get_the_full_prompt(monkeypatch):
+    backend = PlainBackend()
+    monkeypatch.setattr(rewriter, "backend", backend)
+    monkeypatch.setattr(rewriter, "PROMPT_CONTEXT_CACHE", True)
+    monkeypatch.setattr(rewriter, "_contexts", {})
+
+    rewriter.rewrite_new("a.py", SAMPLE_AZURE_FUNCTION)
+
+    assert backend.prompts[0].startswith(REWRITE.static)
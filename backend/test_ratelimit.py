@@ -0,0 +1,144 @@
+"""
+Tests for request pacing, retries and adaptive concurrency.
+Clocks and sleeps are faked so nothing actually waits.
+"""
+
+import threading
+
+import core.rewriter as rewriter
+from core.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class Throttled(Exception):
+    code = 429
+
+
+class Unauthorized(Exception):
+    code = 403
+
+
+class ThrottlingBackend:
+    """Fails the first `failures` requests with a 429, then converts."""
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt, content):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise Throttled("429 Resource has been exhausted")
+        return "# converted\n"
+
+
+def test_token_bucket_paces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock, clock.sleep)
+    for _ in range(60):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [1.0]
+
+
+def test_token_bucket_lets_oversized_requests_through_a_full_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(1000, clock, clock.sleep)
+    bucket.acquire(5000)
+    assert clock.slept == []
+    assert bucket.tokens == 0
+
+
+def test_throttled_requests_are_retried_and_shrink_concurrency(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter(max_concurrency=8, backoff=0.5, clock=clock, sleep=clock.sleep)
+    backend = ThrottlingBackend(failures=2)
+    monkeypatch.setattr(rewriter, "backend", backend)
+    monkeypatch.setattr(rewriter, "limiter", limiter)
+
+    assert rewriter._generate("prompt", "import azure.functions\n") == "# converted\n"
+    assert backend.calls == 3
+    assert limiter.stats()["retries"] == 2
+    assert limiter.stats()["throttled"] == 2
+    assert limiter.stats()["limit"] == 2
+    assert all(0 <= s <= 0.5 * 2 ** i for i, s in enumerate(clock.slept))
+
+
+def test_concurrency_grows_back_after_successes():
+    clock = FakeClock()
+    limiter = RateLimiter(max_concurrency=4, clock=clock, sleep=clock.sleep)
+    limiter.limit = 1.0
+    for _ in range(10):
+        limiter.call(lambda: None)
+    assert limiter.stats()["limit"] == 4
+
+
+def test_slow_responses_shrink_concurrency():
+    clock = FakeClock()
+    limiter = RateLimiter(max_concurrency=8, target_latency=10, clock=clock, sleep=clock.sleep)
+    limiter.call(lambda: clock.sleep(30))
+    assert limiter.stats()["limit"] == 4
+
+
+def test_other_errors_are_not_retried():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def denied():
+        calls.append(1)
+        raise Unauthorized("API key not valid")
+
+    try:
+        limiter.call(denied)
+    except Unauthorized:
+        pass
+    assert calls == [1]
+    assert clock.slept == []
+
+
+def test_retries_give_up_after_max_retries():
+    clock = FakeClock()
+    limiter = RateLimiter(max_retries=3, clock=clock, sleep=clock.sleep)
+    backend = ThrottlingBackend(failures=100)
+    try:
+        limiter.call(lambda: backend.generate("prompt", "content"))
+    except Throttled:
+        pass
+    assert backend.calls == 4
+
+
+def test_in_flight_requests_stay_under_the_limit():
+    limiter = RateLimiter(max_concurrency=2)
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+    gate = threading.Event()
+
+    def request():
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        gate.wait(0.05)
+        with lock:
+            active["now"] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(request,)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert active["peak"] == 2
@@ -0,0 +1,106 @@
+"""
+Tests for the JSON Lines run report and the per-file figures it records.
+"""
+
+import os
+import time
+
+import core.rewriter as rewriter
+import core.source_loader
+import main
+import server
+from core.rewriter import Usage
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+from test_source_loader import _local_repo
+from utils.report import MigrationReport, read_report, render_report, render_text
+
+
+class EchoBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, content):
+        self.calls += 1
+        if "<<<FILE" in content:
+            count = content.count("<<<END FILE")
+            return "\n".join(f"<<<FILE {i}>>>\n# batched\n<<<END FILE {i}>>>" for i in range(1, count + 1))
+        return "import functions_framework\n"
+
+
+def test_text_view_is_unchanged():
+    report = MigrationReport()
+    report.add("a.py", "Converted")
+    report.add("b.py", "No Azure dependency")
+    assert report.render() == (
+        "AZURE -> GCP MIGRATION REPORT\n" + "=" * 30 + "\na.py: Converted\nb.py: No Azure dependency"
+    )
+    assert render_text([]) == "AZURE -> GCP MIGRATION REPORT\n" + "=" * 30
+
+
+def test_report_is_written_as_files_finish(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    report = MigrationReport(path, source="git:x")
+    report.record({"type": "file", "stage": "validated", "file": "a.py", "status": "Converted",
+                   "duration": 0.5, "size": 10, "requests": 1, "prompt_tokens": 7})
+    # Already on disk before the run is over
+    assert [r["type"] for r in read_report(path)] == ["run", "file"]
+
+    report.record({"type": "file", "stage": "skipped", "file": "b.py", "status": "No Azure dependency",
+                   "duration": 0.1, "size": 5})
+    summary = report.close(status="completed")
+    records = list(read_report(path))
+    assert records[0]["source"] == "git:x"
+    assert records[-1] == summary
+    assert summary["files"] == 2 and summary["size"] == 15 and summary["prompt_tokens"] == 7
+    assert summary["stages"] == {"validated": 1, "skipped": 1}
+    assert summary["duration_max"] == 0.5
+    assert render_report(path).endswith("a.py: Converted\nb.py: No Azure dependency")
+
+
+def test_migration_report_has_per_file_figures(monkeypatch):
+    monkeypatch.setattr(core.source_loader, "ALLOW_LOCAL_GIT", True)
+    monkeypatch.setattr(rewriter, "backend", EchoBackend())
+    _, url = _local_repo({"a/__init__.py": SAMPLE_AZURE_FUNCTION, "util.py": "print('plain')\n"})
+
+    first = main.migrate(url, incremental=False)
+    files = {r["file"]: r for r in read_report(first["report_file"]) if r["type"] == "file"}
+    converted = files["a/__init__.py"]
+    assert converted["chunks"] == 1 and converted["requests"] == 1 and not converted["cache_hit"]
+    assert converted["prompt_tokens"] > 0 and converted["response_tokens"] > 0
+    assert converted["size"] == len(SAMPLE_AZURE_FUNCTION)
+    assert converted["validation"] == "ok"
+    assert converted["write_seconds"] >= 0
+    assert files["util.py"]["requests"] == 0 and files["util.py"]["validation"] is None
+    assert first["summary"]["requests"] == 1 and first["summary"]["status"] == "completed"
+
+    # The same file again is answered from the rewrite cache
+    second = main.migrate(url, incremental=False)
+    files = {r["file"]: r for r in read_report(second["report_file"]) if r["type"] == "file"}
+    assert files["a/__init__.py"]["cache_hit"] and files["a/__init__.py"]["requests"] == 0
+    assert second["summary"]["cache_hits"] == 1
+
+
+def test_batched_files_share_the_request(monkeypatch):
+    backend = EchoBackend()
+    monkeypatch.setattr(rewriter, "backend", backend)
+    files = [(f"f{i}.py", f"from azure.storage.blob import BlobServiceClient\nx = {i}\n") for i in range(3)]
+    usages = [Usage() for _ in files]
+
+    rewriter.rewrite_batch(files, usages)
+
+    assert backend.calls == 1
+    assert all(u.batch == 3 and u.requests == 1 and u.chunks == 1 for u in usages)
+    assert len({u.prompt_tokens for u in usages}) == 1 and usages[0].prompt_tokens > 0
+
+
+def test_old_reports_are_pruned_by_garbage_collection(monkeypatch):
+    os.makedirs(main.reports_dir())
+    old, new = (os.path.join(main.reports_dir(), name) for name in ("old.jsonl", "new.jsonl"))
+    for path in (old, new):
+        MigrationReport(path).close()
+    stale = time.time() - 2 * 86400
+    os.utime(old, (stale, stale))
+    monkeypatch.setattr(server, "REPORT_TTL_DAYS", 1)
+
+    assert server.collect_garbage()["reports"] == 1
+    assert os.listdir(main.reports_dir()) == ["new.jsonl"]
@@ -0,0 +1,159 @@
+"""
+Tests for the server's upload handling and for keeping the event loop free
+while migrations run.
+"""
+
+import functools
+import io
+import os
+import threading
+import time
+import zipfile
+
+import anyio
+import httpx
+from fastapi.testclient import TestClient
+
+import server
+from core.artifacts import stream_zip
+from core.workspaces import workspaces
+
+
+def _zip_bytes():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as z:
+        z.writestr("main.py", "import azure.functions as func\n")
+    return data.getvalue()
+
+
+def test_uploads_are_saved_in_chunks_and_migrated(monkeypatch):
+    seen = {}
+
+    def fake_migrate(source, include_suggestions=False):
+        seen["file"] = os.path.basename(source)
+        with zipfile.ZipFile(source) as z:
+            seen["names"] = z.namelist()
+        return {"workspace": "/tmp/az2gcp_fake", "report": "main.py: Converted"}
+
+    monkeypatch.setattr(server, "migrate", fake_migrate)
+    monkeypatch.setattr(server, "UPLOAD_CHUNK_BYTES", 16)
+    client = TestClient(server.app)
+
+    resp = client.post("/migrate/file", files={"file": ("../../repo.zip", _zip_bytes())})
+    assert resp.status_code == 200
+    assert seen["names"] == ["main.py"]
+    assert seen["file"] == "repo.zip"
+
+
+def test_oversized_and_invalid_uploads_are_rejected(monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_MAX_BYTES", 512)
+    client = TestClient(server.app)
+
+    assert client.post("/migrate/file", files={"file": ("repo.zip", b"x" * 1000)}).status_code == 413
+    assert client.post("/jobs/file", files={"file": ("repo.zip", b"x" * 1000)}).status_code == 413
+    assert client.post("/jobs/file", files={"file": ("repo.zip", b"not a zip")}).status_code == 400
+
+
+def test_upload_limit_stops_reading_the_body(monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_MAX_BYTES", 4096)
+    sent = []
+    boundary = b"x" * 16
+
+    async def body():
+        yield b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="r.zip"\r\n\r\n'
+        for _ in range(1000):
+            sent.append(1)
+            yield b"z" * 1024
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # No Content-Length: the limit has to be enforced while reading
+            return await client.post(
+                "/jobs/file", content=body(),
+                headers={"content-type": "multipart/form-data; boundary=" + boundary.decode()},
+            )
+
+    assert anyio.run(scenario).status_code == 413
+    assert len(sent) < 10
+
+
+def test_health_check_answers_while_a_migration_runs(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_migrate(source, include_suggestions=False):
+        started.set()
+        release.wait(5)
+        return {"workspace": "/tmp/az2gcp_fake", "report": ""}
+
+    monkeypatch.setattr(server, "migrate", slow_migrate)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async with anyio.create_task_group() as tg:
+                migrate = functools.partial(
+                    client.post, "/migrate/url", json={"source_url": "https://github.com/user/repo"}
+                )
+                tg.start_soon(migrate)
+                while not started.is_set():
+                    await anyio.sleep(0.01)
+                begin = time.perf_counter()
+                resp = await client.get("/")
+                latency = time.perf_counter() - begin
+                release.set()
+        return resp.status_code, latency
+
+    status, latency = anyio.run(scenario)
+    assert status == 200
+    assert latency < 1
+
+
+def _migrated_workspace():
+    workspace = workspaces.create()
+    os.makedirs(os.path.join(workspace, "pkg"))
+    files = {
+        "pkg/main.py": "import functions_framework\n",
+        "pkg/main.py.azure.bak": "import azure.functions as func\n",
+        "README.md": "# readme\n",
+        "big.json": "x" * 300000,
+        "pkg/.main.py.azure.tmp": "partial",
+    }
+    for name, content in files.items():
+        with open(os.path.join(workspace, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    workspaces.release(workspace)
+    return workspace
+
+
+def test_workspace_download_streams_a_zip(monkeypatch):
+    monkeypatch.setattr(server, "migrate", lambda source, include_suggestions=False: {
+        "workspace": _migrated_workspace(), "report": "",
+    })
+    client = TestClient(server.app)
+    download = client.post("/migrate/url", json={"source_url": "https://github.com/u/r"}).json()["download"]
+
+    with client.stream("GET", download, params={"keep": True}) as resp:
+        assert resp.headers["content-type"] == "application/zip"
+        pieces = list(resp.iter_bytes())
+    with zipfile.ZipFile(io.BytesIO(b"".join(pieces))) as z:
+        assert sorted(z.namelist()) == ["README.md", "big.json", "pkg/main.py", "pkg/main.py.azure.bak"]
+        assert z.read("big.json") == b"x" * 300000
+
+    diff = client.get(download, params={"diff_only": True, "keep": True})
+    with zipfile.ZipFile(io.BytesIO(diff.content)) as z:
+        assert sorted(z.namelist()) == ["pkg/main.py", "pkg/main.py.azure.bak"]
+
+    # Downloading without keep deletes the workspace
+    assert client.get(download).status_code == 200
+    assert client.get(download).status_code == 404
+    assert client.get("/workspaces").json()["workspaces"] == 0
+    assert client.get("/workspaces/..%2F..%2Fetc/download").status_code == 404
+
+
+def test_stream_zip_yields_bounded_pieces():
+    workspace = _migrated_workspace()
+    pieces = list(stream_zip(workspace, chunk_size=4096))
+    assert len(pieces) > 10
+    assert max(len(p) for p in pieces) < 64 * 1024
@@ -0,0 +1,123 @@
+"""
+Tests for sharing one run between identical concurrent migrations.
+"""
+
+import io
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio
+import httpx
+from fastapi.testclient import TestClient
+
+import core.singleflight as singleflight
+import server
+from core.jobs import JobManager
+from core.singleflight import SingleFlight, migration_key
+from core.workspaces import workspaces
+
+
+def test_identical_calls_share_one_future():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(2) as pool:
+        first, joined_first = flights.run("k", lambda: pool.submit(work))
+        second, joined_second = flights.run("k", lambda: pool.submit(work))
+        other, _ = flights.run("other", lambda: pool.submit(lambda: "other"))
+        release.set()
+        assert (joined_first, joined_second) == (False, True)
+        assert first is second
+        assert first.result() == "result" and other.result() == "other"
+    assert calls == [1]
+    assert first.callers == 2 and other.callers == 1
+    # Forgotten once done, so a later call runs again
+    assert len(flights) == 0
+
+
+def test_migration_key_normalizes_the_source(monkeypatch, tmp_path):
+    monkeypatch.setattr(singleflight, "remote_head", lambda url: "abc123")
+    assert migration_key("https://GitHub.com/user/repo.git/") == migration_key("https://github.com/user/repo")
+    assert migration_key("https://github.com/user/repo") != migration_key("https://github.com/user/Repo")
+    assert migration_key("https://github.com/user/repo") != \
+        migration_key("https://github.com/user/repo", include_suggestions=True)
+    monkeypatch.setattr(singleflight, "remote_head", lambda url: "def456")
+    assert "@def456" in migration_key("https://github.com/user/repo")
+
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as z:
+        z.writestr("main.py", "import azure.functions\n")
+    (tmp_path / "a.zip").write_bytes(data.getvalue())
+    (tmp_path / "b.zip").write_bytes(data.getvalue())
+    assert migration_key(str(tmp_path / "a.zip")) == migration_key(str(tmp_path / "b.zip"))
+
+
+def test_job_manager_attaches_duplicates_to_the_running_job():
+    release = threading.Event()
+    runs = []
+
+    def slow_migrate(source, include_suggestions=False, progress=None):
+        runs.append(source)
+        release.wait(5)
+        return {"workspace": "/tmp/az2gcp_fake", "report": ""}
+
+    manager = JobManager(slow_migrate, max_workers=2)
+    cleaned = []
+    first = manager.submit("https://github.com/u/r", key="k")
+    second = manager.submit("https://github.com/u/r", key="k", cleanup=lambda: cleaned.append(1))
+    release.set()
+    deadline = time.time() + 5
+    while not first.finished and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert first is second
+    assert first.requests == 2
+    assert cleaned == [1]
+    assert runs == ["https://github.com/u/r"]
+    # Finished, so the key is free again
+    assert manager.submit("https://github.com/u/r", key="k") is not first
+    manager.shutdown()
+
+
+def test_concurrent_identical_requests_run_one_migration(monkeypatch):
+    calls = []
+
+    def slow_migrate(source, include_suggestions=False):
+        calls.append(source)
+        time.sleep(0.2)
+        workspace = workspaces.create()
+        workspaces.release(workspace)
+        return {"workspace": workspace, "report": "main.py: Converted"}
+
+    monkeypatch.setattr(server, "migrate", slow_migrate)
+
+    async def scenario():
+        results = []
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def post():
+                resp = await client.post("/migrate/url", json={"source_url": "https://github.com/user/repo"})
+                results.append(resp.json())
+
+            async with anyio.create_task_group() as tg:
+                for _ in range(4):
+                    tg.start_soon(post)
+        return results
+
+    results = anyio.run(scenario)
+    assert calls == ["https://github.com/user/repo"]
+    assert len(results) == 4 and all(r == results[0] for r in results)
+
+    # Each request gets to download the shared workspace once
+    client = TestClient(server.app)
+    for _ in range(4):
+        assert client.get(results[0]["download"]).status_code == 200
+    assert client.get(results[0]["download"]).status_code == 404
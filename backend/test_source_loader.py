@@ -0,0 +1,133 @@
+"""
+Tests for source loading (ZIP extraction).
+"""
+
+import os
+import tempfile
+import zipfile
+
+import pytest
+
+from core.source_loader import _extract_zip
+from test_migration_agent import SAMPLE_AZURE_FUNCTION
+
+
+def _zip(members):
+    path = os.path.join(tempfile.mkdtemp(), "upload.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return path
+
+
+def _extracted(dest):
+    return sorted(
+        os.path.relpath(os.path.join(base, f), dest).replace(os.sep, "/")
+        for base, _, files in os.walk(dest) for f in files
+    )
+
+
+def test_extract_zip_only_materializes_migratable_files():
+    zip_path = _zip({
+        "src/function_app.py": SAMPLE_AZURE_FUNCTION,
+        "host.json": "{}",
+        "node_modules/left-pad/index.js": "module.exports = 1",
+        "src/bin/helper.cs": "class Helper {}",
+        "assets/logo.png": b"\x89PNG" + b"\0" * 100,
+        "dist/bundle.js": "var x = 1;",
+        "../escape.py": "print('outside')",
+        "big/generated.py": "x = 1\n" * 2000,
+    })
+    dest = tempfile.mkdtemp()
+    _extract_zip(zip_path, dest, max_file_bytes=4096, max_total_bytes=1024 * 1024)
+
+    assert _extracted(dest) == ["host.json", "src/function_app.py"]
+    with open(os.path.join(dest, "src", "function_app.py"), encoding="utf-8") as f:
+        assert f.read() == SAMPLE_AZURE_FUNCTION
+
+
+def test_extract_zip_enforces_total_size_limit():
+    zip_path = _zip({f"f{i}.py": "x = 1\n" * 200 for i in range(10)})
+    with pytest.raises(ValueError):
+        _extract_zip(zip_path, tempfile.mkdtemp(), max_file_bytes=4096, max_total_bytes=5000)
+
+
+def test_extract_zip_rejects_invalid_archive():
+    path = os.path.join(tempfile.mkdtemp(), "broken.zip")
+    with open(path, "wb") as f:
+        f.write(b"not a zip")
+    with pytest.raises(ValueError):
+        _extract_zip(path, tempfile.mkdtemp())
+
+
+def _local_repo(files):
+    """Create a local Git repository and return its file:// URL."""
+    from git import Repo
+
+    path = tempfile.mkdtemp()
+    repo = Repo.init(path)
+    with repo.config_writer() as cw:
+        cw.set_value("user", "name", "test")
+        cw.set_value("user", "email", "test@example.com")
+    _commit(repo, files)
+    return repo, "file://" + path
+
+
+def _commit(repo, files):
+    for name, data in files.items():
+        full = os.path.join(repo.working_tree_dir, name)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w", encoding="utf-8") as f:
+            f.write(data)
+    repo.index.add(list(files))
+    return repo.index.commit("update").hexsha
+
+
+def test_clone_shallow_fetches_only_latest_commit():
+    from git import Repo
+    from core.source_loader import _clone_repo
+
+    repo, url = _local_repo({"app.py": "v1"})
+    head = _commit(repo, {"app.py": "v2"})
+    dest = tempfile.mkdtemp()
+
+    assert _clone_repo(url, dest, mode="shallow") == head
+    assert len(list(Repo(dest).iter_commits())) == 1
+    with open(os.path.join(dest, "app.py"), encoding="utf-8") as f:
+        assert f.read() == "v2"
+
+
+def test_clone_mirror_is_reused_and_fetched_incrementally():
+    from git import Repo
+    from core.source_loader import _clone_repo, _mirror_path
+
+    repo, url = _local_repo({"app.py": "v1"})
+    mirror_dir = tempfile.mkdtemp()
+
+    first = tempfile.mkdtemp()
+    _clone_repo(url, first, mode="mirror", mirror_dir=mirror_dir)
+    mirror = _mirror_path(url, mirror_dir)
+    assert os.path.isdir(mirror)
+
+    head = _commit(repo, {"app.py": "v2"})
+    # Refs besides branches (GitHub's pull request heads) aren't fetched
+    repo.git.update_ref("refs/pull/1/head", head)
+    second = tempfile.mkdtemp()
+    assert _clone_repo(url, second, mode="mirror", mirror_dir=mirror_dir) == head
+    assert "refs/pull" not in Repo(mirror).git.for_each_ref()
+
+    # Each run gets its own worktree; earlier ones are left untouched
+    with open(os.path.join(first, "app.py"), encoding="utf-8") as f:
+        assert f.read() == "v1"
+    with open(os.path.join(second, "app.py"), encoding="utf-8") as f:
+        assert f.read() == "v2"
+    assert os.listdir(mirror_dir) == [os.path.basename(mirror)]
+
+
+def test_load_source_rejects_local_repositories_by_default():
+    from core.source_loader import load_source
+
+    _, url = _local_repo({"app.py": "v1"})
+    for source in (url, url[len("file://"):] + "/.git"):
+        with pytest.raises(ValueError):
+            load_source(source)
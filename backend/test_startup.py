@@ -0,0 +1,41 @@
+"""
+Importing the server must stay cheap: the Gemini SDK is only loaded once a
+file actually needs rewriting.
+"""
+
+import os
+import subprocess
+import sys
+
+
+def test_server_import_does_not_load_the_model_sdk():
+    code = "import sys, server; print('google.generativeai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         check=True, capture_output=True, text=True).stdout
+    assert out.strip().splitlines()[-1] == "False"
+
+
+def test_gemini_client_is_created_on_first_use(monkeypatch):
+    from core.backends import GeminiBackend
+
+    created = []
+
+    class FakeGenai:
+        @staticmethod
+        def configure(api_key=None):
+            created.append("configure")
+
+        @staticmethod
+        def GenerativeModel(name):
+            created.append(name)
+            return object()
+
+    monkeypatch.setitem(sys.modules, "google.generativeai", FakeGenai)
+    import google
+    monkeypatch.setattr(google, "generativeai", FakeGenai, raising=False)
+
+    backend = GeminiBackend("gemini-test", api_key="key")
+    assert created == []
+    first = backend.model()
+    assert backend.model() is first
+    assert created == ["configure", "gemini-test"]
@@ -0,0 +1,93 @@
+"""
+Tests for workspace lifecycle management and pruning of mirrors and manifests.
+"""
+
+import os
+import time
+
+from core.manifest import prune_manifests
+from core.source_loader import prune_mirrors
+from core.workspaces import WorkspaceManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fill(manager, size):
+    path = manager.create()
+    with open(os.path.join(path, "data"), "wb") as f:
+        f.write(b"x" * size)
+    manager.release(path)
+    return path
+
+
+def test_idle_workspaces_expire_after_the_ttl(tmp_path):
+    clock = FakeClock()
+    manager = WorkspaceManager(str(tmp_path), ttl=60, quota=10 ** 9, clock=clock)
+    old = _fill(manager, 10)
+    clock.now += 30
+    busy = manager.create()
+    clock.now += 45
+
+    assert manager.collect() == [old]
+    assert not os.path.exists(old)
+    # In use, so kept whatever its age
+    clock.now += 1000
+    assert manager.collect() == []
+    assert os.path.isdir(busy)
+
+
+def test_least_recently_used_go_first_over_the_quota(tmp_path):
+    clock = FakeClock()
+    manager = WorkspaceManager(str(tmp_path), ttl=10 ** 6, quota=250, clock=clock)
+    first = _fill(manager, 100)
+    clock.now += 1
+    second = _fill(manager, 100)
+    clock.now += 1
+    manager.acquire(first)
+    manager.release(first)
+    clock.now += 1
+    _fill(manager, 100)
+
+    # `second` was used longest ago once `first` was touched again
+    assert manager.collect() == [second]
+    assert manager.usage()["bytes"] == 200
+    assert manager.usage()["workspaces"] == 2
+
+
+def test_workspaces_of_earlier_processes_are_adopted(tmp_path):
+    stale = time.time() - 7200
+    for name in ("az2gcp_left_over", "az2gcp_live"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "a.py").write_text("x = 1\n")
+    os.utime(tmp_path / "az2gcp_left_over" / "a.py", (stale, stale))
+    os.utime(tmp_path / "az2gcp_left_over", (stale, stale))
+    (tmp_path / "unrelated").mkdir()
+    manager = WorkspaceManager(str(tmp_path), ttl=60)
+
+    # The recently written one may be another process's running migration
+    assert manager.adopt(min_idle=3600) == 1
+    assert manager.get("az2gcp_left_over") == str(tmp_path / "az2gcp_left_over")
+    assert manager.get("az2gcp_live") is None
+    assert manager.usage()["bytes"] == 6
+    # Without a dedicated directory nothing is adopted
+    assert WorkspaceManager(None).adopt(min_idle=0) == 0
+
+
+def test_unused_mirrors_and_manifests_are_pruned(tmp_path):
+    for directory in ("mirrors/old.git", "mirrors/new.git", "manifests/old", "manifests/new"):
+        (tmp_path / directory).mkdir(parents=True)
+    (tmp_path / "manifests/new/manifest.json").write_text("{}")
+    stale = time.time() - 3600
+    os.utime(tmp_path / "mirrors/old.git", (stale, stale))
+    os.utime(tmp_path / "manifests/old", (stale, stale))
+
+    assert prune_mirrors(600, str(tmp_path / "mirrors")) == 1
+    assert prune_manifests(600, str(tmp_path / "manifests")) == 1
+    assert sorted(os.listdir(tmp_path / "mirrors")) == ["new.git"]
+    assert sorted(os.listdir(tmp_path / "manifests")) == ["new"]
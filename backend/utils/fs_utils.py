@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 TEXT_EXTENSIONS = {
     ".py", ".js", ".ts", ".java",
@@ -16,6 +17,38 @@ def iter_files(root):
         for f in files:
             yield os.path.join(base, f)
 
+def _list_dir(path):
+    """Files and walkable subdirectories of `path`, following os.walk's rules."""
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.path)
+                elif entry.name not in IGNORED_DIRS and not entry.is_symlink():
+                    dirs.append(entry.path)
+    except OSError:
+        pass
+    return files, dirs
+
+def iter_files_concurrent(root, workers=8):
+    """
+    iter_files(), listing directories on a thread pool. Paths are yielded
+    as soon as their directory has been listed, so the order is not stable.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk") as pool:
+        pending = {pool.submit(_list_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                files, dirs = fut.result()
+                pending.update(pool.submit(_list_dir, d) for d in dirs)
+                yield from files
+
 def is_text_file(path):
     _, ext = os.path.splitext(path)
     return ext.lower() in TEXT_EXTENSIONS
@@ -1,12 +1,130 @@
+import json
+import os
+import time
+from collections import Counter
+
+HEADER = "AZURE -> GCP MIGRATION REPORT\n" + "=" * 30
+
+# Per-file figures added up in the run summary
+SUMMED = ("size", "prompt_tokens", "response_tokens", "llm_seconds", "validate_seconds", "write_seconds")
+
+
+def render_text(entries):
+    """The text report for an iterable of (file, status) pairs."""
+    return "\n".join([HEADER, *(f"{f}: {s}" for f, s in entries)])
+
+
+def read_report(path):
+    """Yield the records of a JSON Lines report written by MigrationReport."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def render_report(path):
+    """The text report of a run, from its JSON Lines report."""
+    return render_text((r["file"], r["status"]) for r in read_report(path) if r["type"] == "file")
+
+
+def prune_reports(max_age, directory, now=None):
+    """
+    Delete JSON Lines reports under `directory` last written more than
+    `max_age` seconds ago. Returns the number removed.
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".jsonl")]
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
 class MigrationReport:
-    def __init__(self):
+    """
+    Results of one migration.
+
+    add() collects the (file, status) pairs of the text view. With a `path`,
+    record() also appends each finished file to a JSON Lines report as it
+    comes in: a "run" record with `run` (source, model, options...) first,
+    then one "file" record per file and, from close(), a "summary" record.
+    """
+
+    def __init__(self, path=None, **run):
         self.entries = []
+        self.path = path
+        self._started = time.perf_counter()
+        self._stages = Counter()
+        self._totals = dict.fromkeys(SUMMED, 0)
+        self._requests = 0.0
+        self._cache_hits = 0
+        self._durations = []
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "w", encoding="utf-8")
+            self._write({"type": "run", "started_at": time.time(), **run})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        # Readers may follow the report while the run is going
+        self._file.flush()
 
     def add(self, file, status):
         self.entries.append((file, status))
 
+    def record(self, event):
+        """Account for a pipeline "file" event (see core.pipeline.file_stats)."""
+        self._stages[event["stage"]] += 1
+        for name in SUMMED:
+            self._totals[name] += event.get(name) or 0
+        # Files sent together share one request
+        self._requests += event.get("requests", 0) / (event.get("batch") or 1)
+        self._cache_hits += bool(event.get("cache_hit"))
+        self._durations.append(event.get("duration", 0.0))
+        if self._file is not None:
+            self._write(event)
+
+    def summary(self, **extra):
+        durations = sorted(self._durations)
+        totals = {k: round(v, 4) if isinstance(v, float) else v for k, v in self._totals.items()}
+        return {
+            "type": "summary",
+            "files": len(durations),
+            "stages": dict(self._stages),
+            "requests": round(self._requests),
+            "cache_hits": self._cache_hits,
+            **totals,
+            "duration_p50": _percentile(durations, 0.5),
+            "duration_p95": _percentile(durations, 0.95),
+            "duration_max": durations[-1] if durations else None,
+            "seconds": round(time.perf_counter() - self._started, 3),
+            **extra,
+        }
+
+    def close(self, **extra):
+        """Write the run summary (with `extra`) and close the report; returns the summary."""
+        summary = self.summary(**extra)
+        if self._file is not None:
+            self._write(summary)
+            self._file.close()
+            self._file = None
+        return summary
+
     def render(self):
-        lines = ["AZURE -> GCP MIGRATION REPORT", "=" * 30]
-        for f, s in self.entries:
-            lines.append(f"{f}: {s}")
-        return "\n".join(lines)
+        return render_text(self.entries)